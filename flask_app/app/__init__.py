@@ -1,4 +1,5 @@
 import os
+import time
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
@@ -10,10 +11,20 @@ db = SQLAlchemy()
 login_manager = LoginManager()
 
 
+def _env_flag(name, default):
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
 def create_app():
+    started = time.perf_counter()
     load_dotenv()
     app = Flask(__name__, template_folder="templates", static_folder="static")
 
+    # Apply migrations and seed on boot (handy for `python run.py`). Production
+    # workers set AUTO_INIT_DB=0 and run `flask db upgrade` / `flask db seed`
+    # once per deploy, so booting issues no DDL or inspection queries.
+    app.config["AUTO_INIT_DB"] = _env_flag("AUTO_INIT_DB", "1")
+
     # Database configuration
     database_url = os.getenv(
         "DATABASE_URL",
@@ -27,42 +38,55 @@ def create_app():
     login_manager.init_app(app)
     login_manager.login_view = 'api.login'
     
+    from .services import auth, response_capture, throttle
+    auth.init_app(app)
+    response_capture.init_app(app)
+    throttle.init_app(app)
+
     @login_manager.user_loader
     def load_user(user_id):
-        from .models import User
-        return User.query.get(int(user_id))
+        return auth.load_user_cached(int(user_id))
+
+    from . import cache, compression, metrics, profiling, tracing
+    metrics.init_app(app)
+    profiling.init_app(app)
+    tracing.init_app(app)
+    cache.init_app(app)
+    compression.init_app(app)
 
     # Register blueprints/routes
     from .routes import api_bp
     app.register_blueprint(api_bp)
 
-    # Create tables and seed demo data on first run
-    with app.app_context():
-        from .models import (
-            RequestModel,
-            ActionModel,
-            Environment,
-            EnvironmentVariable,
-            Snippet,
-            Scenario,
-            ScenarioStep,
-            User,
-            DatabaseConnection,
-            TestCase,
-            TestSuite,
-            TestSuiteCase,
-            TestCaseShare,
-            TestSuiteShare,
-            SeleniumAction,
-            SQLQuery,
-        )
-
-        db.create_all()
-        # Seed only if empty
-        env_count = db.session.execute(text("SELECT COUNT(*) FROM environment")).scalar()
-        if env_count == 0:
-            from .seed import seed_demo_data
-
-            seed_demo_data()
+    from .cli import db_cli, history_cli, loadtest_cli
+    app.cli.add_command(db_cli)
+    app.cli.add_command(history_cli)
+    app.cli.add_command(loadtest_cli)
+
+    if app.config["AUTO_INIT_DB"]:
+        with app.app_context():
+            init_database()
 
+    app.config["STARTUP_MS"] = round((time.perf_counter() - started) * 1000, 1)
+    app.logger.info(
+        "Application started in %.1f ms (AUTO_INIT_DB=%s)",
+        app.config["STARTUP_MS"],
+        app.config["AUTO_INIT_DB"],
+    )
     return app
+
+
+def init_database():
+    """Apply schema migrations and seed demo data into an empty database"""
+    from . import migrations
+
+    migrations.upgrade(db.engine)
+    from .services import load_test
+
+    load_test.fail_orphaned_runs()
+    # Seed only if empty
+    env_count = db.session.execute(text("SELECT COUNT(*) FROM environment")).scalar()
+    if env_count == 0:
+        from .seed import seed_demo_data
+
+        seed_demo_data()
@@ -0,0 +1,214 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from flask import current_app, request
+from flask_login import current_user
+from sqlalchemy import bindparam, event, text
+from . import db, metrics
+
+# Table -> collection whose version changes when a row of that table does.
+# Child tables bump their parent collection (a new step changes the scenario list).
+TABLE_COLLECTIONS = {
+    'request': 'request',
+    'action': 'action',
+    'environment': 'environment',
+    'environment_variable': 'environment',
+    'scenario': 'scenario',
+    'scenario_step': 'scenario',
+    'snippet': 'snippet',
+    'user': 'user',
+    'database_connection': 'database_connection',
+    'selenium_action': 'selenium_action',
+    'test_case': 'test_case',
+    'test_case_share': 'test_case',
+    'test_suite': 'test_suite',
+    'test_suite_case': 'test_suite',
+    'test_suite_share': 'test_suite',
+}
+
+BUMP_SQL = text(
+    "INSERT INTO collection_version (name, version) VALUES (:name, 1) "
+    "ON CONFLICT (name) DO UPDATE SET version = collection_version.version + 1"
+)
+
+
+class LRUCache:
+    """Thread-safe bounded mapping that evicts the least recently used entry"""
+
+    def __init__(self, maxsize: int = 256, name: Optional[str] = None):
+        self.maxsize = maxsize
+        self.name = name  # reported in autoflow_cache_requests_total when set
+        self._data: 'OrderedDict[Any, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Any:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+        if self.name:
+            metrics.cache_lookup(self.name, value is not None)
+        return value
+
+    def set(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class TTLCache:
+    """Thread-safe mapping whose entries expire after ``ttl`` seconds"""
+
+    MISSING = object()
+
+    def __init__(self, ttl: float, maxsize: int = 10000, name: Optional[str] = None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.name = name
+        self._data: 'OrderedDict[Any, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                value = self.MISSING
+            elif entry[0] < time.monotonic():
+                del self._data[key]
+                value = self.MISSING
+            else:
+                value = entry[1]
+        if self.name:
+            metrics.cache_lookup(self.name, value is not self.MISSING)
+        return value
+
+    def set(self, key: Any, value: Any) -> None:
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Any) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate(self, predicate: Callable[[Any], bool]) -> None:
+        """Drop every entry whose key matches the predicate"""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+# Serialized (body, headers) of conditional responses keyed by ETag
+response_cache = LRUCache(name='responses')
+
+
+def init_app(app) -> None:
+    response_cache.maxsize = app.config.setdefault('RESPONSE_CACHE_SIZE', 256)
+
+
+def _changed_collections(session) -> set:
+    collections = set()
+    for obj in list(session.new) + list(session.deleted) + list(session.dirty):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        table = getattr(obj, '__tablename__', None)
+        if table in TABLE_COLLECTIONS:
+            collections.add(TABLE_COLLECTIONS[table])
+    return collections
+
+
+@event.listens_for(db.session, 'before_flush')
+def _bump_versions(session, flush_context, instances):
+    # Bumped in the same transaction as the change, once per collection
+    bumped = session.info.setdefault('bumped_collections', set())
+    for name in sorted(_changed_collections(session) - bumped):
+        session.connection().execute(BUMP_SQL, {'name': name})
+        bumped.add(name)
+
+
+@event.listens_for(db.session, 'after_commit')
+@event.listens_for(db.session, 'after_rollback')
+def _reset_bumped(session):
+    session.info.pop('bumped_collections', None)
+
+
+def collection_versions(names: Iterable[str]) -> Tuple[Tuple[str, int], ...]:
+    """Current version of each collection (0 if never written)"""
+    names = sorted(set(names))
+    rows = db.session.execute(
+        text('SELECT name, version FROM collection_version WHERE name IN :names').bindparams(
+            bindparam('names', expanding=True)
+        ),
+        {'names': names},
+    ).all()
+    found = dict(rows)
+    return tuple((name, found.get(name, 0)) for name in names)
+
+
+def _visibility_scope(per_user: bool) -> str:
+    if not per_user:
+        return 'all'
+    return f'user:{current_user.id}' if current_user.is_authenticated else 'anonymous'
+
+
+def conditional(*collections: str, per_user: bool = False):
+    """Serve a read-mostly JSON endpoint with a strong ETag and an LRU body cache.
+
+    The ETag is derived from the collections' version counters, the caller's
+    visibility scope and the query string, so a repeat load is a version
+    lookup plus a dict hit (or a 304) instead of a full query and jsonify.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            versions = collection_versions(collections)
+            key = '|'.join([
+                request.path,
+                request.query_string.decode('latin-1'),
+                _visibility_scope(per_user),
+                ','.join(f'{name}={version}' for name, version in versions),
+            ])
+            etag = hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+            # compression.compress_response tags gzipped bodies with a suffixed ETag
+            gzip_etag = etag + '-gzip'
+            if request.if_none_match.contains(etag) or request.if_none_match.contains(gzip_etag):
+                response = current_app.response_class(status=304)
+                if request.if_none_match.contains(gzip_etag):
+                    etag = gzip_etag
+            else:
+                cached = response_cache.get(etag)
+                if cached is None:
+                    response = current_app.make_response(f(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    extra = {h: response.headers[h] for h in ('X-Next-Cursor',) if h in response.headers}
+                    response_cache.set(etag, (response.get_data(), extra))
+                else:
+                    body, extra = cached
+                    response = current_app.response_class(body, mimetype='application/json')
+                    response.headers.update(extra)
+
+            response.set_etag(etag)
+            # Browsers keep the body but revalidate with If-None-Match every time
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
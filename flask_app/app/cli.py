@@ -0,0 +1,185 @@
+import click
+from flask.cli import AppGroup
+from . import db
+from . import migrations
+
+db_cli = AppGroup('db', help='Database schema and data commands.')
+
+
+@db_cli.command('upgrade')
+def upgrade_command():
+    """Apply pending schema migrations."""
+    applied = migrations.upgrade(db.engine)
+    if applied:
+        click.echo(f"Applied migrations: {', '.join(f'{v:04d}' for v in applied)}")
+    else:
+        click.echo('Database is up to date.')
+
+
+@db_cli.command('status')
+def status_command():
+    """Show applied and pending migrations."""
+    for m in migrations.status(db.engine):
+        state = m['applied_at'].isoformat(sep=' ', timespec='seconds') if m['applied_at'] else 'pending'
+        click.echo(f"{m['version']:04d}_{m['name']:<40} {state}")
+
+
+@db_cli.command('seed')
+def seed_command():
+    """Load demo data if the database is empty."""
+    from sqlalchemy import text
+    from .seed import seed_demo_data
+
+    if db.session.execute(text('SELECT COUNT(*) FROM environment')).scalar():
+        click.echo('Database already has data; skipping seed.')
+        return
+    seed_demo_data()
+    click.echo('Demo data loaded.')
+
+
+@db_cli.command('generate')
+@click.option('--scale', default=1.0, show_default=True,
+              help='Multiplies every row count below (defaults make ~100k rows; --scale 10 about a million).')
+@click.option('--users', type=int, help='Users owning the rows [default: 100].')
+@click.option('--requests', type=int, help='Stored requests [default: 20000].')
+@click.option('--snippets', type=int, help='Snippets [default: 5000].')
+@click.option('--scenarios', type=int, help='Scenarios [default: 2000].')
+@click.option('--steps', type=int, help='Median request steps per scenario [default: 10].')
+@click.option('--test-cases', type=int, help='Test cases [default: 20000].')
+@click.option('--suites', type=int, help='Test suites [default: 1000].')
+@click.option('--cases-per-suite', type=int, help='Median test cases per suite [default: 20].')
+@click.option('--shares', type=int, help='Test case and suite shares, 3:1 [default: 10000].')
+@click.option('--public-ratio', type=float, help='Share of rows marked public [default: 0.2].')
+@click.option('--seed', type=int, help='Random seed, to regenerate the same dataset.')
+@click.option('--batch-size', default=10000, show_default=True, help='Rows per COPY / INSERT batch.')
+@click.option('--copy/--no-copy', 'use_copy', default=None, help='Force COPY on or off [default: on for PostgreSQL].')
+@click.option('--prefix', default='synth', show_default=True, help='Generated usernames are <prefix><id>.')
+@click.option('--password', default='synthetic', show_default=True, help='Password of every generated user.')
+def generate_command(scale, seed, batch_size, use_copy, prefix, password, **counts):
+    """Bulk-load synthetic users, requests, scenarios, test cases and shares."""
+    import time
+    from dataclasses import replace
+    from .datagen import Volumes, generate
+
+    volumes = Volumes().scaled(scale)
+    volumes = replace(volumes, **{name: value for name, value in counts.items() if value is not None})
+    started = time.perf_counter()
+    try:
+        counts = generate(volumes, seed=seed, batch_size=batch_size, use_copy=use_copy, prefix=prefix,
+                          password=password, progress=lambda table, rows, seconds: click.echo(
+                              f'{table:<20} {rows:>10} rows in {seconds:6.2f}s'))
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    click.echo(f'Generated {total} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s).')
+
+
+@db_cli.command('init')
+def init_command():
+    """Apply migrations, then seed an empty database."""
+    from . import init_database
+
+    init_database()
+    click.echo('Database initialized.')
+
+
+loadtest_cli = AppGroup('loadtest', help='Load-testing and local target helpers.')
+
+
+@loadtest_cli.command('standin')
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', default=8089, show_default=True)
+@click.option('--delay-ms', default=0.0, show_default=True, help='Latency added to every response.')
+@click.option('--status', default=200, show_default=True, help='Default response status.')
+def standin_command(host, port, delay_ms, status):
+    """Serve a local stand-in target for load tests until interrupted."""
+    import time
+    from .services.standin import StandInServer
+
+    with StandInServer(host, port, delay_ms=delay_ms, status=status) as server:
+        click.echo(f'Stand-in server listening on {server.url} (Ctrl+C to stop)')
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+@loadtest_cli.command('replay')
+@click.argument('recording_id', type=int)
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', default=8090, show_default=True)
+@click.option('--simulate-latency/--no-simulate-latency', default=False, help='Delay responses by their recorded time.')
+def replay_command(recording_id, host, port, simulate_latency):
+    """Serve a recording's responses on a loopback port until interrupted."""
+    import time
+    from .models import Recording
+    from .services.recordings import Tape
+    from .services.standin import ReplayServer
+
+    recording = db.session.get(Recording, recording_id)
+    if recording is None:
+        raise click.ClickException(f'Recording {recording_id} not found')
+    tape = Tape.load(recording, simulate_latency=simulate_latency)
+    with ReplayServer(tape, host, port) as server:
+        click.echo(f'Replaying recording {recording_id} on {server.url} (Ctrl+C to stop)')
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        click.echo(f"Served {tape.hits} recorded responses, {tape.misses} misses")
+
+
+history_cli = AppGroup('history', help='Request run history maintenance.')
+
+
+@history_cli.command('train-dictionary')
+@click.option('--samples', default=1000, show_default=True, help='Most recent runs to sample.')
+@click.option('--recompress/--no-recompress', default=False, help='Rewrite stored artifacts with the new dictionary.')
+def train_dictionary_command(samples, recompress):
+    """Train a compression dictionary on recent response artifacts."""
+    from .models import RequestRun
+    from .services import artifacts
+
+    rows = RequestRun.query.filter(RequestRun.artifact.isnot(None)).order_by(RequestRun.id.desc()).limit(samples).all()
+    try:
+        dictionary = artifacts.train([artifacts.decompress(r.artifact) for r in rows])
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    db.session.commit()
+    click.echo(f'Trained {dictionary.algorithm} dictionary {dictionary.id} '
+               f'({len(dictionary.data)} bytes) from {dictionary.sample_count} samples.')
+    if recompress:
+        # expunge_all() below detaches the dictionary row too
+        dict_id = dictionary.id
+        rewritten, last_id = 0, 0
+        while True:
+            batch = RequestRun.query.filter(RequestRun.artifact.isnot(None), RequestRun.id > last_id).order_by(
+                RequestRun.id
+            ).limit(500).all()
+            if not batch:
+                break
+            for run in batch:
+                run.artifact = artifacts.compress(artifacts.decompress(run.artifact), dict_id)
+            last_id = batch[-1].id
+            rewritten += len(batch)
+            db.session.commit()
+            db.session.expunge_all()
+        click.echo(f'Recompressed {rewritten} artifacts.')
+
+
+@history_cli.command('stats')
+def history_stats_command():
+    """Show how much run-history artifacts shrink in storage."""
+    from sqlalchemy import func
+    from .models import RequestRun
+
+    count, raw, stored = db.session.query(
+        func.count(RequestRun.id),
+        func.coalesce(func.sum(RequestRun.artifact_size), 0),
+        func.coalesce(func.sum(func.length(RequestRun.artifact)), 0),
+    ).filter(RequestRun.artifact.isnot(None)).one()
+    ratio = f'{raw / stored:.1f}x' if stored else 'n/a'
+    click.echo(f'{count} artifacts: {raw} bytes raw, {stored} bytes stored ({ratio})')
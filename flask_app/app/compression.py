@@ -0,0 +1,35 @@
+import gzip
+from flask import request
+
+# JSON responses at least this large are gzipped for clients that accept it
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_LEVEL = 6
+ETAG_SUFFIX = '-gzip'
+
+
+def init_app(app) -> None:
+    global COMPRESS_MIN_BYTES, COMPRESS_LEVEL
+    COMPRESS_MIN_BYTES = app.config.setdefault('COMPRESS_MIN_BYTES', COMPRESS_MIN_BYTES)
+    COMPRESS_LEVEL = app.config.setdefault('COMPRESS_LEVEL', COMPRESS_LEVEL)
+    app.after_request(compress_response)
+
+
+def compress_response(response):
+    """gzip JSON API responses (lists, run history) on the way out"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    if 'gzip' not in request.accept_encodings:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    # mtime=0 keeps the bytes identical for identical data, as the strong ETag promises
+    response.set_data(gzip.compress(data, COMPRESS_LEVEL, mtime=0))
+    response.headers['Content-Encoding'] = 'gzip'
+    # The gzipped representation needs its own strong validator (see cache.conditional)
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag + ETAG_SUFFIX)
+    return response
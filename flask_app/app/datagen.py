@@ -0,0 +1,429 @@
+"""Synthetic data at production-like volumes, for benchmarking and tuning.
+
+``generate`` creates users, requests, snippets, scenarios with their steps,
+test cases, suites and shares. Sizes and ownership follow skewed
+distributions (a few users own most rows; most bodies are small with a
+long tail), so list, permission and run paths see realistic data. Rows are
+written with COPY on PostgreSQL and batched INSERTs elsewhere; ids are
+assigned here, so run it against a database nobody else is writing to.
+"""
+import io
+import json
+import math
+import random
+import re
+import time
+from dataclasses import dataclass, fields, replace
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from sqlalchemy import func, select, text
+from werkzeug.security import generate_password_hash
+from . import db
+from .cache import BUMP_SQL, TABLE_COLLECTIONS
+from .models import (
+    RequestModel, Scenario, ScenarioStep, Snippet, TestCase, TestCaseShare, TestSuite, TestSuiteCase,
+    TestSuiteShare, User,
+)
+from .services.resilience import RetryPolicy
+from .services.single_flight import CoalesceRule
+
+BATCH_SIZE = 10000
+
+WORDS = (
+    'account order invoice customer payment session token profile address product cart item report '
+    'status search filter export import user group role policy event audit metric record batch job'
+).split()
+RESOURCES = ('users', 'orders', 'invoices', 'customers', 'payments', 'products', 'carts', 'reports', 'events')
+METHODS = (('GET', 55), ('POST', 25), ('PUT', 10), ('DELETE', 5), ('PATCH', 5))
+PAYLOAD_TYPES = (('json', 85), ('xml', 5), ('form', 5), ('text', 5))
+SNIPPET_KINDS = (('api', 'javascript', 50), ('selenium', 'java', 20), ('database', 'sql', 20), ('utility', 'python', 10))
+TEST_TYPES = (('api', 70), ('selenium', 15), ('database', 15))
+ROLES = (('user', 90), ('viewer', 9), ('admin', 1))
+PERMISSIONS = (('read', 60), ('execute', 25), ('write', 15))
+# Options of the ~10% of requests that set any; checked by the same policy
+# parsers as /api/requests so generated requests can be sent
+TUNED_OPTIONS = {'read_timeout': 30, 'retry': {'max_attempts': 3}}
+
+
+@dataclass
+class Volumes:
+    """How many rows to create. Steps and suite cases are medians per
+    scenario / suite; shares are split 3:1 between test cases and suites."""
+    users: int = 100
+    requests: int = 20000
+    snippets: int = 5000
+    scenarios: int = 2000
+    steps: int = 10
+    test_cases: int = 20000
+    suites: int = 1000
+    cases_per_suite: int = 20
+    shares: int = 10000
+    public_ratio: float = 0.2
+
+    def scaled(self, factor: float) -> 'Volumes':
+        """Every row count times ``factor``; per-parent medians and ratios stay"""
+        fixed = ('steps', 'cases_per_suite', 'public_ratio')
+        return replace(self, **{
+            f.name: max(1, round(getattr(self, f.name) * factor))
+            for f in fields(self) if f.name not in fixed
+        })
+
+
+def _weighted(rng: random.Random, options: Sequence[Tuple], k: int) -> List[Tuple]:
+    """k picks from (value..., weight) tuples, as the tuples without their weight"""
+    values = [o[:-1] for o in options]
+    return rng.choices(values, weights=[o[-1] for o in options], k=k)
+
+
+def _lognormal(rng: random.Random, median: float, sigma: float, low: int, high: int) -> int:
+    return min(high, max(low, int(rng.lognormvariate(math.log(median), sigma))))
+
+
+class _Text:
+    """Filler text sliced out of one long buffer (no quotes or backslashes,
+    so it can be dropped into JSON and XML as is)"""
+
+    def __init__(self, rng: random.Random, size: int = 1 << 18):
+        words, length = [], 0
+        while length < size:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        self.buffer = ' '.join(words)
+        self.rng = rng
+
+    def __call__(self, n: int) -> str:
+        n = min(n, len(self.buffer))
+        start = self.rng.randrange(len(self.buffer) - n + 1)
+        return self.buffer[start:start + n]
+
+
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+_COPY_SPECIAL = re.compile(r'[\\\t\n\r]')
+
+
+def _copy_value(value: Any) -> str:
+    """One field in COPY's text format"""
+    if value is None:
+        return '\\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat(' ')
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, separators=(',', ':'))
+    # Most fields need no escaping, and the search is much cheaper than translate
+    return value.translate(_COPY_ESCAPES) if _COPY_SPECIAL.search(value) else value
+
+
+class BulkWriter:
+    """Writes generated rows through one connection: COPY FROM STDIN on
+    PostgreSQL (psycopg2), multi-row INSERT batches on other databases."""
+
+    def __init__(self, conn, batch_size: int = BATCH_SIZE, use_copy: Optional[bool] = None):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.use_copy = conn.dialect.name == 'postgresql' if use_copy is None else use_copy
+        self.counts: Dict[str, int] = {}
+
+    def next_id(self, table) -> int:
+        """First free id; rows are written with explicit ids so children can reference them"""
+        return self.conn.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar() + 1
+
+    def write(self, table, columns: Sequence[str], rows: Iterable[Sequence[Any]]) -> int:
+        write = self._copy if self.use_copy else self._insert
+        batch: List[Sequence[Any]] = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                write(table, columns, batch)
+                batch = []
+        if batch:
+            write(table, columns, batch)
+        return self.counts.get(table.name, 0)
+
+    def _copy(self, table, columns, batch) -> None:
+        quote = self.conn.dialect.identifier_preparer.quote
+        buffer = io.StringIO()
+        for row in batch:
+            buffer.write('\t'.join(map(_copy_value, row)))
+            buffer.write('\n')
+        buffer.seek(0)
+        sql = f"COPY {quote(table.name)} ({', '.join(quote(c) for c in columns)}) FROM STDIN"
+        with self.conn.connection.driver_connection.cursor() as cursor:
+            cursor.copy_expert(sql, buffer)
+        self._count(table, len(batch))
+
+    def _insert(self, table, columns, batch) -> None:
+        # executemany; SQLAlchemy sends it as multi-row INSERT ... VALUES pages where the driver allows
+        self.conn.execute(table.insert(), [dict(zip(columns, row)) for row in batch])
+        self._count(table, len(batch))
+
+    def _count(self, table, n: int) -> None:
+        self.counts[table.name] = self.counts.get(table.name, 0) + n
+
+    def finish(self) -> None:
+        """Move sequences past the explicit ids and bump the list ETag versions"""
+        quote = self.conn.dialect.identifier_preparer.quote
+        if self.conn.dialect.name == 'postgresql':
+            for name in self.counts:
+                self.conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence(:table, 'id'), MAX(id)) FROM {quote(name)}"
+                ), {'table': quote(name)})
+        for collection in sorted({TABLE_COLLECTIONS[n] for n in self.counts if n in TABLE_COLLECTIONS}):
+            self.conn.execute(BUMP_SQL, {'name': collection})
+
+
+class Generator:
+    """Builds the rows for one ``generate`` run; every random choice comes
+    from ``rng`` so a seed reproduces the dataset."""
+
+    def __init__(self, writer: BulkWriter, volumes: Volumes, rng: random.Random,
+                 prefix: str = 'synth', password: str = 'synthetic',
+                 progress: Callable[[str, int, float], None] = lambda table, rows, seconds: None):
+        self.writer = writer
+        self.progress = progress
+        self.volumes = volumes
+        self.rng = rng
+        self.prefix = prefix
+        self.password_hash = generate_password_hash(password)  # hashed once, shared by every user
+        self.text = _Text(rng)
+        self.now = datetime.utcnow()
+        self.user_ids: List[int] = []
+        self.owner_weights: List[float] = []
+
+    def _timestamps(self) -> Tuple[datetime, datetime]:
+        """Created within the last year; a third were edited since"""
+        created = self.now - timedelta(days=365 * self.rng.random())
+        if self.rng.random() < 0.33:
+            return created, created + (self.now - created) * self.rng.random()
+        return created, created
+
+    def _owners(self, k: int) -> List[int]:
+        # Zipf-like: the first users own most rows, like a few heavy teams
+        return self.rng.choices(self.user_ids, cum_weights=self.owner_weights, k=k)
+
+    def _public(self) -> bool:
+        return self.rng.random() < self.volumes.public_ratio
+
+    def _write(self, model, columns: Sequence[str], make_rows: Callable[[int], Iterator[Sequence[Any]]]) -> range:
+        table = model.__table__
+        started = time.perf_counter()
+        first = self.writer.next_id(table)
+        count = self.writer.write(table, columns, make_rows(first))
+        self.progress(table.name, count, time.perf_counter() - started)
+        return range(first, first + count)
+
+    def users(self) -> range:
+        n = self.volumes.users
+
+        def rows(first):
+            for i, (role,) in enumerate(_weighted(self.rng, ROLES, n)):
+                uid = first + i
+                created, updated = self._timestamps()
+                name = f'{self.prefix}{uid}'
+                yield uid, name, f'{name}@example.test', self.password_hash, role, True, created, updated
+
+        ids = self._write(User, ('id', 'username', 'email', 'password_hash', 'role', 'is_active',
+                                 'created_at', 'updated_at'), rows)
+        self.user_ids = list(ids)
+        total = 0.0
+        self.owner_weights = []
+        for rank in range(len(self.user_ids)):
+            total += 1 / (rank + 1) ** 1.1
+            self.owner_weights.append(total)
+        return ids
+
+    def _request_body(self, i: int, method: str, payload_type: str) -> str:
+        if method in ('GET', 'DELETE'):
+            return ''
+        filler = self.text(_lognormal(self.rng, 200, 1.2, 8, 64000))
+        if payload_type == 'xml':
+            return f'<?xml version="1.0"?><item id="{i}"><owner>{{{{user_name}}}}</owner><notes>{filler}</notes></item>'
+        if payload_type == 'form':
+            return f'id={i}&owner={{{{user_name}}}}&notes={filler.replace(" ", "+")}'
+        if payload_type == 'text':
+            return filler
+        return json.dumps({'id': i, 'owner': '{{user_name}}', 'tags': filler.split()[:5], 'notes': filler})
+
+    def requests(self) -> range:
+        n = self.volumes.requests
+        rng = self.rng
+        RetryPolicy.from_options(TUNED_OPTIONS)
+        CoalesceRule.from_options(TUNED_OPTIONS)
+
+        def rows(first):
+            kinds = zip(_weighted(rng, METHODS, n), _weighted(rng, PAYLOAD_TYPES, n), self._owners(n))
+            for i, ((method,), (payload_type,), owner) in enumerate(kinds):
+                rid = first + i
+                resource = rng.choice(RESOURCES)
+                headers = {'Accept': 'application/json'}
+                for h in range(rng.randrange(6)):
+                    headers[f'X-Trace-{h}'] = '{{trace_id}}' if h == 0 else self.text(rng.randrange(8, 40))
+                if method not in ('GET', 'DELETE'):
+                    headers['Content-Type'] = {'xml': 'application/xml', 'form': 'application/x-www-form-urlencoded',
+                                               'text': 'text/plain'}.get(payload_type, 'application/json')
+                pre_script = 'pm.environment.set("trace_id", Date.now().toString());' if rng.random() < 0.15 else ''
+                post_script = ('var data = pm.response.json; if (data && data.id) '
+                               '{ pm.environment.set("last_id", data.id); }') if rng.random() < 0.3 else ''
+                options = TUNED_OPTIONS if rng.random() < 0.1 else {}
+                created, updated = self._timestamps()
+                yield (rid, f'{method.title()} {resource} {rid}', method,
+                       f'{{{{base_url}}}}/api/v1/{resource}/{rng.randrange(1, 100000)}?page={rng.randrange(1, 50)}',
+                       headers, self._request_body(rid, method, payload_type), payload_type, pre_script, post_script,
+                       options, owner, created, updated)
+
+        return self._write(RequestModel, ('id', 'name', 'method', 'url', 'headers', 'body', 'payload_type',
+                                          'pre_script', 'post_script', 'options', 'created_by_id',
+                                          'created_at', 'updated_at'), rows)
+
+    def snippets(self) -> range:
+        n = self.volumes.snippets
+        rng = self.rng
+
+        def rows(first):
+            for i, ((category, language), owner) in enumerate(zip(_weighted(rng, SNIPPET_KINDS, n), self._owners(n))):
+                sid = first + i
+                created, updated = self._timestamps()
+                code = '\n'.join(self.text(rng.randrange(20, 100)) for _ in range(_lognormal(rng, 12, 0.9, 1, 400)))
+                tags = rng.sample(WORDS, rng.randrange(6))
+                yield (sid, f'{category.title()} snippet {sid}', self.text(rng.randrange(10, 120)), category, language,
+                       code, tags, self._public(), owner, created, updated)
+
+        return self._write(Snippet, ('id', 'name', 'description', 'category', 'language', 'code', 'tags',
+                                     'is_public', 'created_by_id', 'created_at', 'updated_at'), rows)
+
+    def scenarios(self, request_ids: range) -> Tuple[range, range]:
+        n = self.volumes.scenarios
+        rng = self.rng
+
+        def rows(first):
+            for i, owner in enumerate(self._owners(n)):
+                sid = first + i
+                created, updated = self._timestamps()
+                yield sid, f'Flow {sid}', self.text(rng.randrange(10, 120)), self._public(), owner, created, updated
+
+        scenario_ids = self._write(Scenario, ('id', 'name', 'description', 'is_public', 'created_by_id',
+                                              'created_at', 'updated_at'), rows)
+
+        def step_rows(first):
+            step_id = first
+            for scenario_id in scenario_ids:
+                order = 0
+                for s in range(_lognormal(rng, self.volumes.steps, 0.5, 1, self.volumes.steps * 5)):
+                    # One step in ten runs in parallel with the one before it
+                    if s == 0 or rng.random() >= 0.1:
+                        order += 1
+                    created = self.now - timedelta(days=365 * rng.random())
+                    yield step_id, scenario_id, order, 'request', rng.choice(request_ids), created, created
+                    step_id += 1
+
+        step_ids = self._write(ScenarioStep, ('id', 'scenario_id', 'order', 'step_type', 'ref_id',
+                                              'created_at', 'updated_at'), step_rows)
+        return scenario_ids, step_ids
+
+    def _test_case(self, test_type: str) -> Tuple[Dict[str, Any], str]:
+        rng = self.rng
+        if test_type == 'api':
+            test_data = {'endpoint': f'/api/v1/{rng.choice(RESOURCES)}', 'method': 'GET', 'expected_status': 200}
+            checks = ['status == 200', 'header Content-Type contains json', '$.id exists', 'time_ms < 2000']
+            return test_data, '\n'.join(checks[:rng.randrange(1, len(checks) + 1)])
+        if test_type == 'database':
+            return {'connection_id': 1, 'query': f'SELECT * FROM {rng.choice(RESOURCES)}',
+                    'expected_min_count': 1}, 'row_count >= 1'
+        return {'url': 'https://example.com/login', 'success_indicator': '.dashboard'}, 'User reaches the dashboard'
+
+    def test_cases(self) -> range:
+        n = self.volumes.test_cases
+        rng = self.rng
+
+        def rows(first):
+            for i, ((test_type,), owner) in enumerate(zip(_weighted(rng, TEST_TYPES, n), self._owners(n))):
+                cid = first + i
+                created, updated = self._timestamps()
+                test_data, expected = self._test_case(test_type)
+                yield (cid, f'{test_type.title()} case {cid}', self.text(rng.randrange(10, 200)), test_type,
+                       test_data, expected, self._public(), owner, created, updated)
+
+        return self._write(TestCase, ('id', 'name', 'description', 'test_type', 'test_data', 'expected_result',
+                                      'is_public', 'created_by_id', 'created_at', 'updated_at'), rows)
+
+    def suites(self, case_ids: range) -> Tuple[range, range]:
+        n = self.volumes.suites
+        rng = self.rng
+
+        def rows(first):
+            for i, owner in enumerate(self._owners(n)):
+                sid = first + i
+                created, updated = self._timestamps()
+                yield sid, f'Suite {sid}', self.text(rng.randrange(10, 200)), self._public(), owner, created, updated
+
+        suite_ids = self._write(TestSuite, ('id', 'name', 'description', 'is_public', 'created_by_id',
+                                            'created_at', 'updated_at'), rows)
+
+        def member_rows(first):
+            member_id = first
+            for suite_id in suite_ids:
+                size = _lognormal(rng, self.volumes.cases_per_suite, 0.7, 1, len(case_ids))
+                created = self.now - timedelta(days=365 * rng.random())
+                for order, case_id in enumerate(rng.sample(case_ids, size), 1):
+                    yield member_id, suite_id, case_id, order, created, created
+                    member_id += 1
+
+        member_ids = self._write(TestSuiteCase, ('id', 'test_suite_id', 'test_case_id', 'order',
+                                                 'created_at', 'updated_at'), member_rows)
+        return suite_ids, member_ids
+
+    def shares(self, model, fk: str, item_ids: range, n: int) -> range:
+        """Unique (item, user) shares with mixed permissions"""
+        rng = self.rng
+        n = min(n, len(item_ids) * len(self.user_ids) // 2)
+
+        def rows(first):
+            seen = set()
+            for i, (permission,) in enumerate(_weighted(rng, PERMISSIONS, n)):
+                pair = (rng.choice(item_ids), rng.choice(self.user_ids))
+                while pair in seen:
+                    pair = (rng.choice(item_ids), rng.choice(self.user_ids))
+                seen.add(pair)
+                created = self.now - timedelta(days=365 * rng.random())
+                yield first + i, pair[0], pair[1], permission, created, created
+
+        return self._write(model, ('id', fk, 'shared_with_id', 'permission', 'created_at', 'updated_at'), rows)
+
+
+def generate(volumes: Volumes, seed: Optional[int] = None, batch_size: int = BATCH_SIZE,
+             use_copy: Optional[bool] = None, prefix: str = 'synth', password: str = 'synthetic',
+             progress: Callable[[str, int, float], None] = lambda table, rows, seconds: None) -> Dict[str, int]:
+    """Create a synthetic dataset in one transaction and return rows per table.
+
+    Generated users are named ``<prefix><id>`` and share ``password``.
+    """
+    if volumes.users < 1:
+        raise ValueError('At least one user is needed to own the generated rows')
+    if volumes.scenarios and not volumes.requests:
+        raise ValueError('Scenario steps need generated requests')
+    if volumes.suites and not volumes.test_cases:
+        raise ValueError('Suites need generated test cases')
+
+    with db.engine.begin() as conn:
+        writer = BulkWriter(conn, batch_size, use_copy)
+        gen = Generator(writer, volumes, random.Random(seed), prefix, password, progress)
+        gen.users()
+        request_ids = gen.requests() if volumes.requests else range(0)
+        if volumes.snippets:
+            gen.snippets()
+        if volumes.scenarios:
+            gen.scenarios(request_ids)
+        case_ids = gen.test_cases() if volumes.test_cases else range(0)
+        suite_ids = gen.suites(case_ids)[0] if volumes.suites else range(0)
+        if volumes.shares and case_ids:
+            gen.shares(TestCaseShare, 'test_case_id', case_ids, volumes.shares - volumes.shares // 4)
+        if volumes.shares and suite_ids:
+            gen.shares(TestSuiteShare, 'test_suite_id', suite_ids, volumes.shares // 4)
+        writer.finish()
+    return dict(writer.counts)
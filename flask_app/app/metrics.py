@@ -0,0 +1,520 @@
+"""Prometheus-style counters, gauges and histograms.
+
+Hot paths only touch a per-thread shard (a plain dict the owning thread
+alone writes), so recording takes no lock. A scrape sums the shards; a
+thread's shard is folded into one retired shard when the thread exits.
+
+With METRICS_MULTIPROC_DIR set (gunicorn), every worker also writes its
+totals to ``<dir>/<pid>.json`` every METRICS_FLUSH_S seconds and at exit,
+and /metrics in any worker merges the files: counters and histograms of
+every worker that ever wrote, gauges of live workers only. The files of
+dead workers are folded into ``<dir>/aggregate.json`` and removed, so the
+directory stays small and a reused pid does not overwrite earlier totals.
+Empty the directory when deploying.
+"""
+import asyncio
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+PREFIX = 'autoflow_'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+MULTIPROC_DIR: Optional[str] = None
+FLUSH_S = 5.0
+
+Labels = Tuple[str, ...]
+Key = Tuple[str, Labels]
+
+_registry: Dict[str, 'Metric'] = {}
+_callbacks: List[Tuple[str, str, Sequence[str], Callable[[], Dict[Labels, float]]]] = []
+_local = threading.local()
+_shards: Dict[int, Tuple[Any, Dict[Key, Any]]] = {}  # id(shard): (weakref to owning thread, shard)
+_retired: Dict[Key, Any] = {}
+_lock = threading.Lock()
+_flusher: Optional[threading.Thread] = None
+_started = time.time()  # tells this process's file from one left by an earlier process with the same pid
+_flushed_pid: Optional[int] = None
+AGGREGATE = 'aggregate.json'
+
+
+def init_app(app) -> None:
+    global MULTIPROC_DIR, FLUSH_S
+    MULTIPROC_DIR = app.config.setdefault(
+        'METRICS_MULTIPROC_DIR',
+        os.getenv('METRICS_MULTIPROC_DIR') or os.getenv('PROMETHEUS_MULTIPROC_DIR'),
+    )
+    FLUSH_S = app.config.setdefault('METRICS_FLUSH_S', FLUSH_S)
+    app.config.setdefault('METRICS_TOKEN', os.getenv('METRICS_TOKEN'))
+    register_callback('db_pool_connections', 'SQLAlchemy pool connections of this app', ('state',),
+                      lambda: _db_pool(app))
+    if MULTIPROC_DIR:
+        os.makedirs(MULTIPROC_DIR, exist_ok=True)
+        _start_flusher()
+
+
+class _Owner:
+    """Held in the thread-local next to the shard; it is released when the
+    thread exits, which retires the shard"""
+    __slots__ = ('__weakref__',)
+
+
+def _shard() -> Dict[Key, Any]:
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _local.shard = {}
+        owner = _local.owner = _Owner()
+        with _lock:
+            _shards[id(shard)] = (weakref.ref(threading.current_thread()), shard)
+        weakref.finalize(owner, _retire, shard).atexit = False
+        return shard
+
+
+def _retire(shard: Dict[Key, Any]) -> None:
+    with _lock:
+        if _shards.pop(id(shard), None) is not None:
+            _merge(_retired, shard)
+
+
+def _merge(into: Dict[Key, Any], values: Dict[Key, Any]) -> None:
+    for key, value in values.items():
+        if isinstance(value, list):
+            total = into.get(key)
+            if total is None:
+                into[key] = list(value)
+            else:
+                for i, v in enumerate(value):
+                    total[i] += v
+        else:
+            into[key] = into.get(key, 0) + value
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Labels, Any] = {}
+        if self.name in _registry:
+            raise ValueError(f'Metric {self.name} is already registered')
+        _registry[self.name] = self
+
+    def labels(self, *values: Any):
+        """The child for these label values (cached; keep one around on hot paths)"""
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} takes labels {self.labelnames}')
+            child = self._children.setdefault(values, self._child((self.name, values)))
+        return child
+
+
+class _CounterChild:
+    __slots__ = ('key',)
+
+    def __init__(self, key: Key):
+        self.key = key
+
+    def inc(self, amount: float = 1) -> None:
+        shard = _shard()
+        shard[self.key] = shard.get(self.key, 0) + amount
+
+
+class Counter(Metric):
+    kind = 'counter'
+    _child = _CounterChild
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1) -> None:
+        self.inc(-amount)
+
+    @contextmanager
+    def track(self) -> Iterator[None]:
+        """+1 for the duration of the block (in-flight work)"""
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+
+class Gauge(Metric):
+    """Up/down gauge kept as per-thread deltas; absolute values that already
+    exist somewhere (pool sizes) are reported through ``register_callback``"""
+    kind = 'gauge'
+    _child = _GaugeChild
+
+
+class _HistogramChild:
+    __slots__ = ('key', 'buckets')
+
+    def __init__(self, key: Key, buckets: Sequence[float]):
+        self.key = key
+        self.buckets = buckets
+
+    def observe(self, value: float) -> None:
+        shard = _shard()
+        counts = shard.get(self.key)
+        if counts is None:
+            # one slot per bucket, +Inf, then sum and count
+            counts = shard[self.key] = [0.0] * (len(self.buckets) + 3)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _child(self, key: Key) -> _HistogramChild:
+        return _HistogramChild(key, self.buckets)
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return Counter(name, documentation, labelnames)
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return Gauge(name, documentation, labelnames)
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    return Histogram(name, documentation, labelnames, buckets)
+
+
+def register_callback(name: str, documentation: str, labelnames: Sequence[str],
+                      fn: Callable[[], Dict[Labels, float]]) -> None:
+    """A gauge read when metrics are collected: ``fn`` returns {label values: value}"""
+    name = PREFIX + name
+    with _lock:
+        _callbacks[:] = [c for c in _callbacks if c[0] != name]
+        _callbacks.append((name, documentation, tuple(labelnames), fn))
+
+
+# Backend calls (hot paths)
+
+BACKEND_SECONDS = histogram('backend_duration_seconds', 'Time spent in execution backend calls',
+                            ('backend', 'operation'))
+BACKEND_CALLS = counter('backend_calls_total', 'Execution backend calls by outcome',
+                        ('backend', 'operation', 'outcome'))
+IN_FLIGHT = gauge('backend_in_flight', 'Backend calls running now (browsers, JVMs, JS contexts, ...)',
+                  ('backend',))
+CACHE_REQUESTS = counter('cache_requests_total', 'In-process cache lookups', ('cache', 'result'))
+QUEUED = gauge('queue_depth', 'Work waiting for capacity', ('queue',))
+
+
+class _Call:
+    __slots__ = ('failed',)
+
+    def __init__(self):
+        self.failed = False
+
+
+@contextmanager
+def track(backend: str, operation: str) -> Iterator[_Call]:
+    """Time a backend call and count it; set ``failed`` on the yielded object
+    when the call reports an error instead of raising"""
+    call = _Call()
+    in_flight = IN_FLIGHT.labels(backend)
+    in_flight.inc()
+    started = time.perf_counter()
+    try:
+        yield call
+    except BaseException:
+        call.failed = True
+        raise
+    finally:
+        BACKEND_SECONDS.labels(backend, operation).observe(time.perf_counter() - started)
+        BACKEND_CALLS.labels(backend, operation, 'error' if call.failed else 'ok').inc()
+        in_flight.dec()
+
+
+def instrumented(backend: str, operation: str, ok: Callable[[Any], bool] = lambda result: True):
+    """Decorator form of ``track``; ``ok`` judges the returned result"""
+    def decorator(f):
+        if asyncio.iscoroutinefunction(f):
+            @wraps(f)
+            async def decorated_coroutine(*args, **kwargs):
+                with track(backend, operation) as call:
+                    result = await f(*args, **kwargs)
+                    call.failed = not ok(result)
+                    return result
+            return decorated_coroutine
+
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            with track(backend, operation) as call:
+                result = f(*args, **kwargs)
+                call.failed = not ok(result)
+                return result
+        return decorated_function
+    return decorator
+
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+# Collection
+
+def _db_pool(app) -> Dict[Labels, float]:
+    from . import db
+
+    with app.app_context():
+        pool = db.engine.pool
+        if not hasattr(pool, 'checkedout'):
+            return {}
+        return {('checked_out',): pool.checkedout(), ('idle',): pool.checkedin(), ('overflow',): max(0, pool.overflow())}
+
+
+def _local_values() -> Dict[Key, Any]:
+    """Totals of this process: retired shards plus every live thread's"""
+    with _lock:
+        live = []
+        for key, (ref, shard) in list(_shards.items()):
+            thread = ref()
+            if thread is None or not thread.is_alive():
+                # Normally retired on exit already; this catches a late finalizer
+                del _shards[key]
+                _merge(_retired, shard.copy())
+            else:
+                live.append(shard)
+        totals: Dict[Key, Any] = {}
+        _merge(totals, _retired)
+    for shard in live:
+        _merge(totals, shard.copy())
+    return totals
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    """{name: {type, help, buckets, samples: [[labels, value], ...]}} for this process"""
+    families: Dict[str, Dict[str, Any]] = {}
+    for metric in list(_registry.values()):
+        families[metric.name] = {
+            'type': metric.kind, 'help': metric.documentation, 'labels': list(metric.labelnames),
+            'buckets': list(getattr(metric, 'buckets', [])), 'samples': [],
+        }
+    for (name, labels), value in _local_values().items():
+        families[name]['samples'].append([list(labels), value])
+    for name, documentation, labelnames, fn in list(_callbacks):
+        try:
+            values = fn()
+        except Exception:
+            continue  # e.g. no database configured yet
+        families[name] = {
+            'type': 'gauge', 'help': documentation, 'labels': list(labelnames), 'buckets': [],
+            'samples': [[list(labels), value] for labels, value in values.items()],
+        }
+    return families
+
+
+def _file_path(pid: int) -> str:
+    return os.path.join(MULTIPROC_DIR, f'{pid}.json')
+
+
+def _read(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None  # gone, being replaced or from another tool
+
+
+def _write(path: str, dumped: Dict[str, Any]) -> None:
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(dumped, f)
+    os.replace(tmp, path)
+
+
+def _add_families(merged: Dict[str, Dict[str, Any]], families: Dict[str, Dict[str, Any]], gauges: bool) -> None:
+    """Sum dumped families into ``merged``, whose samples are {key: value} until ``_listed``"""
+    for name, family in families.items():
+        if family['type'] == 'gauge' and not gauges:
+            continue
+        target = merged.setdefault(name, dict(family, samples={}))
+        _merge(target['samples'], {(name, tuple(labels)): value for labels, value in family['samples']})
+
+
+def _listed(merged: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    for family in merged.values():
+        family['samples'] = [[list(labels), value] for (_, labels), value in family['samples'].items()]
+    return merged
+
+
+def _fold(path: str, stale: Callable[[Dict[str, Any]], bool]) -> None:
+    """Move the counters and histograms of a worker file that ``stale``
+    accepts into the aggregate file, then remove it. Workers fold under a
+    lock file and re-check the file inside it, so each is folded once."""
+    import fcntl
+
+    with open(os.path.join(MULTIPROC_DIR, 'aggregate.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        dumped = _read(path)
+        if dumped is None or not stale(dumped):
+            return
+        aggregate_path = os.path.join(MULTIPROC_DIR, AGGREGATE)
+        merged: Dict[str, Dict[str, Any]] = {}
+        _add_families(merged, (_read(aggregate_path) or {}).get('families', {}), gauges=False)
+        _add_families(merged, dumped['families'], gauges=False)
+        _write(aggregate_path, {'pid': None, 'families': _listed(merged)})
+        os.remove(path)
+
+
+def flush() -> None:
+    """Write this process's totals for the other workers to merge"""
+    global _flushed_pid
+    if not MULTIPROC_DIR:
+        return
+    pid = os.getpid()
+    path = _file_path(pid)
+    if _flushed_pid != pid:
+        # A file under our pid left by an earlier, dead process
+        _fold(path, lambda dumped: dumped.get('started') != _started)
+        _flushed_pid = pid
+    _write(path, {'pid': pid, 'started': _started, 'families': snapshot()})
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect() -> Dict[str, Dict[str, Any]]:
+    """Families of this process, or of every worker in multiprocess mode"""
+    if not MULTIPROC_DIR:
+        return snapshot()
+    flush()
+    paths = [entry.path for entry in os.scandir(MULTIPROC_DIR)
+             if entry.name.endswith('.json') and entry.name != AGGREGATE]
+    # Fold dead workers first so their totals are read once, from the aggregate
+    for path in paths:
+        pid = (_read(path) or {}).get('pid')
+        if pid is not None and not _alive(pid):
+            try:
+                _fold(path, lambda dumped: dumped.get('pid') == pid and not _alive(pid))
+            except OSError:
+                pass  # read as it is and folded on a later scrape
+    merged: Dict[str, Dict[str, Any]] = {}
+    for path in paths + [os.path.join(MULTIPROC_DIR, AGGREGATE)]:
+        dumped = _read(path)
+        if dumped is None:
+            continue
+        pid = dumped.get('pid')
+        _add_families(merged, dumped['families'], gauges=pid is not None and _alive(pid))
+    return _listed(merged)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(str(v))}"' for n, v in pairs) + '}'
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render(families: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+    """Text exposition format"""
+    families = collect() if families is None else families
+    lines = []
+    for name in sorted(families):
+        family = families[name]
+        names = family['labels']
+        lines.append(f'# HELP {name} {family["help"]}')
+        lines.append(f'# TYPE {name} {family["type"]}')
+        for labels, value in sorted(family['samples'], key=lambda s: s[0]):
+            if family['type'] != 'histogram':
+                lines.append(f'{name}{_labels(names, labels)} {_number(value)}')
+                continue
+            cumulative = 0.0
+            for bound, count in zip(list(family['buckets']) + [float('inf')], value):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(names, labels, ("le", _number(bound)))} {_number(cumulative)}')
+            lines.append(f'{name}_sum{_labels(names, labels)} {_number(value[-2])}')
+            lines.append(f'{name}_count{_labels(names, labels)} {_number(value[-1])}')
+    return '\n'.join(lines) + '\n'
+
+
+# Process lifecycle
+
+def _flush_loop() -> None:
+    while True:
+        time.sleep(FLUSH_S)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def _start_flusher() -> None:
+    global _flusher
+    if _flusher is None or not _flusher.is_alive():
+        _flusher = threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True)
+        _flusher.start()
+
+
+def _after_fork() -> None:
+    # A forked worker starts from zero (the parent's counts stay in the parent's file)
+    global _flusher, _lock, _started
+    _lock = threading.Lock()  # may have been held by a thread that does not exist here
+    _local.__dict__.clear()
+    _shards.clear()
+    _retired.clear()
+    _started = time.time()
+    _flusher = None
+    if MULTIPROC_DIR:
+        _start_flusher()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+@atexit.register
+def _flush_at_exit() -> None:
+    try:
+        flush()
+    except OSError:
+        pass
@@ -0,0 +1,7 @@
+"""Create any tables that don't exist yet (the schema formerly built by db.create_all)"""
+from .. import db
+from .. import models  # noqa: F401  (registers every table on db.metadata)
+
+
+def upgrade(conn):
+    db.metadata.create_all(conn, checkfirst=True)
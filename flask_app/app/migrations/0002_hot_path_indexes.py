@@ -0,0 +1,45 @@
+"""Indexes for the owner/public/share/ordering filters and implied unique keys"""
+from . import create_index, delete_duplicates
+
+# Built with CREATE INDEX CONCURRENTLY, which cannot run inside a transaction
+transactional = False
+
+INDEXES = [
+    ('ix_request_created_by_id', 'request', ['created_by_id']),
+    ('ix_request_created_at', 'request', ['created_at']),
+    ('ix_action_created_by_id', 'action', ['created_by_id']),
+    ('ix_snippet_created_by_id', 'snippet', ['created_by_id']),
+    ('ix_snippet_public_id', 'snippet', ['is_public', 'id']),
+    ('ix_scenario_created_by_id', 'scenario', ['created_by_id']),
+    ('ix_scenario_public_id', 'scenario', ['is_public', 'id']),
+    ('ix_scenario_step_scenario_order', 'scenario_step', ['scenario_id', 'order']),
+    ('ix_database_connection_created_by_id', 'database_connection', ['created_by_id']),
+    ('ix_test_case_owner_id', 'test_case', ['created_by_id', 'id']),
+    ('ix_test_case_public_id', 'test_case', ['is_public', 'id']),
+    ('ix_test_suite_owner_id', 'test_suite', ['created_by_id', 'id']),
+    ('ix_test_suite_public_id', 'test_suite', ['is_public', 'id']),
+    ('ix_test_suite_case_suite_order', 'test_suite_case', ['test_suite_id', 'order']),
+    ('ix_test_suite_case_case_id', 'test_suite_case', ['test_case_id']),
+    ('ix_test_case_share_user_case', 'test_case_share', ['shared_with_id', 'test_case_id']),
+    ('ix_test_suite_share_user_suite', 'test_suite_share', ['shared_with_id', 'test_suite_id']),
+    ('ix_selenium_action_created_by_id', 'selenium_action', ['created_by_id']),
+    ('ix_sql_query_created_by_id', 'sql_query', ['created_by_id']),
+]
+
+UNIQUE_INDEXES = [
+    ('uq_environment_variable_env_key', 'environment_variable', ['environment_id', 'key']),
+    ('uq_test_case_share_case_user', 'test_case_share', ['test_case_id', 'shared_with_id']),
+    ('uq_test_suite_share_suite_user', 'test_suite_share', ['test_suite_id', 'shared_with_id']),
+]
+# Duplicate shares keep the strongest permission (weakest first, as in
+# auth._grants) so nobody loses access; duplicate variables keep the newest
+SHARE_RANK = ('permission', ('read', 'write', 'execute'))
+
+
+def upgrade(conn):
+    for name, table, columns in INDEXES:
+        create_index(conn, name, table, columns)
+    for name, table, columns in UNIQUE_INDEXES:
+        # Earlier versions allowed duplicates; every deleted row is logged
+        delete_duplicates(conn, table, columns, *(SHARE_RANK if table.endswith('_share') else ()))
+        create_index(conn, name, table, columns, unique=True)
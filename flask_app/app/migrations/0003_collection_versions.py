@@ -0,0 +1,6 @@
+"""Per-collection version counters backing ETags and the response cache"""
+from ..models import CollectionVersion
+
+
+def upgrade(conn):
+    CollectionVersion.__table__.create(conn, checkfirst=True)
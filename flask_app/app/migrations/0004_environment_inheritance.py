@@ -0,0 +1,7 @@
+"""Environment parent (variable inheritance) and version counter for snapshots"""
+from . import add_column
+
+
+def upgrade(conn):
+    add_column(conn, 'environment', 'parent_id', 'INTEGER REFERENCES environment (id) ON DELETE SET NULL')
+    add_column(conn, 'environment', 'version', 'INTEGER NOT NULL DEFAULT 1')
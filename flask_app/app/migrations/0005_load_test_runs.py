@@ -0,0 +1,6 @@
+"""Stored load-test runs for comparing results between runs"""
+from ..models import LoadTestRun
+
+
+def upgrade(conn):
+    LoadTestRun.__table__.create(conn, checkfirst=True)
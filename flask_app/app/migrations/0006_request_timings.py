@@ -0,0 +1,8 @@
+"""Per-request connect/read timeouts and the request_run timing history"""
+from . import add_column
+from ..models import RequestRun
+
+
+def upgrade(conn):
+    add_column(conn, 'request', 'options', 'JSONB')
+    RequestRun.__table__.create(conn, checkfirst=True)
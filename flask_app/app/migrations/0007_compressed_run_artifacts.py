@@ -0,0 +1,10 @@
+"""Compressed response artifacts on request_run and trained compression dictionaries"""
+from . import add_column
+from ..models import CompressionDictionary, RequestRun
+
+
+def upgrade(conn):
+    binary = RequestRun.__table__.c.artifact.type.compile(dialect=conn.dialect)
+    add_column(conn, 'request_run', 'artifact', binary)
+    add_column(conn, 'request_run', 'artifact_size', 'INTEGER')
+    CompressionDictionary.__table__.create(conn, checkfirst=True)
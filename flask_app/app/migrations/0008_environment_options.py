@@ -0,0 +1,6 @@
+"""Environment-level options (retry policy), inherited like variables"""
+from . import add_column
+
+
+def upgrade(conn):
+    add_column(conn, 'environment', 'options', 'JSONB')
@@ -0,0 +1,7 @@
+"""Cross-process token buckets and concurrency leases for outbound throttling"""
+from ..models import ThrottleBucket, ThrottleLease
+
+
+def upgrade(conn):
+    ThrottleBucket.__table__.create(conn, checkfirst=True)
+    ThrottleLease.__table__.create(conn, checkfirst=True)
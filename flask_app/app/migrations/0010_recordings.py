@@ -0,0 +1,7 @@
+"""Recorded request/response pairs for hermetic scenario and suite replays"""
+from ..models import RecordedExchange, Recording
+
+
+def upgrade(conn):
+    Recording.__table__.create(conn, checkfirst=True)
+    RecordedExchange.__table__.create(conn, checkfirst=True)
@@ -0,0 +1,6 @@
+"""Environment owner, checked before another environment may inherit from it"""
+from . import add_column
+
+
+def upgrade(conn):
+    add_column(conn, 'environment', 'created_by_id', 'INTEGER REFERENCES "user" (id)')
@@ -0,0 +1,6 @@
+"""Stop flag on load-test runs, so any worker can stop a run another worker executes"""
+from . import add_column
+
+
+def upgrade(conn):
+    add_column(conn, 'load_test_run', 'stop_requested', 'BOOLEAN NOT NULL DEFAULT FALSE')
@@ -0,0 +1,199 @@
+"""Versioned schema migrations.
+
+Each module in this package is named ``NNNN_description.py`` and defines an
+``upgrade(conn)`` function. Migrations run in version order and are recorded
+in the ``schema_migration`` table. A module that sets ``transactional = False``
+runs in autocommit mode so it can build indexes with CREATE INDEX CONCURRENTLY
+instead of holding a write lock on large tables.
+"""
+import importlib
+import logging
+import pkgutil
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, bindparam, inspect, text
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key shared by every worker so only one applies migrations at a time
+ADVISORY_LOCK_KEY = 7_420_026
+# Fail fast instead of queueing behind long-running transactions
+LOCK_TIMEOUT = '5s'
+
+_metadata = MetaData()
+schema_migration = Table(
+    'schema_migration', _metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String(200), nullable=False),
+    Column('applied_at', DateTime, default=datetime.utcnow),
+)
+
+
+def discover() -> List[Dict[str, Any]]:
+    """Return the migration modules in this package sorted by version"""
+    migrations = []
+    for info in pkgutil.iter_modules(__path__):
+        prefix, _, name = info.name.partition('_')
+        if not prefix.isdigit():
+            continue
+        module = importlib.import_module(f'{__name__}.{info.name}')
+        migrations.append({
+            'version': int(prefix),
+            'name': name,
+            'module': module,
+            'transactional': getattr(module, 'transactional', True),
+        })
+    return sorted(migrations, key=lambda m: m['version'])
+
+
+def applied_versions(engine) -> Dict[int, datetime]:
+    with engine.begin() as conn:
+        _metadata.create_all(conn, checkfirst=True)
+        rows = conn.execute(schema_migration.select()).fetchall()
+    return {row.version: row.applied_at for row in rows}
+
+
+def status(engine) -> List[Dict[str, Any]]:
+    """List every known migration and when it was applied (None if pending)"""
+    applied = applied_versions(engine)
+    return [
+        {'version': m['version'], 'name': m['name'], 'applied_at': applied.get(m['version'])}
+        for m in discover()
+    ]
+
+
+def upgrade(engine) -> List[int]:
+    """Apply pending migrations; returns the versions that were applied"""
+    done = []
+    with _migration_lock(engine):
+        applied = applied_versions(engine)
+        for migration in discover():
+            if migration['version'] in applied:
+                continue
+            started = time.perf_counter()
+            _apply(engine, migration)
+            logger.info('Applied migration %04d_%s in %.2fs', migration['version'],
+                        migration['name'], time.perf_counter() - started)
+            done.append(migration['version'])
+    return done
+
+
+def _apply(engine, migration: Dict[str, Any]) -> None:
+    record = schema_migration.insert().values(
+        version=migration['version'], name=migration['name'], applied_at=datetime.utcnow()
+    )
+    if migration['transactional']:
+        with engine.begin() as conn:
+            _set_lock_timeout(conn, local=True)
+            migration['module'].upgrade(conn)
+            conn.execute(record)
+    else:
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            _set_lock_timeout(conn)
+            try:
+                migration['module'].upgrade(conn)
+                conn.execute(record)
+            finally:
+                # The connection goes back to the pool; don't leak the timeout into app queries
+                _reset_lock_timeout(conn)
+
+
+def _set_lock_timeout(conn, local: bool = False) -> None:
+    """SET LOCAL inside a migration transaction; a plain SET (reset afterwards) in autocommit"""
+    if conn.dialect.name == 'postgresql':
+        scope = 'LOCAL ' if local else ''
+        conn.execute(text(f"SET {scope}lock_timeout = '{LOCK_TIMEOUT}'"))
+
+
+def _reset_lock_timeout(conn) -> None:
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text('RESET lock_timeout'))
+
+
+class _migration_lock:
+    """Session-level advisory lock so concurrent workers don't race (PostgreSQL only)"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.conn = None
+
+    def __enter__(self):
+        if self.engine.dialect.name == 'postgresql':
+            self.conn = self.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+            self.conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': ADVISORY_LOCK_KEY})
+        return self
+
+    def __exit__(self, *exc):
+        if self.conn is not None:
+            self.conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': ADVISORY_LOCK_KEY})
+            self.conn.close()
+        return False
+
+
+def create_index(conn, name: str, table: str, columns: List[str], unique: bool = False) -> None:
+    """Create an index if missing, concurrently on PostgreSQL.
+
+    A previous CONCURRENTLY build that was interrupted leaves an INVALID index
+    behind; it is dropped and rebuilt rather than skipped by IF NOT EXISTS.
+    """
+    quote = conn.dialect.identifier_preparer.quote
+    cols = ', '.join(quote(c) for c in columns)
+    kind = 'UNIQUE INDEX' if unique else 'INDEX'
+    if conn.dialect.name == 'postgresql':
+        invalid = conn.execute(text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ), {'name': name}).first()
+        if invalid:
+            conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {quote(name)}'))
+        conn.execute(text(f'CREATE {kind} CONCURRENTLY IF NOT EXISTS {quote(name)} ON {quote(table)} ({cols})'))
+    else:
+        conn.execute(text(f'CREATE {kind} IF NOT EXISTS {quote(name)} ON {quote(table)} ({cols})'))
+
+
+def delete_duplicates(conn, table: str, columns: List[str], rank_column: Optional[str] = None,
+                      ranking: Sequence[str] = ()) -> int:
+    """Keep one row for each combination of columns and return how many were deleted.
+
+    The kept row is the one whose ``rank_column`` comes last in ``ranking``
+    (e.g. the strongest share permission), then the newest (highest id).
+    Every deleted row is logged with its id, key and rank value; other
+    columns may hold secrets and are left out.
+    """
+    quote = conn.dialect.identifier_preparer.quote
+    logged = list(columns) + ([rank_column] if rank_column else [])
+    join = ' AND '.join(f't.{quote(c)} = d.{quote(c)}' for c in columns)
+    rows = conn.execute(text(
+        f"SELECT t.id, {', '.join(f't.{quote(c)}' for c in logged)} FROM {quote(table)} t "
+        f"JOIN (SELECT {', '.join(quote(c) for c in columns)} FROM {quote(table)} "
+        f"GROUP BY {', '.join(quote(c) for c in columns)} HAVING COUNT(*) > 1) d ON {join}"
+    )).mappings().all()
+    groups: Dict[tuple, List[Any]] = {}
+    for row in rows:
+        groups.setdefault(tuple(row[c] for c in columns), []).append(row)
+    rank = {value: i for i, value in enumerate(ranking)}
+    doomed = []
+    for group in groups.values():
+        group.sort(key=lambda r: (rank.get(r[rank_column], -1) if rank_column else 0, r['id']))
+        kept = group[-1]
+        for row in group[:-1]:
+            logger.warning('%s: deleting duplicate row %s (keeping id %s)', table, dict(row), kept['id'])
+            doomed.append(row['id'])
+    if doomed:
+        conn.execute(text(f'DELETE FROM {quote(table)} WHERE id IN :ids')
+                     .bindparams(bindparam('ids', expanding=True)), {'ids': doomed})
+        logger.warning('%s: deleted %d duplicate rows in %d groups', table, len(doomed), len(groups))
+    return len(doomed)
+
+
+def add_column(conn, table: str, column: str, ddl: str) -> None:
+    """ALTER TABLE ... ADD COLUMN unless the column already exists.
+
+    Keep ``ddl`` to a nullable column or a constant default so PostgreSQL
+    adds it without rewriting the table.
+    """
+    existing = {c['name'] for c in inspect(conn).get_columns(table)}
+    if column not in existing:
+        quote = conn.dialect.identifier_preparer.quote
+        conn.execute(text(f'ALTER TABLE {quote(table)} ADD COLUMN {quote(column)} {ddl}'))
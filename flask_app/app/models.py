@@ -14,7 +14,12 @@ class Environment(db.Model, TimestampMixin):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), unique=True, nullable=False)
     description = db.Column(db.String(255))
+    parent_id = db.Column(db.Integer, db.ForeignKey('environment.id', ondelete='SET NULL'), nullable=True)  # inherits variables
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # bumped when it or its variables change
+    options = db.Column(JSONB, default=dict)  # retry policy etc., inherited by children
+    created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # only the owner may inherit from it
     variables = db.relationship('EnvironmentVariable', backref='environment', cascade='all, delete-orphan')
+    parent = db.relationship('Environment', remote_side=[id], backref='children')
 
 class EnvironmentVariable(db.Model, TimestampMixin):
     __tablename__ = 'environment_variable'
@@ -24,6 +29,10 @@ class EnvironmentVariable(db.Model, TimestampMixin):
     value = db.Column(db.Text, default='')
     is_secret = db.Column(db.Boolean, default=False)
 
+    __table_args__ = (
+        db.Index('uq_environment_variable_env_key', 'environment_id', 'key', unique=True),
+    )
+
 class RequestModel(db.Model, TimestampMixin):
     __tablename__ = 'request'
     id = db.Column(db.Integer, primary_key=True)
@@ -35,8 +44,14 @@ class RequestModel(db.Model, TimestampMixin):
     payload_type = db.Column(db.String(10), default='json')  # json|xml|form|text
     pre_script = db.Column(db.Text, default='')  # JavaScript
     post_script = db.Column(db.Text, default='')  # JavaScript
+    options = db.Column(JSONB, default=dict)  # connect_timeout, read_timeout (seconds), retry
     created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_request_created_by_id', 'created_by_id'),
+        db.Index('ix_request_created_at', 'created_at'),
+    )
+
 class ActionModel(db.Model, TimestampMixin):
     __tablename__ = 'action'
     id = db.Column(db.Integer, primary_key=True)
@@ -46,6 +61,10 @@ class ActionModel(db.Model, TimestampMixin):
     code = db.Column(db.Text, nullable=False)
     created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_action_created_by_id', 'created_by_id'),
+    )
+
 class Snippet(db.Model, TimestampMixin):
     __tablename__ = 'snippet'
     id = db.Column(db.Integer, primary_key=True)
@@ -58,6 +77,11 @@ class Snippet(db.Model, TimestampMixin):
     is_public = db.Column(db.Boolean, default=False)
     created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_snippet_created_by_id', 'created_by_id'),
+        db.Index('ix_snippet_public_id', 'is_public', 'id'),
+    )
+
 class Scenario(db.Model, TimestampMixin):
     __tablename__ = 'scenario'
     id = db.Column(db.Integer, primary_key=True)
@@ -67,6 +91,11 @@ class Scenario(db.Model, TimestampMixin):
     created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     steps = db.relationship('ScenarioStep', backref='scenario', cascade='all, delete-orphan', order_by='ScenarioStep.order')
 
+    __table_args__ = (
+        db.Index('ix_scenario_created_by_id', 'created_by_id'),
+        db.Index('ix_scenario_public_id', 'is_public', 'id'),
+    )
+
 class ScenarioStep(db.Model, TimestampMixin):
     __tablename__ = 'scenario_step'
     id = db.Column(db.Integer, primary_key=True)
@@ -75,6 +104,10 @@ class ScenarioStep(db.Model, TimestampMixin):
     step_type = db.Column(db.String(20), nullable=False)  # request|action
     ref_id = db.Column(db.Integer, nullable=False)  # ID of RequestModel or ActionModel
 
+    __table_args__ = (
+        db.Index('ix_scenario_step_scenario_order', 'scenario_id', 'order'),
+    )
+
 # User Authentication and Roles
 class User(UserMixin, db.Model, TimestampMixin):
     __tablename__ = 'user'
@@ -114,6 +147,10 @@ class DatabaseConnection(db.Model, TimestampMixin):
     is_active = db.Column(db.Boolean, default=True)
     created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_database_connection_created_by_id', 'created_by_id'),
+    )
+
 # Test Cases and Suites
 class TestCase(db.Model, TimestampMixin):
     __tablename__ = 'test_case'
@@ -130,6 +167,12 @@ class TestCase(db.Model, TimestampMixin):
     suite_tests = db.relationship('TestSuiteCase', backref='test_case', cascade='all, delete-orphan')
     shared_with = db.relationship('TestCaseShare', backref='test_case', cascade='all, delete-orphan')
 
+    # Visibility lookups: owned or public, ordered by id
+    __table_args__ = (
+        db.Index('ix_test_case_owner_id', 'created_by_id', 'id'),
+        db.Index('ix_test_case_public_id', 'is_public', 'id'),
+    )
+
 class TestSuite(db.Model, TimestampMixin):
     __tablename__ = 'test_suite'
     id = db.Column(db.Integer, primary_key=True)
@@ -142,6 +185,12 @@ class TestSuite(db.Model, TimestampMixin):
     test_cases = db.relationship('TestSuiteCase', backref='test_suite', cascade='all, delete-orphan')
     shared_with = db.relationship('TestSuiteShare', backref='test_suite', cascade='all, delete-orphan')
 
+    # Visibility lookups: owned or public, ordered by id
+    __table_args__ = (
+        db.Index('ix_test_suite_owner_id', 'created_by_id', 'id'),
+        db.Index('ix_test_suite_public_id', 'is_public', 'id'),
+    )
+
 class TestSuiteCase(db.Model, TimestampMixin):
     __tablename__ = 'test_suite_case'
     id = db.Column(db.Integer, primary_key=True)
@@ -149,6 +198,11 @@ class TestSuiteCase(db.Model, TimestampMixin):
     test_case_id = db.Column(db.Integer, db.ForeignKey('test_case.id', ondelete='CASCADE'), nullable=False)
     order = db.Column(db.Integer, nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_test_suite_case_suite_order', 'test_suite_id', 'order'),
+        db.Index('ix_test_suite_case_case_id', 'test_case_id'),
+    )
+
 # Sharing Models
 class TestCaseShare(db.Model, TimestampMixin):
     __tablename__ = 'test_case_share'
@@ -157,6 +211,12 @@ class TestCaseShare(db.Model, TimestampMixin):
     shared_with_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     permission = db.Column(db.String(20), default='read')  # read|write|execute
 
+    # One share per user per case; "shared with me" EXISTS probe
+    __table_args__ = (
+        db.Index('uq_test_case_share_case_user', 'test_case_id', 'shared_with_id', unique=True),
+        db.Index('ix_test_case_share_user_case', 'shared_with_id', 'test_case_id'),
+    )
+
 class TestSuiteShare(db.Model, TimestampMixin):
     __tablename__ = 'test_suite_share'
     id = db.Column(db.Integer, primary_key=True)
@@ -164,6 +224,12 @@ class TestSuiteShare(db.Model, TimestampMixin):
     shared_with_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     permission = db.Column(db.String(20), default='read')  # read|write|execute
 
+    # One share per user per suite; "shared with me" EXISTS probe
+    __table_args__ = (
+        db.Index('uq_test_suite_share_suite_user', 'test_suite_id', 'shared_with_id', unique=True),
+        db.Index('ix_test_suite_share_user_suite', 'shared_with_id', 'test_suite_id'),
+    )
+
 # Selenium Actions and Java Support
 class SeleniumAction(db.Model, TimestampMixin):
     __tablename__ = 'selenium_action'
@@ -176,6 +242,10 @@ class SeleniumAction(db.Model, TimestampMixin):
     dependencies = db.Column(JSONB, default=list)  # Required libraries/dependencies
     created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_selenium_action_created_by_id', 'created_by_id'),
+    )
+
 # SQL Query Templates
 class SQLQuery(db.Model, TimestampMixin):
     __tablename__ = 'sql_query'
@@ -187,5 +257,110 @@ class SQLQuery(db.Model, TimestampMixin):
     database_connection_id = db.Column(db.Integer, db.ForeignKey('database_connection.id'), nullable=True)
     created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_sql_query_created_by_id', 'created_by_id'),
+    )
+
+# Cache Versioning
+class CollectionVersion(db.Model):
+    __tablename__ = 'collection_version'
+    name = db.Column(db.String(50), primary_key=True)  # request|environment|scenario|...
+    version = db.Column(db.BigInteger, nullable=False, default=0)  # bumped on every create/update/delete
+
+# Request Run History
+class RequestRun(db.Model):
+    __tablename__ = 'request_run'
+    id = db.Column(db.Integer, primary_key=True)
+    request_id = db.Column(db.Integer, db.ForeignKey('request.id', ondelete='CASCADE'), nullable=False)
+    environment_id = db.Column(db.Integer, db.ForeignKey('environment.id', ondelete='SET NULL'), nullable=True)
+    source = db.Column(db.String(20), default='send')  # send|scenario
+    ok = db.Column(db.Boolean, default=False)
+    status = db.Column(db.Integer, nullable=True)  # HTTP status, null when the send failed
+    error = db.Column(db.Text, nullable=True)
+    response_size = db.Column(db.BigInteger, nullable=True)
+    timings = db.Column(JSONB, default=dict)  # dns/connect/tls/ttfb/download/script phases in ms
+    artifact = db.Column(db.LargeBinary, nullable=True)  # captured headers + body, compressed (services/artifacts)
+    artifact_size = db.Column(db.Integer, nullable=True)  # uncompressed bytes
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_request_run_request_id', 'request_id', 'id'),
+    )
+
+class CompressionDictionary(db.Model):
+    __tablename__ = 'compression_dictionary'
+    id = db.Column(db.Integer, primary_key=True)
+    algorithm = db.Column(db.String(10), nullable=False)  # zstd|zlib
+    data = db.Column(db.LargeBinary, nullable=False)
+    sample_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Load Testing
+class LoadTestRun(db.Model, TimestampMixin):
+    __tablename__ = 'load_test_run'
+    id = db.Column(db.Integer, primary_key=True)
+    target_type = db.Column(db.String(20), nullable=False)  # request|scenario
+    target_id = db.Column(db.Integer, nullable=False)
+    environment_id = db.Column(db.Integer, db.ForeignKey('environment.id', ondelete='SET NULL'), nullable=True)
+    config = db.Column(JSONB, default=dict)  # mode, duration_s, concurrency, rate
+    status = db.Column(db.String(20), default='running')  # running|finished|stopped|failed (worker lost)
+    results = db.Column(JSONB, default=dict)  # latency percentiles, throughput, errors, histogram
+    stop_requested = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())  # polled by the running worker
+    finished_at = db.Column(db.DateTime, nullable=True)
+    created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_load_test_run_target', 'target_type', 'target_id'),
+    )
+
+# Record / Replay
+class Recording(db.Model, TimestampMixin):
+    __tablename__ = 'recording'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    source_type = db.Column(db.String(20), nullable=False)  # scenario|suite
+    source_id = db.Column(db.Integer, nullable=False)
+    environment_id = db.Column(db.Integer, db.ForeignKey('environment.id', ondelete='SET NULL'), nullable=True)
+    exchange_count = db.Column(db.Integer, default=0)
+    created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    exchanges = db.relationship('RecordedExchange', backref='recording', cascade='all, delete-orphan',
+                                passive_deletes=True)
+
+    __table_args__ = (
+        db.Index('ix_recording_source', 'source_type', 'source_id'),
+    )
+
+class RecordedExchange(db.Model):
+    __tablename__ = 'recorded_exchange'
+    id = db.Column(db.Integer, primary_key=True)
+    recording_id = db.Column(db.Integer, db.ForeignKey('recording.id', ondelete='CASCADE'), nullable=False)
+    match_key = db.Column(db.String(64), nullable=False)  # sha256 of method, substituted URL and body hash
+    method = db.Column(db.String(10), nullable=False)
+    url = db.Column(db.Text, nullable=False)
+    status = db.Column(db.Integer, nullable=False)
+    elapsed_ms = db.Column(db.Float, nullable=True)  # upstream time, replayed with simulate_latency
+    artifact = db.Column(db.LargeBinary, nullable=False)  # response headers + body, compressed (services/artifacts)
+
+    __table_args__ = (
+        db.Index('ix_recorded_exchange_recording_key', 'recording_id', 'match_key'),
+    )
+
+# Outbound Throttling (shared state when THROTTLE_STORE = 'database')
+class ThrottleBucket(db.Model):
+    __tablename__ = 'throttle_bucket'
+    name = db.Column(db.String(255), primary_key=True)  # scheme://host:port, or env:<id>:scheme://host:port
+    tokens = db.Column(db.Float, nullable=False, default=0)
+    refilled_at = db.Column(db.Float, nullable=False, default=0)  # epoch seconds
+
+class ThrottleLease(db.Model):
+    __tablename__ = 'throttle_lease'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), nullable=False)  # ThrottleBucket.name
+    expires_at = db.Column(db.Float, nullable=False)  # epoch seconds; leases of crashed workers age out
+
+    __table_args__ = (
+        db.Index('ix_throttle_lease_name', 'name', 'expires_at'),
+    )
+
 # Update existing models to include user relationships
 # Add foreign keys to existing models
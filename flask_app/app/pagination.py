@@ -0,0 +1,92 @@
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from flask import jsonify, request
+from sqlalchemy.orm import load_only
+
+# Keyset pagination (?after=<id>&limit=<n>) and field projection (?fields=a,b)
+# shared by every list endpoint.
+
+DEFAULT_PAGE_SIZE = 100  # without ?limit= (or with limit=0); clients follow X-Next-Cursor
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidFields(ValueError):
+    """Raised when ?fields= names a field the endpoint does not expose"""
+
+
+def keyset_page(query, id_column, key: Callable[[Any], int] = lambda row: row.id,
+                descending: bool = False) -> Tuple[List[Any], Optional[int]]:
+    """Apply ?after=<id>&limit=<n> keyset pagination ordered by id.
+
+    ``after`` is always the id of the last row the client has seen; with
+    ``descending`` ordering the next page holds the smaller ids. Returns the
+    page rows and the cursor for the next page (None when done).
+    """
+    after = request.args.get('after', type=int)
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    if after is not None:
+        query = query.filter(id_column < after if descending else id_column > after)
+    query = query.order_by(id_column.desc() if descending else id_column)
+    limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, key(rows[-1])
+
+
+def column_fields(model, names: Iterable[str]) -> Tuple[Dict[str, Callable], Dict[str, Any]]:
+    """Build (getters, columns) maps for plain column fields of a model"""
+    getters, columns = {}, {}
+    for name in names:
+        getters[name] = _column_getter(name)
+        columns[name] = getattr(model, name)
+    return getters, columns
+
+
+def _column_getter(name: str) -> Callable[[Any], Any]:
+    def get(obj):
+        value = getattr(obj, name)
+        return value.isoformat() if isinstance(value, datetime) else value
+    return get
+
+
+def requested_fields(summary: Iterable[str], available: Iterable[str]) -> List[str]:
+    """Parse ?fields= against the fields an endpoint exposes.
+
+    Without the parameter the summary fields are returned; ``fields=*``
+    selects everything. ``id`` is always included so rows stay addressable.
+    """
+    available = list(available)
+    raw = request.args.get('fields')
+    if not raw:
+        fields = list(summary)
+    elif raw.strip() == '*':
+        fields = available
+    else:
+        fields = [f.strip() for f in raw.split(',') if f.strip()]
+        unknown = [f for f in fields if f not in available]
+        if unknown:
+            raise InvalidFields(f"Unknown fields: {', '.join(unknown)}")
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return fields
+
+
+def load_columns(query, fields: Iterable[str], columns: Dict[str, Any]):
+    """Only load the columns backing the requested fields (skips large bodies)"""
+    selected = {columns[f] for f in fields if f in columns}
+    return query.options(load_only(*selected)) if selected else query
+
+
+def project(obj: Any, fields: Iterable[str], getters: Dict[str, Callable[[Any], Any]]) -> Dict[str, Any]:
+    """Serialize an object to the requested fields"""
+    return {f: getters[f](obj) for f in fields}
+
+
+def list_response(items: List[Dict[str, Any]], next_cursor: Optional[int]):
+    """JSON list response with the next page cursor in X-Next-Cursor"""
+    response = jsonify(items)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+    return response
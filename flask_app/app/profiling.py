@@ -0,0 +1,235 @@
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+from flask import current_app, g, request
+from flask_login import current_user
+
+# Background sampler defaults
+INTERVAL_MS = 10.0
+MAX_STACKS = 20000  # distinct (endpoint, stack) pairs kept; further new stacks count as [truncated]
+MAX_DEPTH = 128
+
+_APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Thread id -> endpoint being served, for attributing samples
+_serving: Dict[int, str] = {}
+# Code object -> frame label (formatting is most of a sample's cost)
+_labels: Dict[Any, str] = {}
+
+
+def init_app(app) -> None:
+    global INTERVAL_MS, MAX_STACKS
+    INTERVAL_MS = app.config.setdefault('PROFILER_INTERVAL_MS', INTERVAL_MS)
+    MAX_STACKS = app.config.setdefault('PROFILER_MAX_STACKS', MAX_STACKS)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    if app.config.setdefault('PROFILER_SAMPLE', os.getenv('PROFILER_SAMPLE', '0') in ('1', 'true', 'yes', 'on')):
+        sampler.start()
+
+
+def _frame_label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        if filename.startswith(_APP_ROOT):
+            filename = os.path.relpath(filename, _APP_ROOT)
+        else:
+            filename = os.path.basename(filename)
+        name = getattr(code, 'co_qualname', code.co_name)
+        label = _labels[code] = f'{name} ({filename}:{code.co_firstlineno})'.replace(';', ':')
+    return label
+
+
+def collapse(frame) -> str:
+    """Root-first ``a;b;c`` stack of a frame, as flamegraph tools read it"""
+    names: List[str] = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        names.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Sampler:
+    """Samples every thread's stack each ``interval_ms`` and counts the
+    stacks per endpoint (``thread:<name>`` for threads not serving a
+    request). Samples are per process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.interval_ms = INTERVAL_MS
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: Optional[float] = None) -> None:
+        with self._lock:
+            if self.running:
+                return
+            self.interval_ms = float(interval_ms or INTERVAL_MS)
+            self.started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+        self._thread = None
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stacks = Counter()
+            self.samples = 0
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        interval = self.interval_ms / 1000
+        while not self._stop.wait(interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            taken = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                owner = _serving.get(ident) or f'thread:{names.get(ident, ident)}'
+                taken.append((owner, collapse(frame)))
+            with self._lock:
+                self.samples += 1
+                for key in taken:
+                    if key in self.stacks or len(self.stacks) < MAX_STACKS:
+                        self.stacks[key] += 1
+                    else:
+                        self.stacks[(key[0], '[truncated]')] += 1
+
+    def endpoints(self) -> Dict[str, int]:
+        """Samples per endpoint, most sampled first"""
+        totals: Counter = Counter()
+        with self._lock:
+            for (owner, _), count in self.stacks.items():
+                totals[owner] += count
+        return dict(totals.most_common())
+
+    def collapsed(self, endpoint: Optional[str] = None) -> str:
+        """Collapsed-stack text (``stack count`` lines). For one endpoint the
+        stacks start at its frames; otherwise the endpoint is the root frame."""
+        with self._lock:
+            items = list(self.stacks.items())
+        lines = []
+        for (owner, stack), count in sorted(items):
+            if endpoint is None:
+                lines.append(f'{owner};{stack} {count}')
+            elif owner == endpoint:
+                lines.append(f'{stack} {count}')
+        return '\n'.join(lines) + ('\n' if lines else '')
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'running': self.running,
+            'interval_ms': self.interval_ms,
+            'started_at': self.started_at,
+            'samples': self.samples,
+            'stacks': len(self.stacks),
+            'endpoints': self.endpoints(),
+        }
+
+
+sampler = Sampler()
+
+
+# Per-request profiling: ?profile=1 (or X-Profile: 1) from an admin returns the
+# profile instead of the response. Formats: pstats (default; snakeviz,
+# python -m pstats), text (top functions by cumulative time), collapsed
+# (flamegraph.pl / speedscope, sampled from the request thread).
+PROFILE_FORMATS = ('pstats', 'text', 'collapsed')
+
+
+def _requested_format() -> Optional[str]:
+    flag = request.args.get('profile') or request.headers.get('X-Profile')
+    if not flag or flag in ('0', 'false'):
+        return None
+    return flag if flag in PROFILE_FORMATS else 'pstats'
+
+
+class _ThreadSampler(threading.Thread):
+    """Samples one thread at a fine interval for the duration of a request"""
+
+    def __init__(self, ident: int, interval_ms: float = 1.0):
+        super().__init__(name='profiler-request', daemon=True)
+        self.ident_sampled = ident
+        self.interval = interval_ms / 1000
+        self.stacks: Counter = Counter()
+        self.done = threading.Event()
+
+    def run(self) -> None:
+        while not self.done.wait(self.interval):
+            frame = sys._current_frames().get(self.ident_sampled)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+    def finish(self) -> str:
+        self.done.set()
+        self.join()
+        return ''.join(f'{stack} {count}\n' for stack, count in sorted(self.stacks.items()))
+
+
+def _before_request():
+    _serving[threading.get_ident()] = request.endpoint or request.path
+    fmt = _requested_format()
+    if fmt is None or not current_user.is_authenticated or current_user.role != 'admin':
+        return None
+    g.profile_format = fmt
+    if fmt == 'collapsed':
+        g.profiler = _ThreadSampler(threading.get_ident())
+        g.profiler.start()
+    else:
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+    return None
+
+
+def _after_request(response):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+    fmt = g.pop('profile_format')
+    name = f"{(request.endpoint or 'request').replace('.', '-')}-{int(time.time())}"
+    if fmt == 'collapsed':
+        body, mimetype, filename = profiler.finish(), 'text/plain', f'{name}.collapsed.txt'
+    else:
+        profiler.disable()
+        profiler.create_stats()
+        if fmt == 'text':
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(60)
+            body, mimetype, filename = out.getvalue(), 'text/plain', f'{name}.txt'
+        else:
+            body, mimetype, filename = marshal.dumps(profiler.stats), 'application/octet-stream', f'{name}.prof'
+    status = response.status_code
+    response = current_app.response_class(body, status=200, mimetype=mimetype)
+    response.headers['X-Profiled-Status'] = str(status)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _teardown_request(exc):
+    _serving.pop(threading.get_ident(), None)
+    profiler = g.pop('profiler', None)
+    if isinstance(profiler, _ThreadSampler):  # the request failed before after_request
+        profiler.finish()
+    elif profiler is not None:
+        profiler.disable()
@@ -1,8 +1,12 @@
+import hmac
 import json
 import os
-from flask import Blueprint, jsonify, render_template, request, session
+import time
+from flask import Blueprint, Response, current_app, jsonify, render_template, request, send_file, session, stream_with_context
 from flask_login import login_required, current_user
-from . import db
+from sqlalchemy import func, null
+from sqlalchemy.orm import selectinload
+from . import db, metrics, profiling, tracing
 from .models import (
     RequestModel,
     ActionModel,
@@ -20,61 +24,296 @@ from .models import (
     TestSuiteShare,
     SeleniumAction,
     SQLQuery,
+    LoadTestRun,
+    RecordedExchange,
+    Recording,
+    RequestRun,
 )
-from .services.http_client import send_http_request
-from .services.selenium_actions import run_selenium_action_demo
-from .services.java_selenium import JavaSeleniumRunner
-from .services.oracle_client import OracleClient
+from .services import backends
+from .services.backends import BackendUnavailable
+from .services import (
+    artifacts,
+    assertions,
+    env_snapshots,
+    load_test,
+    recordings,
+    resilience,
+    response_capture,
+    run_history,
+    scenario_runner,
+    suite_runner,
+    throttle,
+)
+from .services.resilience import RetryPolicy
+from .services.single_flight import CoalesceRule
+from .services.throttle import Limits
 from .services.trello import TrelloClient
 from .services.auth import AuthService, require_auth, require_admin
+from .cache import conditional
+from .pagination import (
+    InvalidFields,
+    column_fields,
+    keyset_page,
+    list_response,
+    load_columns,
+    project,
+    requested_fields,
+)
 
 api_bp = Blueprint('api', __name__)
 
+
+@api_bp.errorhandler(InvalidFields)
+def invalid_fields(error):
+    return jsonify({'error': str(error)}), 400
+
+
+@api_bp.errorhandler(BackendUnavailable)
+def backend_unavailable(error):
+    return jsonify({'success': False, 'error': str(error)}), 503
+
+
+def _variables_field(env):
+    return [{'key': v.key, 'value': v.value, 'is_secret': v.is_secret} for v in env.variables]
+
+
+def _steps_field(scenario):
+    return [
+        {
+            'id': st.id,
+            'order': st.order,
+            'step_type': st.step_type,
+            'ref_id': st.ref_id
+        } for st in scenario.steps
+    ]
+
+
+def _created_by_field(obj):
+    return obj.created_by.username if obj.created_by else 'System'
+
+
+ENVIRONMENT_GETTERS, ENVIRONMENT_COLUMNS = column_fields(Environment, [
+    'id', 'name', 'description', 'parent_id', 'version', 'options', 'created_at', 'updated_at'
+])
+ENVIRONMENT_GETTERS['variables'] = _variables_field
+ENVIRONMENT_SUMMARY = ('id', 'name', 'description')
+
+REQUEST_GETTERS, REQUEST_COLUMNS = column_fields(RequestModel, [
+    'id', 'name', 'method', 'url', 'headers', 'body', 'payload_type',
+    'pre_script', 'post_script', 'options', 'created_by_id', 'created_at', 'updated_at'
+])
+REQUEST_SUMMARY = ('id', 'name', 'method', 'url', 'payload_type')
+
+REQUEST_RUN_GETTERS, REQUEST_RUN_COLUMNS = column_fields(RequestRun, [
+    'id', 'request_id', 'environment_id', 'source', 'ok', 'status', 'error', 'response_size', 'timings', 'created_at'
+])
+REQUEST_RUN_SUMMARY = ('id', 'source', 'ok', 'status', 'response_size', 'timings', 'created_at')
+REQUEST_OPTIONS = ('connect_timeout', 'read_timeout', 'retry', 'coalesce')
+ENVIRONMENT_OPTIONS = ('retry', 'coalesce', 'throttle')
+# Option keys holding a policy mapping, validated by the policy's from_options
+OPTION_POLICIES = {'retry': RetryPolicy, 'coalesce': CoalesceRule, 'throttle': Limits}
+
+ACTION_GETTERS, ACTION_COLUMNS = column_fields(ActionModel, [
+    'id', 'name', 'description', 'language', 'code', 'created_by_id', 'created_at', 'updated_at'
+])
+ACTION_SUMMARY = ('id', 'name', 'description', 'language')
+
+SCENARIO_GETTERS, SCENARIO_COLUMNS = column_fields(Scenario, [
+    'id', 'name', 'description', 'is_public', 'created_by_id', 'created_at', 'updated_at'
+])
+SCENARIO_GETTERS['steps'] = _steps_field
+SCENARIO_SUMMARY = ('id', 'name', 'description', 'is_public')
+
+SNIPPET_GETTERS, SNIPPET_COLUMNS = column_fields(Snippet, [
+    'id', 'name', 'description', 'category', 'language', 'code', 'tags', 'is_public', 'created_at', 'updated_at'
+])
+SNIPPET_GETTERS['created_by'] = _created_by_field
+SNIPPET_COLUMNS['created_by'] = Snippet.created_by_id
+SNIPPET_SUMMARY = ('id', 'name', 'description', 'category', 'language', 'tags', 'is_public', 'created_by')
+
+DB_CONNECTION_GETTERS, DB_CONNECTION_COLUMNS = column_fields(DatabaseConnection, [
+    'id', 'name', 'db_type', 'host', 'port', 'database_name', 'username', 'is_active', 'created_at', 'updated_at'
+])
+DB_CONNECTION_SUMMARY = ('id', 'name', 'db_type', 'host', 'port', 'database_name', 'username', 'is_active')
+
+SELENIUM_ACTION_GETTERS, SELENIUM_ACTION_COLUMNS = column_fields(SeleniumAction, [
+    'id', 'name', 'description', 'browser', 'language', 'code', 'dependencies', 'created_at', 'updated_at'
+])
+SELENIUM_ACTION_SUMMARY = ('id', 'name', 'description', 'browser', 'language', 'dependencies')
+
+TEST_CASE_GETTERS, TEST_CASE_COLUMNS = column_fields(TestCase, [
+    'id', 'name', 'description', 'test_type', 'test_data', 'expected_result', 'is_public', 'created_at', 'updated_at'
+])
+TEST_CASE_GETTERS['created_by'] = _created_by_field
+TEST_CASE_COLUMNS['created_by'] = TestCase.created_by_id
+TEST_CASE_SUMMARY = ('id', 'name', 'description', 'test_type', 'is_public', 'created_by', 'can_edit', 'can_execute')
+
+TEST_SUITE_GETTERS, TEST_SUITE_COLUMNS = column_fields(TestSuite, [
+    'id', 'name', 'description', 'is_public', 'created_at', 'updated_at'
+])
+TEST_SUITE_GETTERS['created_by'] = _created_by_field
+TEST_SUITE_COLUMNS['created_by'] = TestSuite.created_by_id
+TEST_SUITE_SUMMARY = ('id', 'name', 'description', 'is_public', 'created_by', 'test_count', 'can_edit', 'can_execute')
+
 @api_bp.route('/')
 def index():
     return render_template('index.html')
 
+@api_bp.get('/api/health')
+def health():
+    # Cheap liveness probe; also reports how long this worker took to boot
+    return jsonify({
+        'status': 'ok',
+        'pid': os.getpid(),
+        'startup_ms': current_app.config.get('STARTUP_MS'),
+        'auto_init_db': current_app.config.get('AUTO_INIT_DB'),
+    })
+
+@api_bp.get('/api/backends')
+def list_backends():
+    return jsonify(backends.availability())
+
 # Environments
 @api_bp.get('/api/environments')
+@conditional('environment')
 def list_environments():
-    envs = Environment.query.all()
-    return jsonify([
-        {
-            'id': e.id,
-            'name': e.name,
-            'description': e.description,
-            'variables': [{'key': v.key, 'value': v.value, 'is_secret': v.is_secret} for v in e.variables]
-        }
-        for e in envs
-    ])
+    fields = requested_fields(ENVIRONMENT_SUMMARY, ENVIRONMENT_GETTERS)
+    query = load_columns(Environment.query, fields, ENVIRONMENT_COLUMNS)
+    if 'variables' in fields:
+        query = query.options(selectinload(Environment.variables))
+    envs, next_cursor = keyset_page(query, Environment.id)
+    return list_response([project(e, fields, ENVIRONMENT_GETTERS) for e in envs], next_cursor)
+
+def _policy_option(key, value):
+    """Validate a policy mapping such as options.retry (see OPTION_POLICIES)"""
+    if not isinstance(value, dict):
+        raise ValueError(f'{key} must be an object')
+    try:
+        OPTION_POLICIES[key].from_options({key: value})
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Invalid {key} settings: {e}')
+    return value
+
+def _environment_options(options):
+    """Validate environment options (inherited by child environments)"""
+    options = options or {}
+    if not isinstance(options, dict) or set(options) - set(ENVIRONMENT_OPTIONS):
+        raise ValueError(f"options may only contain: {', '.join(ENVIRONMENT_OPTIONS)}")
+    return {k: _policy_option(k, v) for k, v in options.items() if v is not None}
+
+def _parent_error(parent_id, env=None):
+    """Why ``parent_id`` can't be the parent of ``env`` as (message, status), or None.
+
+    Children inherit the parent's variables and secrets, so only its owner
+    (or an admin) may attach to it.
+    """
+    if parent_id is None:
+        return None
+    parent = Environment.query.get(parent_id) if isinstance(parent_id, int) else None
+    if parent is None:
+        return 'Parent environment not found', 400
+    if not current_user.is_authenticated or (
+        parent.created_by_id != current_user.id and current_user.role != 'admin'
+    ):
+        return 'Insufficient permissions', 403
+    ancestor, depth = parent, 1
+    while ancestor is not None:
+        if env is not None and ancestor.id == env.id:
+            return 'An environment cannot inherit from itself or its descendants', 400
+        if depth >= env_snapshots.MAX_DEPTH:
+            return f'Environments can only be nested {env_snapshots.MAX_DEPTH} deep', 400
+        ancestor, depth = ancestor.parent, depth + 1
+    return None
 
 @api_bp.post('/api/environments')
 def create_environment():
     data = request.get_json() or {}
-    env = Environment(name=data.get('name', 'New Environment'), description=data.get('description', ''))
+    try:
+        options = _environment_options(data.get('options'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    error = _parent_error(data.get('parent_id'))
+    if error:
+        return jsonify({'error': error[0]}), error[1]
+    env = Environment(
+        name=data.get('name', 'New Environment'),
+        description=data.get('description', ''),
+        parent_id=data.get('parent_id'),
+        options=options,
+        created_by_id=current_user.id if current_user.is_authenticated else None,
+    )
     db.session.add(env)
     db.session.commit()
     return jsonify({'id': env.id}), 201
 
+@api_bp.put('/api/environments/<int:env_id>')
+def update_environment(env_id: int):
+    data = request.get_json() or {}
+    env = Environment.query.get_or_404(env_id)
+    env.name = data.get('name', env.name)
+    env.description = data.get('description', env.description)
+    if 'options' in data:
+        try:
+            env.options = _environment_options(data['options'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    if 'parent_id' in data and data['parent_id'] != env.parent_id:
+        error = _parent_error(data['parent_id'], env)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+        env.parent_id = data['parent_id']
+    db.session.commit()
+    return jsonify({'id': env.id, 'version': env.version})
+
+@api_bp.get('/api/environments/<int:env_id>/snapshot')
+def get_environment_snapshot(env_id: int):
+    # Flattened variables including inherited ones, secrets masked
+    snapshot = env_snapshots.get_snapshot(env_id)
+    if snapshot is None:
+        return jsonify({'error': 'Environment not found'}), 404
+    return jsonify({
+        'id': snapshot.id,
+        'environment_id': snapshot.environment_id,
+        'variables': snapshot.mask(),
+        'secret_keys': sorted(snapshot.secret_keys)
+    })
+
 # Requests
 @api_bp.get('/api/requests')
+@conditional('request')
 def list_requests():
-    rows = RequestModel.query.order_by(RequestModel.created_at.desc()).all()
-    return jsonify([
-        {
-            'id': r.id,
-            'name': r.name,
-            'method': r.method,
-            'url': r.url,
-            'headers': r.headers,
-            'body': r.body,
-            'payload_type': r.payload_type
-        } for r in rows
-    ])
+    # Summaries by default; bodies and scripts only when asked for via ?fields=
+    fields = requested_fields(REQUEST_SUMMARY, REQUEST_GETTERS)
+    query = load_columns(RequestModel.query, fields, REQUEST_COLUMNS)
+    rows, next_cursor = keyset_page(query, RequestModel.id, descending=True)
+    return list_response([project(r, fields, REQUEST_GETTERS) for r in rows], next_cursor)
+
+@api_bp.get('/api/requests/<int:req_id>')
+@conditional('request')
+def get_request(req_id: int):
+    req = RequestModel.query.get_or_404(req_id)
+    return jsonify(project(req, REQUEST_GETTERS, REQUEST_GETTERS))
+
+def _request_options(options):
+    """Validate request options (positive timeouts in seconds, retry/coalesce policies)"""
+    options = options or {}
+    if not isinstance(options, dict) or set(options) - set(REQUEST_OPTIONS):
+        raise ValueError(f"options may only contain: {', '.join(REQUEST_OPTIONS)}")
+    for key, value in options.items():
+        if key in OPTION_POLICIES:
+            if value is not None:
+                _policy_option(key, value)
+        elif value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0):
+            raise ValueError(f'{key} must be a positive number of seconds')
+    return {k: v for k, v in options.items() if v is not None}
 
 @api_bp.post('/api/requests')
 def create_request():
     data = request.get_json() or {}
+    try:
+        options = _request_options(data.get('options'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     r = RequestModel(
         name=data.get('name', 'New Request'),
         method=data.get('method', 'GET'),
@@ -84,6 +323,7 @@ def create_request():
         payload_type=data.get('payload_type', 'json'),
         pre_script=data.get('pre_script', ''),
         post_script=data.get('post_script', ''),
+        options=options,
     )
     db.session.add(r)
     db.session.commit()
@@ -101,6 +341,11 @@ def update_request(req_id: int):
     req.payload_type = data.get('payload_type', req.payload_type)
     req.pre_script = data.get('pre_script', req.pre_script)
     req.post_script = data.get('post_script', req.post_script)
+    if 'options' in data:
+        try:
+            req.options = _request_options(data['options'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
     db.session.commit()
     return jsonify({'id': req.id})
 
@@ -112,22 +357,53 @@ def delete_request(req_id: int):
     return jsonify({'success': True})
 
 @api_bp.post('/api/requests/<int:req_id>/send')
+@tracing.traced('request.send')
 def send_request(req_id: int):
     data = request.get_json() or {}
     env_id = data.get('environment_id')
     req = RequestModel.query.get_or_404(req_id)
-    env = Environment.query.get(env_id) if env_id else None
-    result = send_http_request(req, env)
+    snapshot = env_snapshots.get_snapshot(env_id) if env_id else None
+    result = backends.load('http').send_http_request(req, snapshot)
+    with tracing.span('persist'):
+        run_history.record(req.id, snapshot.environment_id if snapshot else None, result)
+        db.session.commit()
     return jsonify(result)
 
+@api_bp.get('/api/requests/<int:req_id>/runs')
+def list_request_runs(req_id: int):
+    """Send history with per-phase timings, newest first"""
+    RequestModel.query.get_or_404(req_id)
+    fields = requested_fields(REQUEST_RUN_SUMMARY, REQUEST_RUN_GETTERS)
+    query = load_columns(RequestRun.query.filter_by(request_id=req_id), fields, REQUEST_RUN_COLUMNS)
+    rows, next_cursor = keyset_page(query, RequestRun.id, descending=True)
+    return list_response([project(r, fields, REQUEST_RUN_GETTERS) for r in rows], next_cursor)
+
+@api_bp.get('/api/requests/<int:req_id>/runs/<int:run_id>')
+def get_request_run(req_id: int, run_id: int):
+    run = RequestRun.query.filter_by(request_id=req_id, id=run_id).first_or_404()
+    item = project(run, REQUEST_RUN_GETTERS, REQUEST_RUN_GETTERS)
+    item['response'] = artifacts.unpack(run.artifact)
+    item['stored_size'] = len(run.artifact) if run.artifact else None
+    item['artifact_size'] = run.artifact_size
+    return jsonify(item)
+
+@api_bp.get('/api/responses/<handle>')
+def download_response(handle: str):
+    """Full body of a response that was too large to return inline"""
+    path = response_capture.spill_path(handle)
+    if path is None:
+        return jsonify({'error': 'Response body not found or expired'}), 404
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=f'response-{handle}.bin')
+
 # Actions
 @api_bp.get('/api/actions')
+@conditional('action')
 def list_actions():
-    rows = ActionModel.query.all()
-    return jsonify([
-        {'id': a.id, 'name': a.name, 'description': a.description, 'language': a.language}
-        for a in rows
-    ])
+    fields = requested_fields(ACTION_SUMMARY, ACTION_GETTERS)
+    query = load_columns(ActionModel.query, fields, ACTION_COLUMNS)
+    rows, next_cursor = keyset_page(query, ActionModel.id)
+    return list_response([project(a, fields, ACTION_GETTERS) for a in rows], next_cursor)
 
 @api_bp.post('/api/actions')
 def create_action():
@@ -145,42 +421,125 @@ def create_action():
 @api_bp.post('/api/actions/<int:action_id>/run')
 def run_action(action_id: int):
     # For demo, run a Selenium login demo regardless of action code
-    result = run_selenium_action_demo()
+    result = backends.load('selenium').run_selenium_action_demo()
     return jsonify(result)
 
 # Scenarios
 @api_bp.get('/api/scenarios')
+@conditional('scenario')
 def list_scenarios():
-    rows = Scenario.query.all()
-    return jsonify([
-        {
-            'id': s.id,
-            'name': s.name,
-            'description': s.description,
-            'steps': [
-                {
-                    'id': st.id,
-                    'order': st.order,
-                    'step_type': st.step_type,
-                    'ref_id': st.ref_id
-                } for st in s.steps
-            ]
-        } for s in rows
-    ])
+    fields = requested_fields(SCENARIO_SUMMARY, SCENARIO_GETTERS)
+    query = load_columns(Scenario.query, fields, SCENARIO_COLUMNS)
+    if 'steps' in fields:
+        query = query.options(selectinload(Scenario.steps))
+    rows, next_cursor = keyset_page(query, Scenario.id)
+    return list_response([project(s, fields, SCENARIO_GETTERS) for s in rows], next_cursor)
 
 @api_bp.post('/api/scenarios/<int:scenario_id>/run')
+@tracing.traced('scenario.run')
 def run_scenario(scenario_id: int):
     s = Scenario.query.get_or_404(scenario_id)
-    results = []
-    env = Environment.query.first()
-    for step in s.steps:
-        if step.step_type == 'request':
-            req = RequestModel.query.get(step.ref_id)
-            if req:
-                results.append({'step': step.id, 'result': send_http_request(req, env)})
-        elif step.step_type == 'action':
-            results.append({'step': step.id, 'result': run_selenium_action_demo()})
-    return jsonify({'scenario_id': s.id, 'results': results})
+    data = request.get_json(silent=True) or {}
+    engine = data.get('engine', 'threads')
+    if engine not in load_test.ENGINES:
+        return jsonify({'error': "engine must be 'threads' or 'async'"}), 400
+    env_id = data.get('environment_id')
+    # Pin one snapshot so every step sees the same variables
+    snapshot = env_snapshots.get_snapshot(env_id) if env_id else env_snapshots.default_snapshot()
+    tape = _run_tape(data, 'scenario', s.id, snapshot)
+    with recordings.use(tape):
+        result = scenario_runner.run_scenario(s, snapshot, engine)
+    with tracing.span('persist'):
+        _finish_tape(tape, result)
+        request_steps = {st.id: st.ref_id for st in s.steps if st.step_type == 'request'}
+        for step_result in result['results']:
+            if step_result['step'] in request_steps:
+                run_history.record(request_steps[step_result['step']], snapshot.environment_id if snapshot else None,
+                                   step_result['result'], source='scenario')
+        db.session.commit()
+    result['trace_id'] = tracing.trace_id()
+    return jsonify(result)
+
+# Traces
+def _may_view_trace(user_id):
+    # Traces of anonymous calls may carry anyone's data: admins only
+    return current_user.role == 'admin' or (user_id is not None and user_id == current_user.id)
+
+@api_bp.get('/api/traces')
+@require_auth
+def list_traces():
+    """Recent traces of this worker, newest first"""
+    return jsonify({'items': [t for t in tracing.recent() if _may_view_trace(t['user_id'])]})
+
+@api_bp.get('/api/traces/<trace_id>')
+@require_auth
+def get_trace(trace_id: str):
+    """Span tree of a run (trace_id from a run response or its X-Trace-Id header)"""
+    found = tracing.get_trace(trace_id)
+    if found is None or not _may_view_trace(found['user_id']):
+        return jsonify({'error': 'Trace not found'}), 404
+    return jsonify(found)
+
+# Record / Replay
+RECORDING_GETTERS, RECORDING_COLUMNS = column_fields(Recording, [
+    'id', 'name', 'source_type', 'source_id', 'environment_id', 'exchange_count', 'created_by_id', 'created_at'
+])
+RECORDING_SUMMARY = ('id', 'name', 'source_type', 'source_id', 'exchange_count', 'created_at')
+
+def _run_tape(data, source_type, source_id, snapshot):
+    """Tape for a scenario/suite run: {"record": true} or {"replay": <recording id>}"""
+    if data.get('replay'):
+        recording = Recording.query.get_or_404(int(data['replay']))
+        return recordings.Tape.load(recording, simulate_latency=bool(data.get('simulate_latency')))
+    if data.get('record'):
+        recording = Recording(
+            name=data.get('recording_name') or f'{source_type} {source_id}',
+            source_type=source_type,
+            source_id=source_id,
+            environment_id=snapshot.environment_id if snapshot else None,
+            created_by_id=current_user.id if current_user.is_authenticated else None,
+        )
+        db.session.add(recording)
+        db.session.flush()
+        return recordings.Tape(recording.id)
+    return None
+
+def _finish_tape(tape, result):
+    """Store what a recording run captured / report replay hits (the caller commits)"""
+    if tape is None:
+        return
+    if tape.replaying:
+        result['replay'] = tape.stats()
+    else:
+        db.session.get(Recording, tape.recording_id).exchange_count = tape.save()
+        result['recording_id'] = tape.recording_id
+
+@api_bp.get('/api/recordings')
+def list_recordings():
+    fields = requested_fields(RECORDING_SUMMARY, RECORDING_GETTERS)
+    query = load_columns(Recording.query, fields, RECORDING_COLUMNS)
+    rows, next_cursor = keyset_page(query, Recording.id, descending=True)
+    return list_response([project(r, fields, RECORDING_GETTERS) for r in rows], next_cursor)
+
+@api_bp.get('/api/recordings/<int:recording_id>')
+def get_recording(recording_id: int):
+    recording = Recording.query.get_or_404(recording_id)
+    item = project(recording, RECORDING_GETTERS, RECORDING_GETTERS)
+    item['exchanges'] = [
+        {'id': e.id, 'method': e.method, 'url': e.url, 'status': e.status, 'elapsed_ms': e.elapsed_ms}
+        for e in db.session.query(
+            RecordedExchange.id, RecordedExchange.method, RecordedExchange.url,
+            RecordedExchange.status, RecordedExchange.elapsed_ms
+        ).filter_by(recording_id=recording_id).order_by(RecordedExchange.id)
+    ]
+    return jsonify(item)
+
+@api_bp.delete('/api/recordings/<int:recording_id>')
+def delete_recording(recording_id: int):
+    recording = Recording.query.get_or_404(recording_id)
+    db.session.delete(recording)
+    db.session.commit()
+    return jsonify({'success': True})
 
 # Authentication Routes
 @api_bp.post('/api/auth/register')
@@ -219,28 +578,30 @@ def get_current_user():
     })
 
 # Snippets Management
-@api_bp.get('/api/snippets')
-def list_snippets():
+def _visible_snippets():
     if current_user.is_authenticated:
         # Show user's snippets + public snippets
-        snippets = Snippet.query.filter(
+        return Snippet.query.filter(
             (Snippet.created_by_id == current_user.id) | (Snippet.is_public == True)
-        ).all()
-    else:
-        # Show only public snippets
-        snippets = Snippet.query.filter_by(is_public=True).all()
-    
-    return jsonify([{
-        'id': s.id,
-        'name': s.name,
-        'description': s.description,
-        'category': s.category,
-        'language': s.language,
-        'code': s.code,
-        'tags': s.tags,
-        'is_public': s.is_public,
-        'created_by': s.created_by.username if s.created_by else 'System'
-    } for s in snippets])
+        )
+    # Show only public snippets
+    return Snippet.query.filter_by(is_public=True)
+
+@api_bp.get('/api/snippets')
+@conditional('snippet', 'user', per_user=True)
+def list_snippets():
+    # Summaries by default; code only when asked for via ?fields=
+    fields = requested_fields(SNIPPET_SUMMARY, SNIPPET_GETTERS)
+    query = load_columns(_visible_snippets(), fields, SNIPPET_COLUMNS)
+    if 'created_by' in fields:
+        query = query.options(selectinload(Snippet.created_by))
+    snippets, next_cursor = keyset_page(query, Snippet.id)
+    return list_response([project(s, fields, SNIPPET_GETTERS) for s in snippets], next_cursor)
+
+@api_bp.get('/api/snippets/<int:snippet_id>')
+def get_snippet(snippet_id: int):
+    snippet = _visible_snippets().filter(Snippet.id == snippet_id).first_or_404()
+    return jsonify(project(snippet, SNIPPET_GETTERS, SNIPPET_GETTERS))
 
 @api_bp.post('/api/snippets')
 @require_auth
@@ -289,23 +650,16 @@ def delete_snippet(snippet_id: int):
 @api_bp.get('/api/database-connections')
 @require_auth
 def list_database_connections():
-    connections = DatabaseConnection.query.filter_by(created_by_id=current_user.id).all()
-    return jsonify([{
-        'id': c.id,
-        'name': c.name,
-        'db_type': c.db_type,
-        'host': c.host,
-        'port': c.port,
-        'database_name': c.database_name,
-        'username': c.username,
-        'is_active': c.is_active
-    } for c in connections])
+    fields = requested_fields(DB_CONNECTION_SUMMARY, DB_CONNECTION_GETTERS)
+    query = load_columns(DatabaseConnection.query.filter_by(created_by_id=current_user.id), fields, DB_CONNECTION_COLUMNS)
+    connections, next_cursor = keyset_page(query, DatabaseConnection.id)
+    return list_response([project(c, fields, DB_CONNECTION_GETTERS) for c in connections], next_cursor)
 
 @api_bp.post('/api/database-connections')
 @require_auth
 def create_database_connection():
     data = request.get_json() or {}
-    oracle_client = OracleClient()
+    oracle_client = backends.load('oracle').OracleClient()
     
     # Encrypt password
     encrypted_password = oracle_client.encrypt_password(data.get('password', ''))
@@ -329,7 +683,7 @@ def create_database_connection():
 @require_auth
 def test_database_connection(conn_id: int):
     connection = DatabaseConnection.query.filter_by(id=conn_id, created_by_id=current_user.id).first_or_404()
-    oracle_client = OracleClient()
+    oracle_client = backends.load('oracle').OracleClient()
     
     config = {
         'host': connection.host,
@@ -352,7 +706,7 @@ def execute_sql_query(conn_id: int):
     if not query:
         return jsonify({'success': False, 'error': 'Query is required'}), 400
     
-    oracle_client = OracleClient()
+    oracle_client = backends.load('oracle').OracleClient()
     config = {
         'host': connection.host,
         'port': connection.port,
@@ -368,15 +722,10 @@ def execute_sql_query(conn_id: int):
 @api_bp.get('/api/selenium-actions')
 @require_auth
 def list_selenium_actions():
-    actions = SeleniumAction.query.filter_by(created_by_id=current_user.id).all()
-    return jsonify([{
-        'id': a.id,
-        'name': a.name,
-        'description': a.description,
-        'browser': a.browser,
-        'language': a.language,
-        'dependencies': a.dependencies
-    } for a in actions])
+    fields = requested_fields(SELENIUM_ACTION_SUMMARY, SELENIUM_ACTION_GETTERS)
+    query = load_columns(SeleniumAction.query.filter_by(created_by_id=current_user.id), fields, SELENIUM_ACTION_COLUMNS)
+    actions, next_cursor = keyset_page(query, SeleniumAction.id)
+    return list_response([project(a, fields, SELENIUM_ACTION_GETTERS) for a in actions], next_cursor)
 
 @api_bp.post('/api/selenium-actions')
 @require_auth
@@ -401,36 +750,35 @@ def execute_selenium_action(action_id: int):
     action = SeleniumAction.query.filter_by(id=action_id, created_by_id=current_user.id).first_or_404()
     
     if action.language == 'java':
-        runner = JavaSeleniumRunner()
+        runner = backends.load('java_selenium').JavaSeleniumRunner()
         result = runner.execute_java_selenium(action.code, action.dependencies)
     else:
         # Fall back to Python Selenium
-        result = run_selenium_action_demo()
+        result = backends.load('selenium').run_selenium_action_demo()
     
     return jsonify(result)
 
 # Test Cases and Suites
 @api_bp.get('/api/test-cases')
 @require_auth
+@conditional('test_case', 'user', per_user=True)
 def list_test_cases():
-    # User's test cases + public ones + shared with user
-    user_cases = TestCase.query.filter_by(created_by_id=current_user.id).all()
-    public_cases = TestCase.query.filter_by(is_public=True).all()
-    shared_cases = db.session.query(TestCase).join(TestCaseShare).filter(
-        TestCaseShare.shared_with_id == current_user.id
-    ).all()
-    
-    all_cases = list(set(user_cases + public_cases + shared_cases))
-    
-    return jsonify([{
-        'id': tc.id,
-        'name': tc.name,
-        'description': tc.description,
-        'test_type': tc.test_type,
-        'is_public': tc.is_public,
-        'created_by': tc.created_by.username,
-        'can_edit': tc.created_by_id == current_user.id
-    } for tc in all_cases])
+    fields = requested_fields(TEST_CASE_SUMMARY, list(TEST_CASE_GETTERS) + ['can_edit', 'can_execute'])
+    # User's test cases + public ones + shared with user, merged in one query
+    query = TestCase.query.filter(AuthService.visibility_filter('test_case', current_user.id))
+    query = load_columns(query, fields, TEST_CASE_COLUMNS)
+    if 'created_by' in fields:
+        query = query.options(selectinload(TestCase.created_by))
+    cases, next_cursor = keyset_page(query, TestCase.id)
+
+    # Row permissions for the whole page in one query
+    permissions = AuthService.permissions_for('test_case', [tc.id for tc in cases])
+    getters = dict(
+        TEST_CASE_GETTERS,
+        can_edit=lambda tc: 'write' in permissions[tc.id],
+        can_execute=lambda tc: 'execute' in permissions[tc.id],
+    )
+    return list_response([project(tc, fields, getters) for tc in cases], next_cursor)
 
 @api_bp.post('/api/test-cases')
 @require_auth
@@ -445,10 +793,36 @@ def create_test_case():
         is_public=data.get('is_public', False),
         created_by_id=current_user.id
     )
+    try:
+        assertions.compile_case(test_case)
+    except assertions.AssertionSyntaxError as e:
+        return jsonify({'error': str(e)}), 400
     db.session.add(test_case)
     db.session.commit()
     return jsonify({'id': test_case.id}), 201
 
+@api_bp.put('/api/test-cases/<int:case_id>')
+@require_auth
+def update_test_case(case_id: int):
+    test_case = TestCase.query.get_or_404(case_id)
+    if not AuthService.has_permission('test_case', case_id, 'write'):
+        return jsonify({'error': 'Insufficient permissions'}), 403
+    data = request.get_json() or {}
+    test_case.name = data.get('name', test_case.name)
+    test_case.description = data.get('description', test_case.description)
+    test_case.test_type = data.get('test_type', test_case.test_type)
+    test_case.test_data = data.get('test_data', test_case.test_data)
+    test_case.expected_result = data.get('expected_result', test_case.expected_result)
+    if test_case.created_by_id == current_user.id:
+        test_case.is_public = data.get('is_public', test_case.is_public)
+    try:
+        assertions.compile_case(test_case)
+    except assertions.AssertionSyntaxError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
+    return jsonify({'id': test_case.id})
+
 @api_bp.post('/api/test-cases/<int:case_id>/share')
 @require_auth
 def share_test_case(case_id: int):
@@ -481,28 +855,56 @@ def share_test_case(case_id: int):
     db.session.commit()
     return jsonify({'success': True})
 
+@api_bp.post('/api/test-cases/<int:case_id>/run')
+@require_auth
+def run_test_case(case_id: int):
+    test_case = TestCase.query.get_or_404(case_id)
+    if not AuthService.has_permission('test_case', case_id, 'execute'):
+        return jsonify({'error': 'Insufficient permissions'}), 403
+    data = request.get_json(silent=True) or {}
+    env_id = data.get('environment_id')
+    snapshot = env_snapshots.get_snapshot(env_id) if env_id else env_snapshots.default_snapshot()
+    return jsonify(suite_runner.run_test_case(test_case, snapshot))
+
 # Test Suites
 @api_bp.get('/api/test-suites')
 @require_auth
+@conditional('test_suite', 'user', per_user=True)
 def list_test_suites():
-    # User's test suites + public ones + shared with user
-    user_suites = TestSuite.query.filter_by(created_by_id=current_user.id).all()
-    public_suites = TestSuite.query.filter_by(is_public=True).all()
-    shared_suites = db.session.query(TestSuite).join(TestSuiteShare).filter(
-        TestSuiteShare.shared_with_id == current_user.id
-    ).all()
-    
-    all_suites = list(set(user_suites + public_suites + shared_suites))
-    
-    return jsonify([{
-        'id': ts.id,
-        'name': ts.name,
-        'description': ts.description,
-        'is_public': ts.is_public,
-        'created_by': ts.created_by.username,
-        'test_count': len(ts.test_cases),
-        'can_edit': ts.created_by_id == current_user.id
-    } for ts in all_suites])
+    fields = requested_fields(TEST_SUITE_SUMMARY, list(TEST_SUITE_GETTERS) + ['test_count', 'can_edit', 'can_execute'])
+    if 'test_count' in fields:
+        test_count = (
+            db.select(func.count(TestSuiteCase.id))
+            .where(TestSuiteCase.test_suite_id == TestSuite.id)
+            .correlate(TestSuite)
+            .scalar_subquery()
+        )
+    else:
+        test_count = null()
+    # User's test suites + public ones + shared with user, merged in one query
+    query = db.session.query(TestSuite, test_count.label('test_count')).filter(
+        AuthService.visibility_filter('test_suite', current_user.id)
+    )
+    query = load_columns(query, fields, TEST_SUITE_COLUMNS)
+    if 'created_by' in fields:
+        query = query.options(selectinload(TestSuite.created_by))
+    rows, next_cursor = keyset_page(query, TestSuite.id, key=lambda row: row.TestSuite.id)
+
+    # Row permissions for the whole page in one query
+    permissions = AuthService.permissions_for('test_suite', [row.TestSuite.id for row in rows])
+    getters = dict(
+        TEST_SUITE_GETTERS,
+        can_edit=lambda ts: 'write' in permissions[ts.id],
+        can_execute=lambda ts: 'execute' in permissions[ts.id],
+    )
+    suite_fields = [f for f in fields if f != 'test_count']
+    items = []
+    for row in rows:
+        item = project(row.TestSuite, suite_fields, getters)
+        if 'test_count' in fields:
+            item['test_count'] = row.test_count
+        items.append(item)
+    return list_response(items, next_cursor)
 
 @api_bp.post('/api/test-suites')
 @require_auth
@@ -518,6 +920,223 @@ def create_test_suite():
     db.session.commit()
     return jsonify({'id': test_suite.id}), 201
 
+@api_bp.post('/api/test-suites/<int:suite_id>/run')
+@require_auth
+@tracing.traced('suite.run')
+def run_test_suite(suite_id: int):
+    test_suite = TestSuite.query.get_or_404(suite_id)
+    if not AuthService.has_permission('test_suite', suite_id, 'execute'):
+        return jsonify({'error': 'Insufficient permissions'}), 403
+    data = request.get_json(silent=True) or {}
+    engine = data.get('engine', 'threads')
+    if engine not in load_test.ENGINES:
+        return jsonify({'error': "engine must be 'threads' or 'async'"}), 400
+    env_id = data.get('environment_id')
+    # Pin one snapshot for the whole suite; unexecutable cases are reported as skipped
+    snapshot = env_snapshots.get_snapshot(env_id) if env_id else env_snapshots.default_snapshot()
+    tape = _run_tape(data, 'suite', suite_id, snapshot)
+    with recordings.use(tape):
+        result = suite_runner.run_test_suite(test_suite, snapshot, engine)
+    with tracing.span('persist'):
+        _finish_tape(tape, result)
+        db.session.commit()
+    result['trace_id'] = tracing.trace_id()
+    return jsonify(result)
+
+# Load Testing
+LOAD_TEST_GETTERS, LOAD_TEST_COLUMNS = column_fields(LoadTestRun, [
+    'id', 'target_type', 'target_id', 'environment_id', 'config', 'status', 'results',
+    'created_at', 'finished_at'
+])
+LOAD_TEST_SUMMARY = ('id', 'target_type', 'target_id', 'config', 'status', 'created_at', 'finished_at')
+
+
+def _own_load_tests():
+    """Runs the caller may see, stop and compare: their own, or all for admins"""
+    load_test.fail_orphaned_runs_once()
+    if current_user.role == 'admin':
+        return LoadTestRun.query
+    return LoadTestRun.query.filter_by(created_by_id=current_user.id)
+
+
+def _load_test_results(run):
+    runner = load_test.active_runs.get(run.id)
+    return runner.snapshot() if runner else run.results
+
+
+@api_bp.get('/api/load-tests')
+@require_auth
+def list_load_tests():
+    fields = requested_fields(LOAD_TEST_SUMMARY, LOAD_TEST_GETTERS)
+    query = load_columns(_own_load_tests(), fields, LOAD_TEST_COLUMNS)
+    target_type = request.args.get('target_type')
+    if target_type:
+        query = query.filter_by(target_type=target_type, target_id=request.args.get('target_id', type=int))
+    rows, next_cursor = keyset_page(query, LoadTestRun.id, descending=True)
+    return list_response([project(r, fields, LOAD_TEST_GETTERS) for r in rows], next_cursor)
+
+@api_bp.post('/api/load-tests')
+@require_auth
+def start_load_test():
+    data = request.get_json() or {}
+    try:
+        config = load_test.LoadTestConfig.from_dict(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    if config.engine == 'async':
+        backends.load('async_http')  # fail fast with 503 when aiohttp is missing
+    env_id = data.get('environment_id')
+    snapshot = env_snapshots.get_snapshot(env_id) if env_id else env_snapshots.default_snapshot()
+
+    target_type, target_id = data.get('target_type', 'request'), data.get('target_id')
+    if target_type == 'request':
+        iteration = load_test.request_iteration(RequestModel.query.get_or_404(target_id), snapshot, config.engine)
+    elif target_type == 'scenario':
+        scenario = Scenario.query.get_or_404(target_id)
+        # Only request steps generate load; actions are skipped
+        request_ids = [st.ref_id for st in scenario.steps if st.step_type == 'request']
+        requests_by_id = {r.id: r for r in RequestModel.query.filter(RequestModel.id.in_(request_ids))}
+        steps = [requests_by_id[i] for i in request_ids if i in requests_by_id]
+        if not steps:
+            return jsonify({'error': 'Scenario has no request steps'}), 400
+        iteration = load_test.scenario_iteration(steps, snapshot, config.engine)
+    else:
+        return jsonify({'error': "target_type must be 'request' or 'scenario'"}), 400
+
+    run = LoadTestRun(
+        target_type=target_type,
+        target_id=target_id,
+        environment_id=snapshot.environment_id if snapshot else None,
+        config=load_test.config_dict(config),
+        status='running',
+        created_by_id=current_user.id
+    )
+    db.session.add(run)
+    db.session.commit()
+    load_test.start_load_test(current_app._get_current_object(), run, config, iteration)
+    return jsonify({'id': run.id, 'status': run.status, 'config': run.config}), 202
+
+@api_bp.get('/api/load-tests/<int:run_id>')
+@require_auth
+def get_load_test(run_id: int):
+    run = _own_load_tests().filter_by(id=run_id).first_or_404()
+    item = project(run, LOAD_TEST_GETTERS, LOAD_TEST_GETTERS)
+    item['results'] = _load_test_results(run)
+    return jsonify(item)
+
+@api_bp.get('/api/load-tests/<int:run_id>/stream')
+@require_auth
+def stream_load_test(run_id: int):
+    """Server-sent events with live results until the run finishes"""
+    run = _own_load_tests().filter_by(id=run_id).first_or_404()
+    runner = load_test.active_runs.get(run_id)
+
+    def events():
+        if runner is not None:
+            while not runner.done.wait(0.5):
+                yield f"event: progress\ndata: {json.dumps(runner.snapshot())}\n\n"
+            yield f"event: done\ndata: {json.dumps(runner.snapshot())}\n\n"
+            return
+        # Running in another worker: follow the progress it writes to the row
+        row = run
+        while row.status == 'running' and not load_test.is_stale(row):
+            yield f"event: progress\ndata: {json.dumps(row.results)}\n\n"
+            time.sleep(load_test.HEARTBEAT_S)
+            # The stream has its own session; end its read transaction and load the row afresh
+            db.session.rollback()
+            row = db.session.get(LoadTestRun, run_id) or row
+        yield f"event: done\ndata: {json.dumps(row.results)}\n\n"
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@api_bp.post('/api/load-tests/<int:run_id>/stop')
+@require_auth
+def stop_load_test(run_id: int):
+    run = _own_load_tests().filter_by(id=run_id).first_or_404()
+    if run.status != 'running':
+        return jsonify({'success': False, 'error': 'Load test is not running'}), 409
+    # The worker running it polls the flag; stop at once when that is this one
+    run.stop_requested = True
+    db.session.commit()
+    runner = load_test.active_runs.get(run_id)
+    if runner is not None:
+        runner.stop()
+    return jsonify({'success': True})
+
+@api_bp.get('/api/load-tests/compare')
+@require_auth
+def compare_load_tests():
+    base = _own_load_tests().filter_by(id=request.args.get('base', type=int)).first_or_404()
+    other = _own_load_tests().filter_by(id=request.args.get('other', type=int)).first_or_404()
+    return jsonify({
+        'base': {'id': base.id, 'config': base.config},
+        'other': {'id': other.id, 'config': other.config},
+        'metrics': load_test.compare(_load_test_results(base) or {}, _load_test_results(other) or {}),
+    })
+
+# Outbound protection: circuit breakers (per worker process) and throttles
+@api_bp.get('/api/admin/circuit-breakers')
+@require_admin
+def list_circuit_breakers():
+    return jsonify({'items': resilience.breakers()})
+
+@api_bp.post('/api/admin/circuit-breakers/reset')
+@require_admin
+def reset_circuit_breakers():
+    data = request.get_json(silent=True) or {}
+    return jsonify({'success': True, 'reset': resilience.reset(data.get('host'))})
+
+@api_bp.get('/api/admin/throttles')
+@require_admin
+def list_throttles():
+    return jsonify(throttle.stats())
+
+@api_bp.get('/api/admin/profiler')
+@require_admin
+def profiler_status():
+    return jsonify(profiling.sampler.to_dict())
+
+@api_bp.post('/api/admin/profiler/start')
+@require_admin
+def start_profiler():
+    data = request.get_json(silent=True) or {}
+    interval_ms = data.get('interval_ms')
+    if interval_ms is not None and (not isinstance(interval_ms, (int, float)) or interval_ms <= 0):
+        return jsonify({'error': 'interval_ms must be a positive number'}), 400
+    if data.get('reset'):
+        profiling.sampler.reset()
+    profiling.sampler.start(interval_ms)
+    return jsonify(profiling.sampler.to_dict())
+
+@api_bp.post('/api/admin/profiler/stop')
+@require_admin
+def stop_profiler():
+    profiling.sampler.stop()
+    return jsonify(profiling.sampler.to_dict())
+
+@api_bp.delete('/api/admin/profiler')
+@require_admin
+def reset_profiler():
+    profiling.sampler.reset()
+    return jsonify(profiling.sampler.to_dict())
+
+@api_bp.get('/api/admin/profiler/collapsed')
+@require_admin
+def download_collapsed_stacks():
+    endpoint = request.args.get('endpoint')
+    name = (endpoint or 'all').replace('.', '-').replace(':', '-')
+    return Response(profiling.sampler.collapsed(endpoint), mimetype='text/plain',
+                    headers={'Content-Disposition': f'attachment; filename="{name}.collapsed.txt"'})
+
+@api_bp.get('/metrics')
+def metrics_endpoint():
+    # Scrapers do not log in; set METRICS_TOKEN to require "Authorization: Bearer <token>"
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'error': 'Authentication required'}), 401
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 # Trello integration with fallback
 @api_bp.get('/api/trello/boards')
 def trello_boards():
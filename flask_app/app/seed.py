@@ -4,7 +4,7 @@ from .models import (
     User, DatabaseConnection, TestCase, TestSuite, TestSuiteCase, TestCaseShare, TestSuiteShare,
     SeleniumAction, SQLQuery
 )
-from .services.oracle_client import OracleClient
+from .services import backends
 
 def seed_demo_data():
     # Create demo users
@@ -93,7 +93,7 @@ def seed_demo_data():
     db.session.add_all([s1, s2, s3, s4])
 
     # Database Connections
-    oracle_client = OracleClient()
+    oracle_client = backends.load('oracle').OracleClient()
     demo_password = oracle_client.encrypt_password('demo_password')
     
     db1 = DatabaseConnection(
@@ -0,0 +1,143 @@
+import json
+import re
+import struct
+import zlib
+from collections import Counter
+from typing import Any, Iterable, List, Optional, Tuple
+from .. import db
+from ..cache import LRUCache, TTLCache
+from ..models import CompressionDictionary
+from . import backends
+
+# Blob header: codec byte + dictionary id (0 = none)
+_HEADER = struct.Struct('>BI')
+RAW, ZLIB, ZSTD = 0, 1, 2
+
+DICT_SIZE = 32 * 1024  # zlib's preset dictionary window; also used for zstd
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 9
+MIN_SAMPLES = 20
+
+_dictionaries = LRUCache(16, name='dictionaries')  # id -> (algorithm, bytes)
+_current = TTLCache(60)  # 'id' -> newest usable dictionary id (or None)
+_TOKENS = re.compile(rb'"[^"\\]{1,64}"\s*:?|[^",:{}\[\]\s][^",:{}\[\]]{3,63}')
+
+
+def _zstd():
+    """zstandard if installed; run history falls back to zlib without it"""
+    try:
+        return backends.load('zstd')
+    except backends.BackendUnavailable:
+        return None
+
+
+def _dictionary(dict_id: int) -> Tuple[str, bytes]:
+    entry = _dictionaries.get(dict_id)
+    if entry is None:
+        row = db.session.get(CompressionDictionary, dict_id)
+        if row is None:
+            raise ValueError(f'Unknown compression dictionary {dict_id}')
+        entry = (row.algorithm, bytes(row.data))
+        _dictionaries.set(dict_id, entry)
+    return entry
+
+
+def current_dictionary_id() -> Optional[int]:
+    """Newest dictionary usable with the installed codecs"""
+    dict_id = _current.get('id')
+    if dict_id is TTLCache.MISSING:
+        algorithms = ['zlib'] + (['zstd'] if _zstd() else [])
+        dict_id = db.session.query(CompressionDictionary.id).filter(
+            CompressionDictionary.algorithm.in_(algorithms)
+        ).order_by(CompressionDictionary.id.desc()).limit(1).scalar()
+        _current.set('id', dict_id)
+    return dict_id
+
+
+def compress(payload: bytes, dict_id: Optional[int] = None) -> bytes:
+    """Compress a run artifact, with a trained dictionary when given one"""
+    if dict_id:
+        algorithm, data = _dictionary(dict_id)
+    else:
+        zstd = _zstd()
+        algorithm, data, dict_id = ('zstd' if zstd else 'zlib'), None, 0
+
+    if algorithm == 'zstd':
+        zstd = backends.load('zstd')
+        dict_data = zstd.ZstdCompressionDict(data) if data else None
+        body = zstd.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dict_data).compress(payload)
+        codec = ZSTD
+    else:
+        compressor = zlib.compressobj(ZLIB_LEVEL, zdict=data) if data else zlib.compressobj(ZLIB_LEVEL)
+        body = compressor.compress(payload) + compressor.flush()
+        codec = ZLIB
+    if len(body) >= len(payload):
+        return _HEADER.pack(RAW, 0) + payload
+    return _HEADER.pack(codec, dict_id) + body
+
+
+def decompress(blob: bytes) -> bytes:
+    codec, dict_id = _HEADER.unpack_from(blob)
+    body = bytes(blob[_HEADER.size:])
+    data = _dictionary(dict_id)[1] if dict_id else None
+    if codec == RAW:
+        return body
+    if codec == ZLIB:
+        decompressor = zlib.decompressobj(zdict=data) if data else zlib.decompressobj()
+        return decompressor.decompress(body) + decompressor.flush()
+    zstd = backends.load('zstd')
+    dict_data = zstd.ZstdCompressionDict(data) if data else None
+    return zstd.ZstdDecompressor(dict_data=dict_data).decompress(body)
+
+
+def pack(artifact: Any) -> Tuple[bytes, int]:
+    """(compressed blob, uncompressed size) for a JSON-serialisable artifact"""
+    payload = json.dumps(artifact, separators=(',', ':'), default=str).encode('utf-8')
+    return compress(payload, current_dictionary_id()), len(payload)
+
+
+def unpack(blob: Optional[bytes]) -> Any:
+    return json.loads(decompress(blob)) if blob else None
+
+
+def _content_dictionary(samples: List[bytes], size: int) -> bytes:
+    """zlib-style preset dictionary: the fragments shared by most samples.
+
+    Fragments are ranked by how many samples contain them times their
+    length; the most valuable go last, where DEFLATE reaches them with the
+    shortest distances.
+    """
+    counts: Counter = Counter()
+    for sample in samples:
+        counts.update(set(_TOKENS.findall(sample)))
+    ranked = [t for t, n in counts.most_common() if n > 1]
+    ranked.sort(key=lambda t: counts[t] * len(t), reverse=True)
+    chosen, total = [], 0
+    for token in ranked:
+        if total + len(token) > size:
+            break
+        chosen.append(token)
+        total += len(token)
+    return b''.join(reversed(chosen))
+
+
+def train(samples: Iterable[bytes], size: int = DICT_SIZE) -> CompressionDictionary:
+    """Train and store a dictionary from sample payloads (the caller commits)"""
+    samples = [s for s in samples if s]
+    if len(samples) < MIN_SAMPLES:
+        raise ValueError(f'Need at least {MIN_SAMPLES} samples to train a dictionary, got {len(samples)}')
+    zstd = _zstd()
+    if zstd is not None:
+        try:
+            data = zstd.train_dictionary(size, samples).as_bytes()
+        except zstd.ZstdError:
+            # Too few or too uniform samples for the trainer: use a raw-content dictionary
+            data = _content_dictionary(samples, size)
+        algorithm = 'zstd'
+    else:
+        data = _content_dictionary(samples, size)
+        algorithm = 'zlib'
+    row = CompressionDictionary(algorithm=algorithm, data=data, sample_count=len(samples))
+    db.session.add(row)
+    _current.clear()
+    return row
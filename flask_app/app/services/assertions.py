@@ -0,0 +1,431 @@
+import json
+import re
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Tuple
+from ..cache import LRUCache
+
+# Compiled assertions per (case id, updated_at); a saved case gets a new key on every edit
+_compiled = LRUCache(maxsize=4096, name='assertions')
+
+OPERATORS = ('==', '!=', '<=', '>=', '<', '>', '!contains', 'contains', 'matches', 'in', '!exists', 'exists')
+NO_VALUE = ('exists', '!exists')
+# Subjects usable in expected_result lines, with the number of arguments each takes
+SUBJECTS = {
+    'status': 0, 'time_ms': 0, 'body': 0, 'row_count': 0, 'affected_rows': 0, 'rows': 0,
+    'header': 1, 'xpath': 1, 'column': 1, 'cell': 2,
+}
+_NAME = re.compile(r'[A-Za-z_][\w-]*')
+
+
+class AssertionSyntaxError(ValueError):
+    """An assertion that cannot be compiled; the case reports an error"""
+
+
+@dataclass(frozen=True)
+class Assertion:
+    """One compiled check: ``select`` pulls the values it looks at out of a
+    result, ``test`` decides on them. Nothing is parsed at evaluation time.
+    ``many`` selectors (wildcards, slices, recursive descent) are always
+    compared as a list, however many values they match."""
+    label: str
+    select: Callable[['Subject'], List[Any]]
+    test: Callable[[List[Any]], bool]
+    many: bool = False
+
+
+class Subject:
+    """A send/query result as seen by assertions; derived views (lowercased
+    headers, body text, parsed XML) are built on first use and shared by
+    every assertion of the case."""
+
+    def __init__(self, result: Mapping[str, Any]):
+        self.result = result
+        self._headers: Optional[Dict[str, str]] = None
+        self._text: Optional[str] = None
+        self._xml: Any = None
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        if self._headers is None:
+            self._headers = {k.lower(): v for k, v in (self.result.get('headers') or {}).items()}
+        return self._headers
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            data = self.result.get('data')
+            self._text = data if isinstance(data, str) else json.dumps(data, separators=(',', ':'), default=str)
+        return self._text
+
+    @property
+    def xml(self):
+        if self._xml is None:
+            try:
+                self._xml = ET.fromstring(self.text)
+            except ET.ParseError:
+                self._xml = False
+        return self._xml
+
+
+# JSONPath ($, .name, ['name'], [n], [a:b], [*], .*, ..name)
+
+def _walk(node: Any) -> Iterator[Any]:
+    yield node
+    children = node.values() if isinstance(node, dict) else node if isinstance(node, list) else ()
+    for child in children:
+        yield from _walk(child)
+
+
+def _select_children(node: Any, kind: str, arg: Any) -> Iterator[Any]:
+    if kind == 'key':
+        if isinstance(node, dict) and arg in node:
+            yield node[arg]
+    elif kind == 'index':
+        if isinstance(node, list) and -len(node) <= arg < len(node):
+            yield node[arg]
+    elif kind == 'slice':
+        if isinstance(node, list):
+            yield from node[arg]
+    elif isinstance(node, dict):
+        yield from node.values()
+    elif isinstance(node, list):
+        yield from node
+
+
+def _jsonpath_step(kind: str, arg: Any, deep: bool) -> Callable[[List[Any]], List[Any]]:
+    if deep:
+        return lambda nodes: [c for n in nodes for d in _walk(n) for c in _select_children(d, kind, arg)]
+    return lambda nodes: [c for n in nodes for c in _select_children(n, kind, arg)]
+
+
+def compile_jsonpath(path: str) -> Tuple[Callable[[Any], List[Any]], bool]:
+    """(select, whether the path can match more than one value)"""
+    if not path.startswith('$'):
+        raise AssertionSyntaxError(f'JSONPath must start with $: {path}')
+    steps, i, many = [], 1, False
+    while i < len(path):
+        deep = path.startswith('..', i)
+        if deep:
+            i += 2
+        elif path[i] == '.':
+            i += 1
+        elif path[i] != '[':
+            raise AssertionSyntaxError(f'Unexpected {path[i]!r} at {i} in {path}')
+        if i < len(path) and path[i] == '[':
+            end = path.find(']', i)
+            if end < 0:
+                raise AssertionSyntaxError(f'Unclosed [ in {path}')
+            inner, i = path[i + 1:end].strip(), end + 1
+            try:
+                if inner == '*':
+                    kind, arg = '*', None
+                elif len(inner) >= 2 and inner[0] in '\'"' and inner[-1] == inner[0]:
+                    kind, arg = 'key', inner[1:-1]
+                elif ':' in inner:
+                    kind, arg = 'slice', slice(*[int(p) if p.strip() else None for p in inner.split(':')])
+                else:
+                    kind, arg = 'index', int(inner)
+            except (TypeError, ValueError):
+                raise AssertionSyntaxError(f'Bad selector [{inner}] in {path}')
+        elif path.startswith('*', i):
+            kind, arg, i = '*', None, i + 1
+        else:
+            match = _NAME.match(path, i)
+            if not match:
+                raise AssertionSyntaxError(f'Expected a name at {i} in {path}')
+            kind, arg, i = 'key', match.group(), match.end()
+        steps.append(_jsonpath_step(kind, arg, deep))
+        many = many or deep or kind in ('*', 'slice')
+
+    def select(document: Any) -> List[Any]:
+        nodes = [document]
+        for step in steps:
+            nodes = step(nodes)
+        return nodes
+    return select, many
+
+
+def compile_xpath(path: str) -> Tuple[Callable[[Any], List[Any]], bool]:
+    """ElementTree's XPath subset, plus absolute paths and a trailing
+    ``/text()`` or ``/@attr``; element matches yield their text.
+    Returns (select, whether the path has ``//`` or ``*``)."""
+    many = '//' in path or '*' in path
+    extract: Callable[[Any], Any] = lambda el: (el.text or '').strip()
+    if path.endswith('/text()'):
+        path = path[:-len('/text()')]
+    else:
+        attr = re.search(r'/@([\w:-]+)$', path)
+        if attr:
+            name, path = attr.group(1), path[:attr.start()]
+            extract = lambda el: el.get(name)
+    root_tag = None
+    if path.startswith('//'):
+        path = '.' + path
+    elif path.startswith('/'):
+        root_tag, _, rest = path[1:].partition('/')
+        path = './' + rest if rest else '.'
+    try:
+        ET.fromstring('<x/>').findall(path)  # syntax errors surface at compile time
+    except (SyntaxError, KeyError) as e:
+        raise AssertionSyntaxError(f'Bad XPath {path}: {e}')
+
+    def select(root: Any) -> List[Any]:
+        if root is False or (root_tag is not None and root.tag != root_tag):
+            return []
+        return [v for v in (extract(el) for el in root.findall(path)) if v is not None]
+    return select, many
+
+
+# Predicates
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _compile_test(op: str, expected: Any, many: bool = False) -> Callable[[List[Any]], bool]:
+    if op == 'exists':
+        return lambda found: bool(found)
+    if op == '!exists':
+        return lambda found: not found
+    if op == 'matches':
+        try:
+            pattern = re.compile(str(expected))
+        except re.error as e:
+            raise AssertionSyntaxError(f'Bad regex {expected!r}: {e}')
+        compare = lambda actual: pattern.search(
+            actual if isinstance(actual, str) else json.dumps(actual, default=str)) is not None
+    elif op in ('==', '!='):
+        equal = lambda actual: actual == expected or (
+            isinstance(actual, (int, float, str)) and not isinstance(expected, (dict, list))
+            and str(actual) == str(expected))
+        compare = equal if op == '==' else (lambda actual: not equal(actual))
+    elif op in ('<', '<=', '>', '>='):
+        limit = _number(expected)
+        if limit is None:
+            raise AssertionSyntaxError(f'{op} needs a number, got {expected!r}')
+        check = {'<': float.__lt__, '<=': float.__le__, '>': float.__gt__, '>=': float.__ge__}[op]
+        compare = lambda actual: _number(actual) is not None and check(_number(actual), limit)
+    elif op in ('contains', '!contains'):
+        def contains(actual: Any) -> bool:
+            if isinstance(actual, str):
+                return str(expected) in actual
+            if isinstance(actual, dict):
+                # Keys are strings; comparing values avoids hashing a list or object
+                return (isinstance(expected, str) and expected in actual) or expected in actual.values()
+            return isinstance(actual, list) and expected in actual
+        compare = contains if op == 'contains' else (lambda actual: not contains(actual))
+    elif op == 'in':
+        if not isinstance(expected, list):
+            raise AssertionSyntaxError(f'in needs a list, got {expected!r}')
+        compare = lambda actual: actual in expected
+    else:
+        raise AssertionSyntaxError(f'Unknown operator {op!r}')
+    return lambda found: bool(found) and compare(_actual(found, many))
+
+
+def _actual(found: List[Any], many: bool) -> Any:
+    """What a check compares: the list for ``many`` selectors, otherwise
+    one match as itself and several (a plain XPath step) as a list"""
+    return found if many or len(found) != 1 else found[0]
+
+
+def _unordered_rows(rows: Any) -> Any:
+    if not isinstance(rows, list):
+        return rows
+    return sorted((json.dumps(r, sort_keys=True, default=str) for r in rows))
+
+
+def _compile_selector(spec: Mapping[str, Any]) -> Tuple[Callable[[Subject], List[Any]], bool]:
+    """(select, many); see Assertion"""
+    kind = spec.get('type')
+    if kind in ('jsonpath', 'xpath'):
+        select, many = (compile_jsonpath if kind == 'jsonpath' else compile_xpath)(str(spec.get('path', '')))
+        if kind == 'jsonpath':
+            return (lambda s: select(s.result.get('data'))), many
+        return (lambda s: select(s.xml)), many
+    return _compile_value_selector(spec), False
+
+
+def _compile_value_selector(spec: Mapping[str, Any]) -> Callable[[Subject], List[Any]]:
+    kind = spec.get('type')
+    if kind in ('status', 'row_count', 'affected_rows'):
+        return lambda s: [s.result[kind]] if s.result.get(kind) is not None else []
+    if kind == 'time_ms':
+        return lambda s: [(s.result.get('timings') or {}).get('total_ms')] if s.result.get('timings') else []
+    if kind in ('body', 'regex'):
+        return lambda s: [s.text] if s.result.get('data') is not None else []
+    if kind == 'header':
+        name = str(spec.get('name', '')).lower()
+        return lambda s: [s.headers[name]] if name in s.headers else []
+    if kind == 'rows':
+        if spec.get('ordered', True):
+            return lambda s: [s.result['data']] if isinstance(s.result.get('data'), list) else []
+        return lambda s: [_unordered_rows(s.result['data'])] if isinstance(s.result.get('data'), list) else []
+    if kind in ('column', 'cell'):
+        column = spec.get('name' if kind == 'column' else 'column')
+        if not isinstance(column, str):
+            raise AssertionSyntaxError(f'{kind} needs a column name, got {column!r}')
+    if kind == 'column':
+        return lambda s: [[row.get(column) for row in s.result.get('data') or [] if isinstance(row, dict)]]
+    if kind == 'cell':
+        index = spec.get('row', 0)
+        if not isinstance(index, int):
+            raise AssertionSyntaxError(f'cell row must be an integer, got {index!r}')
+
+        def cell(s: Subject) -> List[Any]:
+            rows = s.result.get('data')
+            if (isinstance(rows, list) and -len(rows) <= index < len(rows)
+                    and isinstance(rows[index], dict) and column in rows[index]):
+                return [rows[index][column]]
+            return []
+        return cell
+    raise AssertionSyntaxError(f'Unknown assertion type {kind!r}')
+
+
+def compile_assertion(spec: Mapping[str, Any]) -> Assertion:
+    """Compile a structured assertion, e.g. {"type": "jsonpath", "path": "$.id", "op": "==", "value": 7}"""
+    if not isinstance(spec, Mapping):
+        raise AssertionSyntaxError(f'Assertion must be an object, got {spec!r}')
+    spec = dict(spec)
+    if spec.get('type') == 'regex':
+        spec.setdefault('op', 'matches')
+        spec.setdefault('value', spec.get('pattern'))
+    op = spec.get('op', '==')
+    expected = spec.get('value')
+    if op not in NO_VALUE and 'value' not in spec:
+        raise AssertionSyntaxError(f'Assertion needs a value: {spec}')
+    if spec.get('type') == 'rows' and not spec.get('ordered', True):
+        expected = _unordered_rows(expected)
+    label = spec.get('label') or ' '.join(
+        str(p) for p in (spec.get('type'), spec.get('name') or spec.get('path') or '', op,
+                         '' if op in NO_VALUE else json.dumps(spec.get('value'), default=str)) if p != ''
+    )
+    select, many = _compile_selector(spec)
+    return Assertion(label, select, _compile_test(op, expected, many), many)
+
+
+def _parse_value(text: str) -> Any:
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def parse_line(line: str) -> Optional[Dict[str, Any]]:
+    """One expected_result line as a structured assertion, or None if it is prose.
+
+    ``<subject> <operator> <value>``, e.g. ``status == 201``,
+    ``header Content-Type contains json``, ``$.items[0].id == 42``,
+    ``xpath //user/@id == "7"``, ``body matches ^ok``, ``row_count >= 1``,
+    ``cell 0 NAME == "alice"``, ``column STATUS contains "ACTIVE"``.
+    """
+    head = line.split(None, 1)[0] if line.strip() else ''
+    if head.startswith('$'):
+        spec, arity = {'type': 'jsonpath', 'path': head}, 0
+    elif head in SUBJECTS:
+        spec, arity = {'type': head}, SUBJECTS[head]
+    else:
+        return None
+    # head, its arguments, the operator, then the value (which may contain spaces)
+    parts = line.split(None, arity + 2)
+    if len(parts) < arity + 2 or parts[arity + 1] not in OPERATORS:
+        return None  # "Status updated ...", "$5 refund is issued" are prose
+    args, spec['op'] = parts[1:arity + 1], parts[arity + 1]
+    if head in ('header', 'column'):
+        spec['name'] = args[0]
+    elif head == 'xpath':
+        spec['path'] = args[0]
+    elif head == 'cell':
+        spec['row'] = int(args[0]) if args[0].lstrip('-').isdigit() else args[0]
+        spec['column'] = args[1]
+    if spec['op'] not in NO_VALUE:
+        if len(parts) < arity + 3:
+            raise AssertionSyntaxError(f'Missing value: {line}')
+        spec['value'] = _parse_value(parts[arity + 2].strip())
+    spec['label'] = line.strip()
+    return spec
+
+
+def parse_expected_result(text: Optional[str]) -> List[Dict[str, Any]]:
+    """Assertions written in expected_result. expected_result is free text:
+    lines that do not read as an assertion, or do not compile as one, are
+    notes and yield none."""
+    specs = []
+    for line in (text or '').splitlines():
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        try:
+            spec = parse_line(line.strip())
+            if spec:
+                compile_assertion(spec)
+        except AssertionSyntaxError:
+            continue
+        if spec:
+            specs.append(spec)
+    return specs
+
+
+def case_specs(case) -> List[Dict[str, Any]]:
+    """Every assertion a test case declares, structured form"""
+    data = case.test_data or {}
+    specs: List[Dict[str, Any]] = []
+    # Fields that predate the assertion engine
+    if data.get('expected_status') is not None:
+        specs.append({'type': 'status', 'op': '==', 'value': data['expected_status']})
+    if data.get('expected_min_count'):
+        specs.append({'type': 'row_count', 'op': '>=', 'value': data['expected_min_count']})
+    assertions = data.get('assertions') or []
+    if not isinstance(assertions, list):
+        raise AssertionSyntaxError('test_data.assertions must be a list')
+    specs.extend(assertions)
+    specs.extend(parse_expected_result(case.expected_result))
+    return specs
+
+
+def compile_case(case) -> Tuple[Assertion, ...]:
+    """The case's assertions compiled as it stands, bypassing the cache; use
+    it to validate a new or edited case before saving"""
+    return tuple(compile_assertion(spec) for spec in case_specs(case))
+
+
+def for_case(case) -> Tuple[Assertion, ...]:
+    """The case's compiled assertions, compiled once per saved version"""
+    key = (case.id, case.updated_at) if case.id is not None else None
+    compiled = _compiled.get(key) if key else None
+    if compiled is None:
+        try:
+            compiled = compile_case(case)
+        except AssertionSyntaxError as e:
+            compiled = e  # cached too, so a broken case is not re-parsed on every run
+        if key:
+            _compiled.set(key, compiled)
+    if isinstance(compiled, AssertionSyntaxError):
+        raise compiled
+    return compiled
+
+
+def evaluate(assertions: Tuple[Assertion, ...], result: Mapping[str, Any]) -> Tuple[bool, List[Dict[str, Any]]]:
+    """(all passed, per-assertion report); failures carry the values seen.
+    A check that cannot be applied to the data fails with an ``error``
+    instead of raising, so the other checks and cases still run."""
+    subject = Subject(result)
+    report, passed = [], True
+    for assertion in assertions:
+        found: List[Any] = []
+        try:
+            found = assertion.select(subject)
+            ok, error = assertion.test(found), None
+        except Exception as e:
+            ok, error = False, f'{type(e).__name__}: {e}'
+        entry = {'assertion': assertion.label, 'passed': ok}
+        if not ok:
+            passed = False
+            entry['actual'] = _actual(found, assertion.many) if found else None
+            if error:
+                entry['error'] = error
+        report.append(entry)
+    return passed, report
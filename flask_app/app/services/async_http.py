@@ -0,0 +1,240 @@
+import asyncio
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+import aiohttp
+from aiohttp import compression_utils
+from .. import metrics, tracing
+from ..models import RequestModel
+from .env_snapshots import EnvLike, get_snapshot
+from . import recordings, resilience, response_capture, throttle
+from .http_client import (
+    PreparedRequest,
+    Transfer,
+    coalesce_rule,
+    failed_result,
+    finish_request,
+    negotiate_encoding,
+    prepare_request,
+    record,
+    replayed,
+    retry_policy,
+)
+from .resilience import RetryPolicy
+from .single_flight import AsyncSingleFlight, CoalesceRule
+from .scopes import VariableScope
+from .timing import RequestTimer
+
+MAX_IN_FLIGHT = 1000
+PER_HOST_LIMIT = 100
+
+# Content codings aiohttp can decode here
+ACCEPT_ENCODINGS = tuple(
+    ['gzip', 'deflate']
+    + (['br'] if compression_utils.HAS_BROTLI else [])
+    + (['zstd'] if getattr(compression_utils, 'HAS_ZSTD', False) else [])
+)
+
+
+async def _on_dns_start(session, ctx, params):
+    ctx.dns_started = time.perf_counter()
+
+
+async def _on_dns_end(session, ctx, params):
+    ctx.trace_request_ctx.add('dns_ms', time.perf_counter() - ctx.dns_started)
+
+
+async def _on_connection_start(session, ctx, params):
+    ctx.connect_started = time.perf_counter()
+    ctx.trace_request_ctx.reused = False
+
+
+async def _on_connection_end(session, ctx, params):
+    # aiohttp resolves, connects and handshakes in one step: report TCP + TLS as connect
+    timer = ctx.trace_request_ctx
+    elapsed = time.perf_counter() - ctx.connect_started
+    timer.add('connect_ms', max(0.0, elapsed - timer.phases['dns_ms'] / 1000))
+
+
+def _trace_config() -> aiohttp.TraceConfig:
+    trace = aiohttp.TraceConfig()
+    trace.on_dns_resolvehost_start.append(_on_dns_start)
+    trace.on_dns_resolvehost_end.append(_on_dns_end)
+    trace.on_connection_create_start.append(_on_connection_start)
+    trace.on_connection_create_end.append(_on_connection_end)
+    return trace
+
+
+def _host_key(url: str) -> Tuple[str, str, Optional[int]]:
+    parts = urlsplit(url)
+    return parts.scheme, parts.hostname or '', parts.port
+
+
+class AsyncHttpEngine:
+    """Sends stored requests on one event loop.
+
+    Shares substitution, payload encoding and script hooks with
+    ``send_http_request`` (via ``prepare_request``/``finish_request``), so a
+    request behaves the same on either path. In-flight requests are capped
+    overall and per (scheme, host, port); scripts run in a worker thread
+    because execjs blocks.
+
+    Use as an async context manager on the loop that will send::
+
+        async with AsyncHttpEngine(per_host=50) as engine:
+            results = await engine.send_many([(req, snapshot, None)] * 1000)
+    """
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT, per_host: int = PER_HOST_LIMIT):
+        self.max_in_flight = max_in_flight
+        self.per_host = per_host
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._hosts: Dict[Tuple[str, str, Optional[int]], asyncio.Semaphore] = {}
+        self._flights = AsyncSingleFlight()
+
+    async def __aenter__(self) -> 'AsyncHttpEngine':
+        # limit=0: the semaphores below are the only caps, applied before a connection is taken
+        connector = aiohttp.TCPConnector(limit=0, limit_per_host=0)
+        self._session = aiohttp.ClientSession(connector=connector, trace_configs=[_trace_config()])
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self._session.close()
+        self._session = None
+        self._hosts.clear()
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        key = _host_key(url)
+        semaphore = self._hosts.get(key)
+        if semaphore is None:
+            semaphore = self._hosts[key] = asyncio.Semaphore(self.per_host)
+        return semaphore
+
+    @tracing.spanned('network')
+    async def _transfer(self, prepared: PreparedRequest, policy: RetryPolicy, timer: RequestTimer,
+                        limited: Sequence[throttle.Target] = (), breaker=None) -> Transfer:
+        """Async counterpart of http_client._transfer"""
+        tracing.annotate(method=prepared.method, url=tracing.safe_url(prepared.url))
+        breaker = breaker or resilience.breaker_for(prepared.url)
+        connect_timeout, read_timeout = prepared.timeout
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                # Slots are held per attempt, not across backoff sleeps; the breaker
+                # is asked once the slot is held, as in http_client._transfer
+                async with throttle.async_slot(limited, timer):
+                    breaker.before_call()
+                    async with self._in_flight, self._host_semaphore(prepared.url):
+                        sent = time.perf_counter()
+                        async with self._session.request(
+                            prepared.method, prepared.url, headers=prepared.headers, json=prepared.json,
+                            data=prepared.data, trace_request_ctx=timer,
+                            timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout),
+                        ) as resp:
+                            timer.set_ttfb(time.perf_counter() - sent)
+                            status, headers = resp.status, resp.headers.copy()
+                            tracing.annotate(status=status, attempts=attempt)
+                            if resilience.is_failure(status):
+                                breaker.record_failure()
+                            else:
+                                breaker.record_success()
+                            wait = None
+                            if not breaker.is_open and policy.should_retry(prepared.method, attempt, status):
+                                wait = policy.delay(attempt, headers.get('Retry-After'))
+                            else:
+                                downloading = time.perf_counter()
+                                body = prepared.captured_body(headers.get('Content-Type', ''), resp.charset,
+                                                              headers.get('Content-Encoding'))
+                                try:
+                                    async for chunk in resp.content.iter_chunked(response_capture.CHUNK_SIZE):
+                                        if not body.feed(chunk):
+                                            break
+                                finally:
+                                    body.close()
+                                    body.wire_size = getattr(resp.content, 'total_raw_bytes', None)
+                                finished = time.perf_counter()
+                                timer.add('download_ms', finished - downloading)
+            except resilience.CircuitOpen as e:
+                tracing.annotate(error=str(e), attempts=attempt - 1)
+                return Transfer(attempt - 1, error=str(e), circuit_open=True, network=timer.copy())
+            except throttle.ThrottleUnavailable as e:
+                tracing.annotate(error=str(e), attempts=attempt - 1)
+                return Transfer(attempt - 1, error=str(e), network=timer.copy())
+            except Exception as e:
+                breaker.record_failure()
+                if breaker.is_open or not policy.should_retry(prepared.method, attempt):
+                    if isinstance(e, asyncio.TimeoutError):
+                        error = f'Request timed out (connect {connect_timeout}s, read {read_timeout}s)'
+                    else:
+                        error = str(e) or type(e).__name__
+                    tracing.annotate(error=error, attempts=attempt)
+                    return Transfer(attempt, error=error, network=timer.copy())
+                wait = policy.delay(attempt)
+            if wait is None:
+                return Transfer(attempt, status, headers, body, network=timer.copy(),
+                                elapsed_ms=round((finished - sent) * 1000, 3))
+            await asyncio.sleep(wait)
+
+    @metrics.instrumented('async_http', 'send', ok=lambda result: result.get('ok'))
+    @tracing.spanned('http.send')
+    async def send(self, req: RequestModel, env: EnvLike, scope: Optional[VariableScope] = None,
+                   include_body: bool = True, retry: Optional[RetryPolicy] = None,
+                   coalesce: Optional[CoalesceRule] = None, breaker=None) -> Dict[str, Any]:
+        """Async counterpart of ``send_http_request`` (same arguments and result).
+
+        Coalescing is per engine: identical GETs share a call only with other
+        sends on this engine.
+        """
+        snapshot = get_snapshot(env)
+        if scope is None:
+            scope = VariableScope.for_run(snapshot.variables if snapshot else None)
+        timer = RequestTimer()
+        if (req.pre_script or '').strip():
+            prepared = await asyncio.to_thread(prepare_request, req, scope)
+        else:
+            prepared = prepare_request(req, scope)
+        if not include_body:
+            prepared.skip_body(req.post_script)
+        negotiate_encoding(prepared.headers, ACCEPT_ENCODINGS)
+        policy = retry if retry is not None else retry_policy(req, snapshot)
+        rule = coalesce if coalesce is not None else coalesce_rule(req, snapshot)
+        limited = throttle.targets(prepared.url, snapshot)
+
+        tape = recordings.active()
+        shared = False
+        if tape is not None and tape.replaying:
+            transfer, delay = replayed(tape, prepared, timer)
+            await asyncio.sleep(delay)
+        elif rule.applies(prepared.method):
+            transfer, shared = await self._flights.do(rule.key(prepared),
+                                                      lambda: self._transfer(prepared, policy, timer, limited, breaker))
+            if shared:
+                transfer = transfer.for_follower()
+                timer.adopt(transfer.network)
+                tracing.annotate(coalesced=True)
+        else:
+            transfer = await self._transfer(prepared, policy, timer, limited, breaker)
+        record(tape, prepared, transfer)
+        if transfer.error is not None:
+            result = failed_result(transfer, prepared, timer)
+        else:
+            args = (req, prepared, scope, snapshot, transfer.status, transfer.headers, transfer.body,
+                    include_body, timer)
+            if (req.post_script or '').strip():
+                result = await asyncio.to_thread(finish_request, *args)
+            else:
+                result = finish_request(*args)
+            result['attempts'] = transfer.attempts
+        if shared:
+            result['coalesced'] = True
+        if tape is not None and tape.replaying:
+            result['replayed'] = True
+        return result
+
+    async def send_many(self, calls: Iterable[Tuple[RequestModel, EnvLike, Optional[VariableScope]]]) -> List[Dict[str, Any]]:
+        """Send all calls concurrently; results keep the input order"""
+        return await asyncio.gather(*(self.send(req, env, scope) for req, env, scope in calls))
+
@@ -1,9 +1,20 @@
-from flask import session, request, jsonify
+from flask import session, request, jsonify, g, has_request_context
 from flask_login import login_user, logout_user, login_required, current_user
 from functools import wraps
-from typing import Dict, Any, Optional
-from ..models import User
+from typing import Dict, Any, Iterable, Optional, Set, Tuple
+from sqlalchemy import and_, event, exists, inspect, or_
+from sqlalchemy.orm import make_transient_to_detached
+from ..models import User, TestCase, TestCaseShare, TestSuite, TestSuiteShare
 from .. import db
+from ..cache import TTLCache
+
+PERMISSIONS = ('read', 'write', 'execute')
+
+# resource_type -> (model, share model, share foreign key column name)
+SHAREABLE_RESOURCES = {
+    'test_case': (TestCase, TestCaseShare, 'test_case_id'),
+    'test_suite': (TestSuite, TestSuiteShare, 'test_suite_id'),
+}
 
 class AuthService:
     """Service to handle authentication and authorization"""
@@ -116,6 +127,25 @@ class AuthService:
             return decorated_function
         return decorator
     
+    @staticmethod
+    def shareable_models(resource_type: str) -> Tuple[Any, Any, Any]:
+        """Return (model, share model, share foreign key column) for a resource type"""
+        if resource_type not in SHAREABLE_RESOURCES:
+            raise ValueError(f'Unknown resource type: {resource_type}')
+        model, share_model, fk_name = SHAREABLE_RESOURCES[resource_type]
+        return model, share_model, getattr(share_model, fk_name)
+
+    @staticmethod
+    def visibility_filter(resource_type: str, user_id: int):
+        """SQL predicate for resources owned by, public to, or shared with a user.
+
+        Evaluated as a single query so the database does the merge and
+        deduplication instead of concatenating three result sets in Python.
+        """
+        model, share_model, share_fk = AuthService.shareable_models(resource_type)
+        shared = exists().where(share_fk == model.id, share_model.shared_with_id == user_id)
+        return or_(model.created_by_id == user_id, model.is_public.is_(True), shared)
+
     @staticmethod
     def has_permission(resource_type: str, resource_id: int, permission: str = 'read') -> bool:
         """Check if current user has permission for a resource"""
@@ -126,66 +156,146 @@ class AuthService:
         if current_user.role == 'admin':
             return True
         
+        key = (current_user.id, resource_type, resource_id, permission)
+        request_cache = g.setdefault('permission_cache', {}) if has_request_context() else {}
+        if key in request_cache:
+            return request_cache[key]
+        allowed = permission_cache.get(key)
+        if allowed is TTLCache.MISSING:
+            allowed = AuthService._query_permission(resource_type, resource_id, permission)
+            permission_cache.set(key, allowed)
+        request_cache[key] = allowed
+        return allowed
+
+    @staticmethod
+    def _query_permission(resource_type: str, resource_id: int, permission: str) -> bool:
+        """Resolve ownership, public flag and share in a single query"""
         try:
-            if resource_type == 'test_case':
-                from ..models import TestCase, TestCaseShare
-                
-                # Check ownership
-                test_case = TestCase.query.filter_by(id=resource_id, created_by_id=current_user.id).first()
-                if test_case:
-                    return True
-                
-                # Check if public
-                test_case = TestCase.query.filter_by(id=resource_id, is_public=True).first()
-                if test_case and permission == 'read':
-                    return True
-                
-                # Check sharing
-                share = TestCaseShare.query.filter_by(
-                    test_case_id=resource_id,
-                    shared_with_id=current_user.id
-                ).first()
-                
-                if share:
-                    if permission == 'read':
-                        return True
-                    elif permission == 'write' and share.permission in ['write', 'execute']:
-                        return True
-                    elif permission == 'execute' and share.permission == 'execute':
-                        return True
-            
-            elif resource_type == 'test_suite':
-                from ..models import TestSuite, TestSuiteShare
-                
-                # Check ownership
-                test_suite = TestSuite.query.filter_by(id=resource_id, created_by_id=current_user.id).first()
-                if test_suite:
-                    return True
-                
-                # Check if public
-                test_suite = TestSuite.query.filter_by(id=resource_id, is_public=True).first()
-                if test_suite and permission == 'read':
-                    return True
-                
-                # Check sharing
-                share = TestSuiteShare.query.filter_by(
-                    test_suite_id=resource_id,
-                    shared_with_id=current_user.id
-                ).first()
-                
-                if share:
-                    if permission == 'read':
-                        return True
-                    elif permission == 'write' and share.permission in ['write', 'execute']:
-                        return True
-                    elif permission == 'execute' and share.permission == 'execute':
-                        return True
-            
-            return False
-            
+            model, share_model, share_fk = AuthService.shareable_models(resource_type)
+            row = db.session.query(model.created_by_id, model.is_public, share_model.permission).outerjoin(
+                share_model, and_(share_fk == model.id, share_model.shared_with_id == current_user.id)
+            ).filter(model.id == resource_id).first()
+            if row is None:
+                return False
+            return _grants(row.created_by_id == current_user.id, row.is_public, row.permission, permission)
         except Exception:
             return False
 
+    @staticmethod
+    def permissions_for(resource_type: str, ids: Iterable[int]) -> Dict[int, Set[str]]:
+        """Resolve the current user's permissions for many resources in one query.
+
+        Returns ``{id: {'read', 'write', 'execute'}}`` (a subset, possibly empty)
+        for every requested id; unknown ids map to an empty set. Results also
+        warm the request-level cache used by has_permission.
+        """
+        ids = list(dict.fromkeys(ids))
+        result: Dict[int, Set[str]] = {resource_id: set() for resource_id in ids}
+        if not ids or not current_user.is_authenticated:
+            return result
+        if current_user.role == 'admin':
+            return {resource_id: set(PERMISSIONS) for resource_id in ids}
+
+        model, share_model, share_fk = AuthService.shareable_models(resource_type)
+        rows = db.session.query(model.id, model.created_by_id, model.is_public, share_model.permission).outerjoin(
+            share_model, and_(share_fk == model.id, share_model.shared_with_id == current_user.id)
+        ).filter(model.id.in_(ids)).all()
+
+        request_cache = g.setdefault('permission_cache', {}) if has_request_context() else {}
+        for row in rows:
+            is_owner = row.created_by_id == current_user.id
+            for permission in PERMISSIONS:
+                allowed = _grants(is_owner, row.is_public, row.permission, permission)
+                request_cache[(current_user.id, resource_type, row.id, permission)] = allowed
+                if allowed:
+                    result[row.id].add(permission)
+        return result
+
+
+def _grants(is_owner: bool, is_public: bool, share_permission: Optional[str], permission: str) -> bool:
+    """Owners can do anything, public resources are readable, shares grant their level"""
+    if is_owner:
+        return True
+    if is_public and permission == 'read':
+        return True
+    if share_permission:
+        if permission == 'read':
+            return True
+        if permission == 'write' and share_permission in ['write', 'execute']:
+            return True
+        if permission == 'execute' and share_permission == 'execute':
+            return True
+    return False
+
+
+# Process-wide caches; entries are dropped when shares, ownership or users
+# change in this process, and expire quickly so other workers converge too.
+permission_cache = TTLCache(ttl=5, name='permissions')
+user_cache = TTLCache(ttl=30, name='users')
+
+
+def init_app(app) -> None:
+    permission_cache.ttl = app.config.setdefault('PERMISSION_CACHE_TTL', 5)
+    user_cache.ttl = app.config.setdefault('USER_CACHE_TTL', 30)
+
+
+def load_user_cached(user_id: int) -> Optional[User]:
+    """Flask-Login user loader that skips the per-request User lookup"""
+    cached = user_cache.get(user_id)
+    if cached is TTLCache.MISSING:
+        user = db.session.get(User, user_id)
+        if user is not None:
+            user_cache.set(user_id, _detached_copy(user))
+        return user
+    # Attach a copy of the cached row to this request's session without a query
+    return db.session.merge(cached, load=False)
+
+
+def _detached_copy(user: User) -> User:
+    """Column snapshot of a user that never belongs to a session"""
+    copy = User(**{attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs})
+    make_transient_to_detached(copy)
+    return copy
+
+
+_SHARE_RESOURCES = {
+    'test_case_share': ('test_case', 'test_case_id'),
+    'test_suite_share': ('test_suite', 'test_suite_id'),
+}
+
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_auth_changes(session, flush_context, instances):
+    resources = session.info.setdefault('auth_changed_resources', set())
+    users = session.info.setdefault('auth_changed_users', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table in SHAREABLE_RESOURCES:
+            resources.add((table, obj.id))
+        elif table in _SHARE_RESOURCES:
+            resource_type, fk_name = _SHARE_RESOURCES[table]
+            resources.add((resource_type, getattr(obj, fk_name)))
+        elif table == 'user' and obj.id is not None:
+            users.add(obj.id)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_auth_caches(session):
+    resources = session.info.pop('auth_changed_resources', set())
+    users = session.info.pop('auth_changed_users', set())
+    if resources:
+        permission_cache.invalidate(lambda key: (key[1], key[2]) in resources)
+    if users:
+        permission_cache.invalidate(lambda key: key[0] in users)
+        for user_id in users:
+            user_cache.pop(user_id)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_auth_changes(session):
+    session.info.pop('auth_changed_resources', None)
+    session.info.pop('auth_changed_users', None)
+
 def require_auth(f):
     """Simple authentication decorator"""
     @wraps(f)
@@ -0,0 +1,98 @@
+import importlib
+import importlib.util
+import shutil
+import threading
+from typing import Any, Dict
+
+# Execution backends are imported on first use so API-only workers never pay
+# for selenium, cx_Oracle, cryptography or execjs (and a missing native
+# library only breaks the endpoints that need it, not startup).
+BACKENDS: Dict[str, Dict[str, Any]] = {
+    'http': {
+        'module': 'app.services.http_client',
+        'requires': ['requests'],
+        'description': 'HTTP request sender',
+    },
+    'async_http': {
+        'module': 'app.services.async_http',
+        'requires': ['aiohttp'],
+        'description': 'Asyncio HTTP engine (many concurrent requests per worker)',
+    },
+    'javascript': {
+        'module': 'execjs',
+        'requires': ['execjs'],
+        'description': 'Pre/post request scripts (PyExecJS)',
+    },
+    'zstd': {
+        'module': 'zstandard',
+        'requires': ['zstandard'],
+        'description': 'Dictionary compression of run history (zlib is used without it)',
+    },
+    'selenium': {
+        'module': 'app.services.selenium_actions',
+        'requires': ['selenium', 'webdriver_manager'],
+        'description': 'Python Selenium actions',
+    },
+    'java_selenium': {
+        'module': 'app.services.java_selenium',
+        'requires': [],
+        'executables': ['javac', 'java'],
+        'description': 'Java Selenium actions (javac/java on PATH)',
+    },
+    'oracle': {
+        'module': 'app.services.oracle_client',
+        'requires': ['cx_Oracle', 'cryptography'],
+        'description': 'Oracle database client',
+    },
+}
+
+_loaded: Dict[str, Any] = {}
+_errors: Dict[str, str] = {}
+_lock = threading.Lock()
+
+
+class BackendUnavailable(Exception):
+    """Raised when an execution backend cannot be imported"""
+
+    def __init__(self, name: str, reason: str):
+        super().__init__(f"Backend '{name}' is unavailable: {reason}")
+        self.name = name
+        self.reason = reason
+
+
+def load(name: str):
+    """Import a backend module on first use and return it"""
+    module = _loaded.get(name)
+    if module is not None:
+        return module
+    if name not in BACKENDS:
+        raise BackendUnavailable(name, 'unknown backend')
+
+    with _lock:
+        if name in _loaded:
+            return _loaded[name]
+        try:
+            module = importlib.import_module(BACKENDS[name]['module'])
+        except Exception as e:
+            # Remember the failure for availability(); retried on the next call
+            _errors[name] = f'{type(e).__name__}: {e}'
+            raise BackendUnavailable(name, _errors[name]) from e
+        _errors.pop(name, None)
+        _loaded[name] = module
+        return module
+
+
+def availability() -> Dict[str, Dict[str, Any]]:
+    """Report each backend's state without importing anything new"""
+    report = {}
+    for name, spec in BACKENDS.items():
+        missing = [m for m in spec['requires'] if importlib.util.find_spec(m) is None]
+        missing += [e for e in spec.get('executables', []) if shutil.which(e) is None]
+        report[name] = {
+            'description': spec['description'],
+            'loaded': name in _loaded,
+            'available': not missing and name not in _errors,
+            'missing': missing,
+            'error': _errors.get(name),
+        }
+    return report
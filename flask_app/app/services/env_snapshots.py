@@ -0,0 +1,142 @@
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, Mapping, Optional, Tuple, Union
+from sqlalchemy import event
+from ..models import Environment, EnvironmentVariable
+from .. import db, tracing
+from ..cache import LRUCache
+
+SECRET_MASK = '***'
+MAX_DEPTH = 10  # guards against parent cycles
+
+
+@dataclass(frozen=True)
+class EnvironmentSnapshot:
+    """Immutable, flattened view of an environment at specific versions.
+
+    ``chain`` lists (environment id, version) from the environment itself up
+    to its root ancestor; the snapshot id is derived from it, so any change
+    anywhere in the chain produces a new snapshot.
+    """
+    environment_id: int
+    chain: Tuple[Tuple[int, int], ...]
+    variables: Mapping[str, str]
+    secret_keys: FrozenSet[str]
+    options: Mapping[str, Any] = field(default_factory=lambda: MappingProxyType({}))
+
+    @property
+    def id(self) -> str:
+        return '+'.join(f'{env_id}@{version}' for env_id, version in self.chain)
+
+    def to_dict(self) -> Dict[str, str]:
+        """Mutable copy of the variables for a single run"""
+        return dict(self.variables)
+
+    def mask(self, variables: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+        """Hide secret values (ones still equal to the secret) before returning them to clients"""
+        variables = self.variables if variables is None else variables
+        return {
+            key: SECRET_MASK if key in self.secret_keys and value == self.variables.get(key) else value
+            for key, value in variables.items()
+        }
+
+
+EnvLike = Union[Environment, EnvironmentSnapshot, int, None]
+
+# Snapshots keyed by their chain; old versions simply age out of the LRU
+_snapshots = LRUCache(maxsize=512, name='env_snapshots')
+
+
+def _chain(environment_id: int) -> Tuple[Tuple[int, int], ...]:
+    """(id, version) for the environment and each ancestor, nearest first"""
+    chain = []
+    seen = set()
+    current = environment_id
+    while current is not None and current not in seen and len(chain) < MAX_DEPTH:
+        row = db.session.query(Environment.id, Environment.parent_id, Environment.version).filter(
+            Environment.id == current
+        ).first()
+        if row is None:
+            break
+        seen.add(row.id)
+        chain.append((row.id, row.version))
+        current = row.parent_id
+    return tuple(chain)
+
+
+@tracing.spanned('env_snapshot.build')
+def _build(environment_id: int, chain: Tuple[Tuple[int, int], ...]) -> EnvironmentSnapshot:
+    ids = [env_id for env_id, _ in chain]
+    rows = EnvironmentVariable.query.filter(EnvironmentVariable.environment_id.in_(ids)).all()
+    by_env: Dict[int, list] = {env_id: [] for env_id in ids}
+    for row in rows:
+        by_env[row.environment_id].append(row)
+
+    variables: Dict[str, str] = {}
+    secrets = set()
+    # Root first so children override inherited values
+    for env_id in reversed(ids):
+        for v in by_env[env_id]:
+            variables[v.key] = v.value or ''
+            if v.is_secret:
+                secrets.add(v.key)
+            else:
+                secrets.discard(v.key)
+
+    # Options merge the same way, one level deep so a child can override a
+    # single retry setting without restating the rest
+    option_rows = dict(db.session.query(Environment.id, Environment.options).filter(Environment.id.in_(ids)).all())
+    options: Dict[str, Any] = {}
+    for env_id in reversed(ids):
+        for key, value in (option_rows.get(env_id) or {}).items():
+            if isinstance(value, dict) and isinstance(options.get(key), dict):
+                value = {**options[key], **value}
+            options[key] = value
+    return EnvironmentSnapshot(
+        environment_id=environment_id,
+        chain=chain,
+        variables=MappingProxyType(variables),
+        secret_keys=frozenset(secrets),
+        options=MappingProxyType(options),
+    )
+
+
+def get_snapshot(env: EnvLike) -> Optional[EnvironmentSnapshot]:
+    """Current snapshot for an environment (or pass-through for a snapshot)"""
+    if env is None or isinstance(env, EnvironmentSnapshot):
+        return env
+    environment_id = env.id if isinstance(env, Environment) else int(env)
+    chain = _chain(environment_id)
+    if not chain:
+        return None
+    snapshot = _snapshots.get(chain)
+    if snapshot is None:
+        snapshot = _build(environment_id, chain)
+        _snapshots.set(chain, snapshot)
+    return snapshot
+
+
+def default_snapshot() -> Optional[EnvironmentSnapshot]:
+    """Snapshot of the first environment, used when a run names none"""
+    env_id = db.session.query(Environment.id).order_by(Environment.id).limit(1).scalar()
+    return get_snapshot(env_id) if env_id is not None else None
+
+
+@event.listens_for(db.session, 'before_flush')
+def _bump_environment_versions(session, flush_context, instances):
+    changed = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, EnvironmentVariable):
+            env_id = obj.environment_id or (obj.environment.id if obj.environment else None)
+            if env_id is not None:
+                changed.add(env_id)
+        elif isinstance(obj, Environment) and obj in session.dirty and session.is_modified(obj):
+            changed.add(obj.id)
+    if not changed:
+        return
+    with session.no_autoflush:
+        for env_id in changed:
+            env = session.get(Environment, env_id)
+            if env is not None and env not in session.deleted:
+                # SQL-side increment, so concurrent writers can't lose a bump
+                env.version = Environment.version + 1
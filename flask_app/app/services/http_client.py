@@ -1,14 +1,31 @@
+import json
 import re
-import requests
-import PyExecJS
+import time
 import xml.etree.ElementTree as ET
-from typing import Dict, Any, Optional
+from dataclasses import dataclass, replace
+from typing import Dict, Any, Mapping, Optional, Sequence, Tuple
+from urllib3.util.request import ACCEPT_ENCODING
+from .. import metrics, tracing
 from ..models import RequestModel, Environment
+from . import recordings, resilience, response_capture, single_flight, throttle, timing
+from .env_snapshots import EnvironmentSnapshot, EnvLike, get_snapshot
+from .resilience import RetryPolicy
+from .response_capture import CapturedBody
+from .single_flight import CoalesceRule
+from .scopes import VariableScope
+from .timing import RequestTimer
 
 VAR_PATTERN = re.compile(r"\{\{\s*(.*?)\s*\}\}")
 
+# Seconds; a request overrides them with options.connect_timeout / options.read_timeout
+DEFAULT_CONNECT_TIMEOUT = 20
+DEFAULT_READ_TIMEOUT = 20
 
-def substitute_vars(text: str, variables: Dict[str, str]) -> str:
+# Content codings urllib3 can decode here (br/zstd only when their decoders are installed)
+ACCEPT_ENCODINGS = tuple(ACCEPT_ENCODING.split(','))
+
+
+def substitute_vars(text: str, variables: Mapping[str, str]) -> str:
     if not text:
         return text
     def repl(match):
@@ -26,38 +43,82 @@ def run_js(script: str, context: Dict[str, Any]) -> Dict[str, Any]:
     response_ctx = context.get('response', {})
 
     js_prelude = f"""
+    var env = {json.dumps(dict(env_store), default=str)};
     var pm = {{
       environment: {{
         get: function(k) {{ return env[k] || ''; }},
         set: function(k, v) {{ env[k] = String(v); }}
       }},
-      request: {request_ctx},
-      response: {response_ctx}
+      request: {json.dumps(request_ctx, default=str)},
+      response: {json.dumps(response_ctx, default=str)}
     }};
     """
-    try:
-        ctx = PyExecJS.compile(js_prelude + "\n" + script + "\n; env;")
-        result = ctx.eval("env")
-        return {**context, 'env': result or env_store}
-    except Exception:
-        return {**context, 'env': env_store}
+    phase = 'post_script' if 'response' in context else 'pre_script'
+    with metrics.track('javascript', 'run_js') as call, tracing.span(phase):
+        try:
+            from . import backends
+
+            execjs = backends.load('javascript')
+            ctx = execjs.compile(js_prelude + "\n" + script + "\n; env;")
+            result = ctx.eval("env")
+            return {**context, 'env': result or env_store}
+        except Exception:
+            call.failed = True
+            return {**context, 'env': env_store}
+
 
+def _apply_script_env(scope: VariableScope, env_after: Mapping[str, Any]) -> None:
+    """Write only the variables a script actually changed into the step's layer"""
+    if env_after is scope:
+        return
+    for key, value in env_after.items():
+        if scope.get(key) != value:
+            scope[key] = value
 
-def send_http_request(req: RequestModel, env: Optional[Environment]):
-    variables = {}
-    if env:
-        for v in env.variables:
-            variables[v.key] = v.value
+
+@dataclass
+class PreparedRequest:
+    """A stored request after substitution and the pre-request script,
+    ready for any transport (requests or the async engine)"""
+    method: str
+    url: str
+    headers: Dict[str, str]
+    json: Any = None
+    data: Any = None
+    timeout: Tuple[float, float] = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)  # (connect, read)
+    pre_script_ms: float = 0.0
+    # Response body capture (see CapturedBody): None is the default in-memory limit
+    capture_limit: Optional[int] = None
+    spill: bool = True
+
+    def skip_body(self, post_script: str) -> None:
+        """Keep only what the post-script can read (nothing without one) and
+        never spill; for callers that don't return the body (load tests)"""
+        self.spill = False
+        if not (post_script or '').strip():
+            self.capture_limit = 0
+
+    def captured_body(self, content_type: str, encoding: Optional[str],
+                      content_encoding: Optional[str]) -> CapturedBody:
+        return CapturedBody(content_type, encoding, self.capture_limit, content_encoding, self.spill)
+
+
+def prepare_request(req: RequestModel, scope: VariableScope) -> PreparedRequest:
+    """Substitute variables, run the pre-request script and encode the payload"""
+    variables = scope
 
     # Pre-request substitutions
-    url = substitute_vars(req.url, variables)
-    headers = {k: substitute_vars(str(v), variables) for k, v in (req.headers or {}).items()}
-    body = substitute_vars(req.body or '', variables)
+    with tracing.span('substitute'):
+        url = substitute_vars(req.url, variables)
+        headers = {k: substitute_vars(str(v), variables) for k, v in (req.headers or {}).items()}
+        body = substitute_vars(req.body or '', variables)
 
     # Run pre-request script
+    script_started = time.perf_counter()
     ctx = {'env': variables, 'request': {'url': url, 'method': req.method, 'headers': headers, 'body': body}}
     ctx = run_js(req.pre_script or '', ctx)
-    variables = ctx['env']
+    _apply_script_env(scope, ctx['env'])
+    pre_script_ms = round((time.perf_counter() - script_started) * 1000, 3)
     url = ctx['request']['url'] if 'request' in ctx else url
 
     data = None
@@ -94,7 +155,7 @@ def send_http_request(req: RequestModel, env: Optional[Environment]):
         # Default JSON handling
         if body.strip():
             try:
-                json_payload = requests.utils.json.loads(body)
+                json_payload = json.loads(body)
             except Exception:
                 # If JSON parsing fails, send as raw data
                 data = body
@@ -102,34 +163,282 @@ def send_http_request(req: RequestModel, env: Optional[Environment]):
         if json_payload and 'content-type' not in [k.lower() for k in headers.keys()]:
             headers['Content-Type'] = 'application/json'
 
+    return PreparedRequest(req.method, url, headers, json_payload, data, request_timeout(req), pre_script_ms)
+
+
+def request_timeout(req: RequestModel) -> Tuple[float, float]:
+    """(connect, read) timeout in seconds from the request's options"""
+    options = req.options or {}
+    return (
+        float(options.get('connect_timeout') or DEFAULT_CONNECT_TIMEOUT),
+        float(options.get('read_timeout') or DEFAULT_READ_TIMEOUT),
+    )
+
+
+def negotiate_encoding(headers: Dict[str, str], supported: Sequence[str]) -> None:
+    """Advertise only content codings the transport can decode.
+
+    Without an Accept-Encoding header every supported coding is offered; a
+    stored header keeps its order/q-values but loses codings we could not
+    decode (``*`` expands to the supported ones).
+    """
+    key = next((k for k in headers if k.lower() == 'accept-encoding'), None)
+    if key is None:
+        headers['Accept-Encoding'] = ', '.join(supported)
+        return
+    kept = []
+    for coding in headers[key].split(','):
+        name = coding.split(';')[0].strip().lower()
+        if name == '*':
+            kept.extend(c for c in supported if c not in kept)
+        elif name in supported or name == 'identity':
+            kept.append(coding.strip())
+    if kept:
+        headers[key] = ', '.join(kept)
+    else:
+        del headers[key]
+
+
+def read_body(resp, prepared: PreparedRequest) -> CapturedBody:
+    """Stream a requests response into a size-capped CapturedBody"""
+    body = prepared.captured_body(resp.headers.get('content-type', ''), resp.encoding,
+                                  resp.headers.get('content-encoding'))
     try:
-        resp = requests.request(req.method, url, headers=headers, json=json_payload, data=data, timeout=20)
-        content_type = resp.headers.get('content-type', '')
-        try:
-            parsed = resp.json()
-        except Exception:
-            parsed = resp.text
+        for chunk in resp.iter_content(response_capture.CHUNK_SIZE):
+            if not body.feed(chunk):
+                break
+    finally:
+        body.close()
+        # Bytes read off the socket, before decompression
+        body.wire_size = resp.raw.tell()
+    return body
+
+
+def finish_request(req: RequestModel, prepared: PreparedRequest, scope: VariableScope,
+                   snapshot: Optional[EnvironmentSnapshot], status: int,
+                   headers: Mapping[str, str], body: CapturedBody,
+                   include_body: bool = True, timer: Optional[RequestTimer] = None) -> Dict[str, Any]:
+    """Run the post-request script and shape the result returned to callers.
 
-        # Post-request script context
+    The body is only decoded/parsed if the post script or the caller needs it.
+    """
+    headers = dict(headers)
+    script_started = time.perf_counter()
+    if (req.post_script or '').strip():
+        parsed = body.json
         post_ctx = {
-            'env': variables,
-            'request': {'url': url, 'method': req.method},
+            'env': scope,
+            'request': {'url': prepared.url, 'method': req.method},
             'response': {
-                'status': resp.status_code,
-                'headers': dict(resp.headers),
-                'json': parsed if not isinstance(parsed, str) else None,
-                'text': parsed if isinstance(parsed, str) else None
+                'status': status,
+                'headers': headers,
+                'json': parsed,
+                'text': body.text if parsed is None else None
             }
         }
-        post_ctx = run_js(req.post_script or '', post_ctx)
-        variables = post_ctx['env']
-
-        return {
-            'ok': True,
-            'status': resp.status_code,
-            'headers': dict(resp.headers),
-            'data': parsed,
-            'env': variables
-        }
-    except Exception as e:
-        return {'ok': False, 'error': str(e)}
+        post_ctx = run_js(req.post_script, post_ctx)
+        _apply_script_env(scope, post_ctx['env'])
+
+    # Only the variables set by this request's scripts are returned
+    written = scope.local
+    result = {
+        'ok': True,
+        'status': status,
+        'headers': headers,
+        'body': body.info(),
+        'env': snapshot.mask(written) if snapshot else written
+    }
+    if include_body:
+        result['data'] = body.value()
+    if timer is not None:
+        timer.add('pre_script_ms', prepared.pre_script_ms / 1000)
+        timer.add('post_script_ms', time.perf_counter() - script_started)
+        result['timings'] = timer.to_dict()
+    return result
+
+
+def retry_policy(req: RequestModel, snapshot: Optional[EnvironmentSnapshot]) -> RetryPolicy:
+    """The environment's retry settings, overridden by the request's own"""
+    return RetryPolicy.from_options(snapshot.options if snapshot else None, req.options)
+
+
+def coalesce_rule(req: RequestModel, snapshot: Optional[EnvironmentSnapshot]) -> CoalesceRule:
+    """The environment's coalescing settings, overridden by the request's own"""
+    return CoalesceRule.from_options(snapshot.options if snapshot else None, req.options)
+
+
+@dataclass
+class Transfer:
+    """What the upstream returned for a prepared request (all attempts).
+
+    Coalesced sends share one Transfer; ``network`` keeps the phase timings
+    of the send that actually went out.
+    """
+    attempts: int
+    status: Optional[int] = None
+    headers: Optional[Mapping[str, str]] = None
+    body: Optional[CapturedBody] = None
+    error: Optional[str] = None
+    circuit_open: bool = False
+    network: Optional[RequestTimer] = None
+    elapsed_ms: Optional[float] = None  # final attempt on the wire: request sent to body read
+
+    def for_follower(self) -> 'Transfer':
+        """This transfer for a caller that waited on a coalesced send: the body
+        gets its own parsed JSON, so one caller's changes don't reach another"""
+        return replace(self, body=self.body.copy()) if self.body is not None else self
+
+
+def failed_result(transfer: Transfer, prepared: PreparedRequest, timer: RequestTimer) -> Dict[str, Any]:
+    timer.add('pre_script_ms', prepared.pre_script_ms / 1000)
+    result = {'ok': False, 'error': transfer.error, 'attempts': transfer.attempts, 'timings': timer.to_dict()}
+    if transfer.circuit_open:
+        result['circuit'] = 'open'
+    return result
+
+
+@tracing.spanned('replay')
+def replayed(tape: recordings.Tape, prepared: PreparedRequest, timer: RequestTimer) -> Tuple[Transfer, float]:
+    """A Transfer answered from a replay tape, and the recorded latency to simulate (seconds)"""
+    exchange = tape.replay(prepared)
+    if exchange is None:
+        error = f'No recorded response for {prepared.method} {prepared.url}'
+        return Transfer(0, error=error, network=timer.copy()), 0.0
+    body = prepared.captured_body(exchange.content_type, exchange.encoding, None)
+    body.feed(exchange.body)
+    body.close()
+    if exchange.truncated:
+        # Only the head was recorded: replay it as the truncated body it was
+        body.mark_truncated(exchange.size or 0)
+    delay = (exchange.elapsed_ms or 0) / 1000 if tape.simulate_latency else 0.0
+    return Transfer(1, exchange.status, exchange.headers, body, network=timer.copy()), delay
+
+
+def record(tape: Optional[recordings.Tape], prepared: PreparedRequest, transfer: Transfer) -> None:
+    """Capture a completed upstream exchange when a recording run is active"""
+    if tape is not None and not tape.replaying and transfer.error is None:
+        tape.capture(prepared, transfer.status, transfer.headers, transfer.body, transfer.elapsed_ms)
+
+
+@tracing.spanned('network')
+def _transfer(prepared: PreparedRequest, policy: RetryPolicy, timer: RequestTimer,
+              limited: Sequence[throttle.Target] = (), breaker=None) -> Transfer:
+    """Send with retries, the host's circuit breaker (unless ``breaker`` is
+    given, e.g. NO_BREAKER) and throttling; never raises"""
+    tracing.annotate(method=prepared.method, url=tracing.safe_url(prepared.url))
+    breaker = breaker or resilience.breaker_for(prepared.url)
+    session = timing.session()
+    attempt = 0
+    try:
+        while True:
+            attempt += 1
+            try:
+                # Slot first: the breaker only sees calls that go out (a probe isn't claimed while queued)
+                with throttle.slot(limited, timer):
+                    breaker.before_call()
+                    sent = time.perf_counter()
+                    with session.request(prepared.method, prepared.url, headers=prepared.headers,
+                                         json=prepared.json, data=prepared.data, timeout=prepared.timeout,
+                                         stream=True) as resp:
+                        timer.set_ttfb(time.perf_counter() - sent)
+                        tracing.annotate(status=resp.status_code, attempts=attempt)
+                        if resilience.is_failure(resp.status_code):
+                            breaker.record_failure()
+                        else:
+                            breaker.record_success()
+                        wait = None
+                        # No retry once this attempt has opened the circuit: report what the host said
+                        if not breaker.is_open and policy.should_retry(prepared.method, attempt, resp.status_code):
+                            wait = policy.delay(attempt, resp.headers.get('Retry-After'))
+                        else:
+                            downloading = time.perf_counter()
+                            body = read_body(resp, prepared)
+                            finished = time.perf_counter()
+                            timer.add('download_ms', finished - downloading)
+            except resilience.CircuitOpen as e:
+                tracing.annotate(error=str(e), attempts=attempt - 1)
+                return Transfer(attempt - 1, error=str(e), circuit_open=True, network=timer.copy())
+            except throttle.ThrottleUnavailable as e:
+                # Not the host's fault: no breaker failure, no retry
+                tracing.annotate(error=str(e), attempts=attempt - 1)
+                return Transfer(attempt - 1, error=str(e), network=timer.copy())
+            except Exception as e:
+                breaker.record_failure()
+                if breaker.is_open or not policy.should_retry(prepared.method, attempt):
+                    tracing.annotate(error=str(e), attempts=attempt)
+                    return Transfer(attempt, error=str(e), network=timer.copy())
+                wait = policy.delay(attempt)
+            if wait is None:
+                return Transfer(attempt, resp.status_code, resp.headers, body, network=timer.copy(),
+                                elapsed_ms=round((finished - sent) * 1000, 3))
+            time.sleep(wait)
+    finally:
+        # The pooled session must not carry cookies from one stored request to the next
+        session.cookies.clear()
+
+
+@metrics.instrumented('http', 'send', ok=lambda result: result.get('ok'))
+@tracing.spanned('http.send')
+def send_http_request(req: RequestModel, env: EnvLike, scope: Optional[VariableScope] = None,
+                      include_body: bool = True, retry: Optional[RetryPolicy] = None,
+                      coalesce: Optional[CoalesceRule] = None, breaker=None):
+    """Send a stored request.
+
+    ``env`` may be an Environment, its id, or a snapshot pinned by a run.
+    ``scope`` is the caller's variable layer (e.g. a scenario step); script
+    writes land there. Without one, a throwaway run scope is used. The body
+    is streamed and capped (see response_capture); ``include_body=False``
+    skips returning it when only the status matters (load tests), and then
+    only the part a post-script can read is kept and nothing is spilled.
+
+    Failed attempts are retried per ``retry`` (default: the environment's and
+    request's ``options.retry``) and fail fast while the host's circuit
+    breaker is open (``breaker=NO_BREAKER`` bypasses it). Scripts run once, around the final attempt. With
+    ``coalesce`` (default: ``options.coalesce``) enabled, identical GETs in
+    flight at the same time share one upstream call; each caller still runs
+    its own scripts on the shared response. Per-host and per-environment
+    throttles (see services/throttle) make attempts queue, reported as
+    ``timings.queue_ms``. Inside ``recordings.use(tape)`` exchanges are
+    recorded, or answered from the tape without touching the network.
+    """
+    snapshot = get_snapshot(env)
+    if scope is None:
+        scope = VariableScope.for_run(snapshot.variables if snapshot else None)
+    timer = timing.begin()
+    prepared = prepare_request(req, scope)
+    if not include_body:
+        prepared.skip_body(req.post_script)
+    negotiate_encoding(prepared.headers, ACCEPT_ENCODINGS)
+    policy = retry if retry is not None else retry_policy(req, snapshot)
+    rule = coalesce if coalesce is not None else coalesce_rule(req, snapshot)
+    limited = throttle.targets(prepared.url, snapshot)
+
+    tape = recordings.active()
+    shared = False
+    if tape is not None and tape.replaying:
+        transfer, delay = replayed(tape, prepared, timer)
+        time.sleep(delay)
+    elif rule.applies(prepared.method):
+        transfer, shared = single_flight.flights.do(rule.key(prepared),
+                                                    lambda: _transfer(prepared, policy, timer, limited, breaker))
+        if shared:
+            transfer = transfer.for_follower()
+            timer.adopt(transfer.network)
+            tracing.annotate(coalesced=True)
+    else:
+        transfer = _transfer(prepared, policy, timer, limited, breaker)
+    record(tape, prepared, transfer)
+    if transfer.error is not None:
+        result = failed_result(transfer, prepared, timer)
+    else:
+        try:
+            result = finish_request(req, prepared, scope, snapshot, transfer.status, transfer.headers,
+                                    transfer.body, include_body, timer)
+        except Exception as e:
+            return {'ok': False, 'error': str(e), 'attempts': transfer.attempts, 'timings': timer.to_dict()}
+        result['attempts'] = transfer.attempts
+    if shared:
+        result['coalesced'] = True
+    if tape is not None and tape.replaying:
+        result['replayed'] = True
+    return result
@@ -3,6 +3,7 @@ import subprocess
 import tempfile
 import json
 from typing import Dict, Any
+from .. import metrics, tracing
 
 class JavaSeleniumRunner:
     """Service to execute Java Selenium code"""
@@ -60,6 +61,8 @@ public class SeleniumTest {
 }
 """
 
+    @metrics.instrumented('java_selenium', 'execute', ok=lambda result: result.get('success'))
+    @tracing.spanned('java_selenium')
     def execute_java_selenium(self, java_code: str, dependencies: list = None) -> Dict[str, Any]:
         """Execute Java Selenium code and return results"""
         try:
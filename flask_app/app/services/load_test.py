@@ -0,0 +1,483 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy.exc import SQLAlchemyError
+from ..models import LoadTestRun, RequestModel
+from .. import db, metrics
+from . import backends
+from .env_snapshots import EnvironmentSnapshot
+from .resilience import NO_BREAKER, NO_RETRY
+from .single_flight import NO_COALESCING
+from .scopes import VariableScope
+
+# (ok, error kind) for one iteration of the workload
+IterationResult = Tuple[bool, Optional[str]]
+
+MAX_DURATION_S = 600
+MAX_CONCURRENCY = 500
+MAX_ASYNC_CONCURRENCY = 5000  # in-flight requests on one event loop
+MAX_RATE = 2000
+# Open model: arrivals beyond this many waiting per worker are dropped, not queued forever
+MAX_BACKLOG_PER_WORKER = 10
+# Every iteration hits the target itself: no retries, no shared responses, and no
+# circuit breaker (which would fail fast and trip for other users' runs too)
+SEND_OPTIONS = dict(include_body=False, retry=NO_RETRY, coalesce=NO_COALESCING, breaker=NO_BREAKER)
+# A run executes in one worker process, which writes its progress to the row
+# every HEARTBEAT_S and checks the row's stop_requested flag, so any worker can
+# stream or stop it. A running row not written for STALE_S lost its worker.
+HEARTBEAT_S = 1.0
+STALE_S = 30.0
+# threads: the requests-based sender | async: the asyncio engine (load tests,
+# scenario and suite runs)
+ENGINES = ('threads', 'async')
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    """Log-linear latency histogram in microseconds (HdrHistogram-style).
+
+    Values below 2**SUB_BUCKET_BITS are exact; larger values fall into one of
+    2**(SUB_BUCKET_BITS-1) linear sub-buckets per power of two, which keeps
+    the relative error under 1% with a few hundred sparse buckets.
+    """
+    SUB_BUCKET_BITS = 8
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.total = 0
+        self.sum = 0
+        self.min: Optional[int] = None
+        self.max = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _index(cls, value: int) -> int:
+        bits = cls.SUB_BUCKET_BITS
+        if value < (1 << bits):
+            return value
+        shift = value.bit_length() - bits
+        half = 1 << (bits - 1)
+        return (1 << bits) + (shift - 1) * half + ((value >> shift) - half)
+
+    @classmethod
+    def _highest_equivalent(cls, index: int) -> int:
+        bits = cls.SUB_BUCKET_BITS
+        if index < (1 << bits):
+            return index
+        half = 1 << (bits - 1)
+        shift = (index - (1 << bits)) // half + 1
+        mantissa = (index - (1 << bits)) % half + half
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, seconds: float) -> None:
+        value = max(0, int(seconds * 1_000_000))
+        index = self._index(value)
+        with self._lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.total += 1
+            self.sum += value
+            self.max = max(self.max, value)
+            self.min = value if self.min is None else min(self.min, value)
+
+    def percentile(self, percent: float) -> int:
+        """Latency (µs) at or below which ``percent`` of samples fall"""
+        with self._lock:
+            if not self.total:
+                return 0
+            target = max(1, int(round(percent / 100 * self.total + 0.4999)))
+            seen = 0
+            for index in sorted(self.counts):
+                seen += self.counts[index]
+                if seen >= target:
+                    return min(self._highest_equivalent(index), self.max)
+            return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        ms = lambda us: round(us / 1000, 3)
+        return {
+            'count': self.total,
+            'min_ms': ms(self.min or 0),
+            'mean_ms': ms(self.sum / self.total) if self.total else 0,
+            'p50_ms': ms(self.percentile(50)),
+            'p90_ms': ms(self.percentile(90)),
+            'p95_ms': ms(self.percentile(95)),
+            'p99_ms': ms(self.percentile(99)),
+            'p999_ms': ms(self.percentile(99.9)),
+            'max_ms': ms(self.max),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Sparse bucket counts, suitable for storing and re-merging"""
+        with self._lock:
+            return {
+                'sub_bucket_bits': self.SUB_BUCKET_BITS,
+                'counts': {str(k): v for k, v in sorted(self.counts.items())},
+                'sum_us': self.sum,
+                'min_us': self.min,
+                'max_us': self.max,
+            }
+
+
+@dataclass
+class LoadTestConfig:
+    mode: str = 'closed'  # closed: N virtual users in a loop | open: constant arrival rate
+    duration_s: float = 10
+    concurrency: int = 10  # virtual users (closed) or max in-flight requests (open)
+    rate: float = 10  # arrivals per second (open model only)
+    engine: str = 'threads'  # threads (requests) | async (asyncio engine)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LoadTestConfig':
+        config = cls(
+            mode=data.get('mode', 'closed'),
+            duration_s=float(data.get('duration_s', data.get('duration', 10))),
+            concurrency=int(data.get('concurrency', 10)),
+            rate=float(data.get('rate', 10)),
+            engine=data.get('engine', 'threads'),
+        )
+        if config.mode not in ('open', 'closed'):
+            raise ValueError("mode must be 'open' or 'closed'")
+        if config.engine not in ENGINES:
+            raise ValueError("engine must be 'threads' or 'async'")
+        if not 0 < config.duration_s <= MAX_DURATION_S:
+            raise ValueError(f'duration_s must be between 0 and {MAX_DURATION_S}')
+        max_concurrency = MAX_ASYNC_CONCURRENCY if config.engine == 'async' else MAX_CONCURRENCY
+        if not 0 < config.concurrency <= max_concurrency:
+            raise ValueError(f'concurrency must be between 1 and {max_concurrency}')
+        if config.mode == 'open' and not 0 < config.rate <= MAX_RATE:
+            raise ValueError(f'rate must be between 0 and {MAX_RATE}')
+        return config
+
+
+class LoadTestRunner:
+    """Drives a workload under an open or closed model and aggregates results.
+
+    With ``engine='async'`` the iteration is a coroutine function taking the
+    shared AsyncHttpEngine, and virtual users/arrivals are tasks on one loop.
+    """
+
+    def __init__(self, run_id: int, config: LoadTestConfig, iteration: Callable[..., Any],
+                 on_finish: Optional[Callable[['LoadTestRunner'], None]] = None):
+        self.run_id = run_id
+        self.config = config
+        self.iteration = iteration
+        self.on_finish = on_finish
+        self.histogram = LatencyHistogram()
+        self.errors: Dict[str, int] = {}
+        self.timeline: Dict[int, List[int]] = {}  # second -> [completed, errors]
+        self.completed = 0
+        self.dropped = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.stop_event = threading.Event()
+        self.done = threading.Event()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def start(self) -> 'LoadTestRunner':
+        threading.Thread(target=self._run, name=f'load-test-{self.run_id}', daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+    def _run(self) -> None:
+        self.started_at = time.perf_counter()
+        try:
+            if self.config.engine == 'async':
+                asyncio.run(self._run_async())
+            elif self.config.mode == 'open':
+                self._run_open()
+            else:
+                self._run_closed()
+        finally:
+            self.finished_at = time.perf_counter()
+            self.done.set()
+            if self.on_finish:
+                self.on_finish(self)
+
+    def _deadline_reached(self) -> bool:
+        return self.stop_event.is_set() or time.perf_counter() - self.started_at >= self.config.duration_s
+
+    def _run_closed(self) -> None:
+        def virtual_user():
+            while not self._deadline_reached():
+                self._execute(time.perf_counter())
+
+        users = [threading.Thread(target=virtual_user, daemon=True) for _ in range(self.config.concurrency)]
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+
+    def _run_open(self) -> None:
+        interval = 1.0 / self.config.rate
+        max_backlog = self.config.concurrency * MAX_BACKLOG_PER_WORKER
+        with ThreadPoolExecutor(max_workers=self.config.concurrency) as pool:
+            arrivals = 0
+            while not self._deadline_reached():
+                scheduled = self.started_at + arrivals * interval
+                delay = scheduled - time.perf_counter()
+                if delay > 0 and self.stop_event.wait(delay):
+                    break
+                arrivals += 1
+                with self._lock:
+                    if self._pending >= max_backlog:
+                        self.dropped += 1
+                        self.errors['dropped'] = self.errors.get('dropped', 0) + 1
+                        continue
+                    self._pending += 1
+                # Latency is measured from the scheduled arrival, so a slow
+                # target can't hide queueing delay (no coordinated omission)
+                pool.submit(self._execute, scheduled, True)
+
+    async def _run_async(self) -> None:
+        concurrency = self.config.concurrency
+        async with backends.load('async_http').AsyncHttpEngine(concurrency, concurrency) as engine:
+            if self.config.mode == 'closed':
+                async def virtual_user():
+                    while not self._deadline_reached():
+                        await self._execute_async(engine, time.perf_counter())
+                await asyncio.gather(*(virtual_user() for _ in range(concurrency)))
+                return
+
+            interval = 1.0 / self.config.rate
+            max_backlog = concurrency * MAX_BACKLOG_PER_WORKER
+            tasks = set()
+            arrivals = 0
+            while not self._deadline_reached():
+                scheduled = self.started_at + arrivals * interval
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                arrivals += 1
+                with self._lock:
+                    if self._pending >= max_backlog:
+                        self.dropped += 1
+                        self.errors['dropped'] = self.errors.get('dropped', 0) + 1
+                        continue
+                    self._pending += 1
+                task = asyncio.ensure_future(self._execute_async(engine, scheduled, True))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+
+    def _execute(self, scheduled: float, pending: bool = False) -> None:
+        try:
+            ok, kind = self.iteration()
+        except Exception as e:
+            ok, kind = False, type(e).__name__
+        self._record(scheduled, ok, kind, pending)
+
+    async def _execute_async(self, engine, scheduled: float, pending: bool = False) -> None:
+        try:
+            ok, kind = await self.iteration(engine)
+        except Exception as e:
+            ok, kind = False, type(e).__name__
+        self._record(scheduled, ok, kind, pending)
+
+    def _record(self, scheduled: float, ok: bool, kind: Optional[str], pending: bool) -> None:
+        now = time.perf_counter()
+        self.histogram.record(now - scheduled)
+        second = int(now - self.started_at)
+        with self._lock:
+            if pending:
+                self._pending -= 1
+            self.completed += 1
+            bucket = self.timeline.setdefault(second, [0, 0])
+            bucket[0] += 1
+            if not ok:
+                bucket[1] += 1
+                self.errors[kind or 'error'] = self.errors.get(kind or 'error', 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current aggregate results (safe to call while running)"""
+        end = self.finished_at or time.perf_counter()
+        elapsed = max(end - (self.started_at or end), 1e-9)
+        with self._lock:
+            errors = dict(self.errors)
+            completed = self.completed
+            timeline = [
+                {'second': s, 'completed': c, 'errors': e} for s, (c, e) in sorted(self.timeline.items())
+            ]
+        error_count = sum(v for k, v in errors.items() if k != 'dropped')
+        return {
+            'status': 'finished' if self.done.is_set() else 'running',
+            'elapsed_s': round(elapsed, 3),
+            'completed': completed,
+            'throughput_rps': round(completed / elapsed, 2),
+            'error_count': error_count,
+            'error_rate': round(error_count / completed, 4) if completed else 0,
+            'errors': errors,
+            'latency': self.histogram.summary(),
+            'timeline': timeline,
+        }
+
+
+def classify(result: Dict[str, Any]) -> IterationResult:
+    """Map a send_http_request result to (ok, error kind)"""
+    if not result.get('ok'):
+        if result.get('circuit') == 'open':
+            return False, 'circuit_open'
+        message = (result.get('error') or '').lower()
+        if 'timed out' in message or 'timeout' in message:
+            return False, 'timeout'
+        if 'connection' in message or 'cannot connect' in message:
+            return False, 'connection'
+        return False, 'exception'
+    status = result.get('status') or 0
+    if status >= 400:
+        return False, f'http_{status // 100}xx'
+    return True, None
+
+
+def _detached_request(req: RequestModel) -> RequestModel:
+    """Unsaved copy so worker threads never touch the request's session"""
+    return RequestModel(
+        id=req.id, name=req.name, method=req.method, url=req.url, headers=dict(req.headers or {}),
+        body=req.body, payload_type=req.payload_type, pre_script=req.pre_script, post_script=req.post_script,
+        options=dict(req.options or {}),
+    )
+
+
+def request_iteration(req: RequestModel, snapshot: Optional[EnvironmentSnapshot],
+                      engine: str = 'threads') -> Callable[..., Any]:
+    req = _detached_request(req)
+    if engine == 'async':
+        async def iteration(http_engine) -> IterationResult:
+            return classify(await http_engine.send(req, snapshot, **SEND_OPTIONS))
+        return iteration
+
+    http = backends.load('http')
+    return lambda: classify(http.send_http_request(req, snapshot, **SEND_OPTIONS))
+
+
+def scenario_iteration(requests: List[RequestModel], snapshot: Optional[EnvironmentSnapshot],
+                       engine: str = 'threads') -> Callable[..., Any]:
+    """One pass through a scenario's request steps with its own variable scope"""
+    requests = [_detached_request(r) for r in requests]
+    if engine == 'async':
+        async def iteration(http_engine) -> IterationResult:
+            run_scope = VariableScope.for_run(snapshot.variables if snapshot else None)
+            for req in requests:
+                step_scope = run_scope.child()
+                ok, kind = classify(await http_engine.send(req, snapshot, step_scope, **SEND_OPTIONS))
+                if not ok:
+                    return ok, kind
+                step_scope.commit()
+            return True, None
+        return iteration
+
+    http = backends.load('http')
+
+    def iteration() -> IterationResult:
+        run_scope = VariableScope.for_run(snapshot.variables if snapshot else None)
+        for req in requests:
+            step_scope = run_scope.child()
+            ok, kind = classify(http.send_http_request(req, snapshot, step_scope, **SEND_OPTIONS))
+            if not ok:
+                return ok, kind
+            step_scope.commit()
+        return True, None
+    return iteration
+
+
+# Runs in progress in this process, by LoadTestRun id
+active_runs: Dict[int, LoadTestRunner] = {}
+metrics.register_callback('load_tests_running', 'Load tests running in this process', (),
+                          lambda: {(): len(active_runs)})
+
+
+def start_load_test(app, run: LoadTestRun, config: LoadTestConfig,
+                    iteration: Callable[..., Any]) -> LoadTestRunner:
+    """Start a background run and persist its results when it finishes"""
+    def on_finish(runner: LoadTestRunner) -> None:
+        results = runner.snapshot()
+        results['histogram'] = runner.histogram.to_dict()
+        with app.app_context():
+            row = db.session.get(LoadTestRun, runner.run_id)
+            if row is not None:
+                row.status = 'stopped' if runner.stop_event.is_set() else 'finished'
+                row.results = results
+                row.finished_at = datetime.utcnow()
+                db.session.commit()
+        active_runs.pop(runner.run_id, None)
+
+    def heartbeat() -> None:
+        while not runner.done.wait(HEARTBEAT_S):
+            try:
+                with app.app_context():
+                    row = db.session.get(LoadTestRun, runner.run_id)
+                    if row is None or row.stop_requested:
+                        runner.stop()
+                        continue
+                    row.results = runner.snapshot()
+                    db.session.commit()
+            except SQLAlchemyError:
+                logger.warning('Could not update load test %s', runner.run_id, exc_info=True)
+
+    runner = LoadTestRunner(run.id, config, iteration, on_finish)
+    active_runs[run.id] = runner
+    runner.start()
+    threading.Thread(target=heartbeat, name=f'load-test-{run.id}-heartbeat', daemon=True).start()
+    return runner
+
+
+def is_stale(run: LoadTestRun) -> bool:
+    """Running, but its worker has not written the row for STALE_S"""
+    return (run.status == 'running' and run.id not in active_runs
+            and run.updated_at < datetime.utcnow() - timedelta(seconds=STALE_S))
+
+
+def fail_orphaned_runs() -> int:
+    """Mark running rows whose worker exited or restarted as failed; returns how many"""
+    cutoff = datetime.utcnow() - timedelta(seconds=STALE_S)
+    query = LoadTestRun.query.filter(LoadTestRun.status == 'running', LoadTestRun.updated_at < cutoff)
+    if active_runs:
+        query = query.filter(LoadTestRun.id.notin_(list(active_runs)))
+    count = query.update({'status': 'failed', 'finished_at': datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+    if count:
+        logger.warning('Marked %d orphaned load test run(s) as failed', count)
+    return count
+
+
+_swept = False
+
+
+def fail_orphaned_runs_once() -> None:
+    """``fail_orphaned_runs`` on a worker's first load-test call, since
+    workers started with AUTO_INIT_DB=0 query nothing at boot"""
+    global _swept
+    if not _swept:
+        fail_orphaned_runs()
+        _swept = True
+
+
+def compare(base: Dict[str, Any], other: Dict[str, Any]) -> Dict[str, Any]:
+    """Relative change of the headline numbers between two stored runs"""
+    def delta(a, b):
+        if not a:
+            return None
+        return round((b - a) / a * 100, 2)
+
+    metrics = {}
+    for key in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'mean_ms'):
+        a, b = base.get('latency', {}).get(key, 0), other.get('latency', {}).get(key, 0)
+        metrics[key] = {'base': a, 'other': b, 'change_pct': delta(a, b)}
+    for key in ('throughput_rps', 'error_rate'):
+        a, b = base.get(key, 0), other.get(key, 0)
+        metrics[key] = {'base': a, 'other': b, 'change_pct': delta(a, b)}
+    return metrics
+
+
+def config_dict(config: LoadTestConfig) -> Dict[str, Any]:
+    return asdict(config)
@@ -0,0 +1,29 @@
+from typing import Any, Callable, Dict, Iterable, Mapping, Optional
+
+# Settings blocks in environment/request ``options`` (retry, coalesce, throttle), merged
+# and validated the same way for each policy.
+
+
+def flag(value: Any) -> bool:
+    """A JSON boolean; strings such as "false" are rejected rather than truthy"""
+    if not isinstance(value, bool):
+        raise TypeError('expected true or false')
+    return value
+
+
+def merge(section: str, coerce: Mapping[str, Callable[[Any], Any]],
+          options: Iterable[Optional[Mapping[str, Any]]]) -> Dict[str, Any]:
+    """Merge ``options[section]`` mappings, later ones winning, and convert each
+    value with ``coerce[key]``. Raises ValueError for unknown keys or bad values."""
+    settings: Dict[str, Any] = {}
+    for opts in options:
+        settings.update((opts or {}).get(section) or {})
+    unknown = set(settings) - set(coerce)
+    if unknown:
+        raise ValueError(f"Unknown {section} settings: {', '.join(sorted(unknown))}")
+    for key, value in settings.items():
+        try:
+            settings[key] = coerce[key](value)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid value for {key}: {value!r}')
+    return settings
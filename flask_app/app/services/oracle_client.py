@@ -3,6 +3,9 @@ import json
 from typing import Dict, Any, List, Optional
 from cryptography.fernet import Fernet
 import os
+from .. import metrics, tracing
+
+DML_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
 
 class OracleClient:
     """Service to handle Oracle database connections and queries"""
@@ -38,6 +41,41 @@ class OracleClient:
         """Decrypt database password"""
         return self.cipher_suite.decrypt(encrypted_password.encode()).decode()
     
+    @staticmethod
+    def shape_result(cursor, query: str) -> Dict[str, Any]:
+        """Build the result dict for an executed cursor.
+
+        SELECTs return their rows as dicts keyed by column name, DML the
+        affected row count, anything else a plain success message.
+        """
+        query_type = query.lstrip().upper()
+
+        if query_type.startswith('SELECT'):
+            columns = [desc[0] for desc in cursor.description]
+            results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            return {
+                'success': True,
+                'query_type': 'SELECT',
+                'columns': columns,
+                'data': results,
+                'row_count': len(results)
+            }
+
+        if query_type.startswith(DML_STATEMENTS):
+            return {
+                'success': True,
+                'query_type': query_type.split()[0],
+                'affected_rows': cursor.rowcount
+            }
+
+        # DDL or other statements
+        return {
+            'success': True,
+            'query_type': 'DDL',
+            'message': 'Query executed successfully'
+        }
+
+    @metrics.instrumented('oracle', 'test_connection', ok=lambda result: result.get('success'))
     def test_connection(self, connection_config: Dict[str, Any]) -> Dict[str, Any]:
         """Test Oracle database connection"""
         try:
@@ -83,6 +121,8 @@ class OracleClient:
                 'error': str(e)
             }
     
+    @metrics.instrumented('oracle', 'execute_query', ok=lambda result: result.get('success'))
+    @tracing.spanned('oracle.query')
     def execute_query(self, connection_config: Dict[str, Any], query: str, 
                      parameters: Optional[Dict] = None) -> Dict[str, Any]:
         """Execute SQL query on Oracle database"""
@@ -111,43 +151,10 @@ class OracleClient:
             else:
                 cursor.execute(query)
             
-            # Determine query type and handle accordingly
-            query_type = query.strip().upper()
-            
-            if query_type.startswith('SELECT'):
-                # For SELECT queries, fetch results
-                columns = [desc[0] for desc in cursor.description]
-                rows = cursor.fetchall()
-                
-                # Convert rows to list of dictionaries
-                results = []
-                for row in rows:
-                    results.append(dict(zip(columns, row)))
-                
-                result = {
-                    'success': True,
-                    'query_type': 'SELECT',
-                    'columns': columns,
-                    'data': results,
-                    'row_count': len(results)
-                }
-                
-            elif query_type.startswith(('INSERT', 'UPDATE', 'DELETE')):
-                # For DML queries, commit and return affected rows
+            # DML is committed before the result reports the affected rows
+            if query.lstrip().upper().startswith(DML_STATEMENTS):
                 connection.commit()
-                result = {
-                    'success': True,
-                    'query_type': query_type.split()[0],
-                    'affected_rows': cursor.rowcount
-                }
-                
-            else:
-                # For DDL or other queries
-                result = {
-                    'success': True,
-                    'query_type': 'DDL',
-                    'message': 'Query executed successfully'
-                }
+            result = self.shape_result(cursor, query)
             
             cursor.close()
             connection.close()
@@ -0,0 +1,182 @@
+import base64
+import contextvars
+import hashlib
+import json
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Mapping, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+from .. import db
+from ..models import RecordedExchange, Recording
+from . import artifacts
+
+# Response headers that describe the original transfer, not the decoded body we replay
+HOP_HEADERS = frozenset({'content-encoding', 'content-length', 'transfer-encoding', 'connection', 'keep-alive'})
+
+_active: contextvars.ContextVar[Optional['Tape']] = contextvars.ContextVar('recording_tape', default=None)
+
+
+def canonical_body(json_payload: Any = None, data: Any = None) -> bytes:
+    """Request body in a form that compares equal however it was encoded"""
+    if json_payload is not None:
+        return json.dumps(json_payload, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+    if isinstance(data, dict):
+        return urlencode(sorted(data.items())).encode('utf-8')
+    if isinstance(data, str):
+        return data.encode('utf-8')
+    return data or b''
+
+
+def wire_body(body: bytes, content_type: str) -> bytes:
+    """canonical_body for a body received over HTTP (the loopback server)"""
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if body and content_type == 'application/json':
+        try:
+            return canonical_body(json.loads(body))
+        except ValueError:
+            pass
+    if content_type == 'application/x-www-form-urlencoded':
+        return canonical_body(data=dict(parse_qsl(body.decode('utf-8', errors='replace'), keep_blank_values=True)))
+    return body
+
+
+def match_key(method: str, url: str, body_digest: bytes) -> str:
+    """Index key: method, substituted URL and the sha256 of the canonical body"""
+    return hashlib.sha256(f'{method.upper()} {url}\n{body_digest.hex()}'.encode('utf-8')).hexdigest()
+
+
+def _path(url: str) -> str:
+    parts = urlsplit(url)
+    return parts.path + ('?' + parts.query if parts.query else '') or '/'
+
+
+@dataclass(frozen=True)
+class Exchange:
+    status: int
+    headers: Mapping[str, str]
+    body: bytes
+    encoding: str
+    elapsed_ms: Optional[float]  # request sent to body read, final attempt only
+    size: Optional[int] = None  # the original body size; more than len(body) when truncated
+    truncated: bool = False  # only the captured head of the body was recorded
+
+    @property
+    def content_type(self) -> str:
+        return next((v for k, v in self.headers.items() if k.lower() == 'content-type'), '')
+
+
+class Tape:
+    """The exchanges of one recording: captured during a recording run, or
+    indexed for replay.
+
+    Identical requests are answered in the order they were recorded; once
+    those run out the last response repeats.
+    """
+
+    def __init__(self, recording_id: int, replaying: bool = False, simulate_latency: bool = False):
+        self.recording_id = recording_id
+        self.replaying = replaying
+        self.simulate_latency = simulate_latency
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._captured: List[Dict[str, Any]] = []
+        self._index: Dict[str, List[Exchange]] = {}
+        self._by_path: Dict[str, List[Exchange]] = {}  # loopback: same key without scheme/host
+        self._served: Dict[str, int] = {}
+
+    @classmethod
+    def load(cls, recording: Recording, simulate_latency: bool = False) -> 'Tape':
+        """Index a stored recording for replay (artifacts are unpacked up front,
+        so serving needs neither the database nor an app context)"""
+        tape = cls(recording.id, replaying=True, simulate_latency=simulate_latency)
+        rows = RecordedExchange.query.filter_by(recording_id=recording.id).order_by(RecordedExchange.id).all()
+        for row in rows:
+            stored = artifacts.unpack(row.artifact)
+            encoding = stored.get('encoding') or 'utf-8'
+            if 'body_b64' in stored:
+                body = base64.b64decode(stored['body_b64'])
+            else:  # recorded as decoded text before bodies were kept as bytes
+                body = stored['body'].encode(encoding, errors='replace')
+            exchange = Exchange(row.status, stored['headers'], body, encoding, row.elapsed_ms,
+                                stored.get('size', len(body)), bool(stored.get('truncated')))
+            tape._index.setdefault(row.match_key, []).append(exchange)
+            path_key = match_key(row.method, _path(row.url), bytes.fromhex(stored['body_digest']))
+            tape._by_path.setdefault(path_key, []).append(exchange)
+        return tape
+
+    def capture(self, prepared, status: int, headers: Mapping[str, str], body, elapsed_ms: Optional[float]) -> None:
+        """Keep one exchange of a recording run (``body`` is a CapturedBody).
+
+        The captured bytes are stored as is (base64), so binary bodies replay
+        exactly; bodies larger than the capture limit keep only their head and
+        are flagged as truncated.
+        """
+        digest = hashlib.sha256(canonical_body(prepared.json, prepared.data)).digest()
+        entry = {
+            'match_key': match_key(prepared.method, prepared.url, digest),
+            'method': prepared.method.upper(),
+            'url': prepared.url,
+            'status': status,
+            'elapsed_ms': elapsed_ms,
+            'artifact': {
+                'headers': {k: v for k, v in headers.items() if k.lower() not in HOP_HEADERS},
+                'body_b64': base64.b64encode(body.head).decode('ascii'),
+                'encoding': body.encoding,
+                'size': body.size,
+                'truncated': body.truncated,
+                'body_digest': digest.hex(),
+            },
+        }
+        with self._lock:
+            self._captured.append(entry)
+
+    def _next(self, index: Dict[str, List[Exchange]], key: str) -> Optional[Exchange]:
+        with self._lock:
+            exchanges = index.get(key)
+            if not exchanges:
+                self.misses += 1
+                return None
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+            self.hits += 1
+        return exchanges[min(served, len(exchanges) - 1)]
+
+    def replay(self, prepared) -> Optional[Exchange]:
+        """Recorded response for a prepared request, or None when there is none"""
+        digest = hashlib.sha256(canonical_body(prepared.json, prepared.data)).digest()
+        return self._next(self._index, match_key(prepared.method, prepared.url, digest))
+
+    def replay_wire(self, method: str, path: str, body: bytes, content_type: str) -> Optional[Exchange]:
+        """Recorded response for a request received by the loopback server"""
+        digest = hashlib.sha256(wire_body(body, content_type)).digest()
+        return self._next(self._by_path, match_key(method, path, digest))
+
+    def save(self) -> int:
+        """Store captured exchanges (the caller commits); returns how many"""
+        with self._lock:
+            captured, self._captured = self._captured, []
+        for entry in captured:
+            blob, _ = artifacts.pack(entry.pop('artifact'))
+            db.session.add(RecordedExchange(recording_id=self.recording_id, artifact=blob, **entry))
+        return len(captured)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'recording_id': self.recording_id, 'hits': self.hits, 'misses': self.misses}
+
+
+def active() -> Optional[Tape]:
+    """The tape of the run in progress in this context, if any"""
+    return _active.get()
+
+
+@contextmanager
+def use(tape: Optional[Tape]) -> Iterator[Optional[Tape]]:
+    """Record into / replay from ``tape`` for sends made inside the block
+    (including worker threads that copy the context and asyncio tasks)"""
+    token = _active.set(tape)
+    try:
+        yield tape
+    finally:
+        _active.reset(token)
@@ -0,0 +1,204 @@
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional
+from urllib.parse import urlsplit
+from .options import flag, merge
+
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'TRACE'})
+
+# Circuit breaker defaults (per scheme/host/port, per process)
+FAILURE_THRESHOLD = 5  # consecutive failures that open the circuit
+RESET_TIMEOUT_S = 30.0  # open -> half-open after this long
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """When and how long to wait before re-sending a failed request.
+
+    Set in ``options.retry`` on an environment (inherited by children) and
+    overridden per request. Only idempotent methods are retried unless
+    ``idempotent_only`` is false. Delays use exponential backoff with full
+    jitter, or the server's Retry-After when it is shorter than ``max_delay``.
+    """
+    max_attempts: int = 3
+    base_delay: float = 0.2
+    max_delay: float = 5.0
+    retry_on_status: FrozenSet[int] = frozenset({429, 502, 503, 504})
+    idempotent_only: bool = True
+
+    @classmethod
+    def from_options(cls, *options: Optional[Mapping[str, Any]]) -> 'RetryPolicy':
+        """Merge ``retry`` settings, later option mappings winning"""
+        settings = merge('retry', _COERCE, options)
+        policy = cls(**settings)
+        if policy.max_attempts < 1 or policy.base_delay < 0 or policy.max_delay < 0:
+            raise ValueError('max_attempts must be >= 1 and delays must not be negative')
+        return policy
+
+    def allows(self, method: str) -> bool:
+        return self.max_attempts > 1 and (not self.idempotent_only or method.upper() in IDEMPOTENT_METHODS)
+
+    def should_retry(self, method: str, attempt: int, status: Optional[int] = None) -> bool:
+        """Retry after ``attempt`` failed with ``status`` (None for a transport error)?"""
+        if attempt >= self.max_attempts or not self.allows(method):
+            return False
+        return status is None or status in self.retry_on_status
+
+    def delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(max(0.0, float(retry_after)), self.max_delay)
+            except ValueError:
+                pass  # HTTP-date form: fall back to backoff
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+def _statuses(value: Any) -> FrozenSet[int]:
+    """One status, a comma-separated string or a list of statuses"""
+    if isinstance(value, bool):
+        raise TypeError('expected HTTP statuses')
+    if isinstance(value, int):
+        value = [value]
+    elif isinstance(value, str):
+        value = [s for s in value.split(',') if s.strip()]
+    statuses = frozenset(int(s) for s in value)
+    if any(not 100 <= s <= 599 for s in statuses):
+        raise ValueError('not an HTTP status')
+    return statuses
+
+
+_COERCE = {
+    'max_attempts': int,
+    'base_delay': float,
+    'max_delay': float,
+    'retry_on_status': _statuses,
+    'idempotent_only': flag,
+}
+
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+
+def host_key(url: str) -> str:
+    parts = urlsplit(url)
+    port = parts.port or {'http': 80, 'https': 443}.get(parts.scheme)
+    return f'{parts.scheme}://{parts.hostname or ""}:{port}'
+
+
+class CircuitOpen(Exception):
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f'Circuit open for {host}; failing fast (next probe in {retry_in:.1f}s)')
+        self.host = host
+        self.retry_in = retry_in
+
+
+@dataclass
+class CircuitBreaker:
+    """closed -> open after FAILURE_THRESHOLD consecutive failures; open
+    rejects immediately until RESET_TIMEOUT_S has passed, then lets one probe
+    through (half-open). The probe's outcome closes or re-opens it."""
+    host: str
+    failure_threshold: int = FAILURE_THRESHOLD
+    reset_timeout: float = RESET_TIMEOUT_S
+    state: str = 'closed'
+    failures: int = 0
+    opened_at: Optional[float] = None
+    probing: bool = False
+    total_failures: int = 0
+    total_rejected: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == 'open'
+
+    def before_call(self) -> None:
+        """Raise CircuitOpen unless a call may go out now"""
+        with self._lock:
+            if self.state == 'open':
+                waited = time.monotonic() - self.opened_at
+                if waited < self.reset_timeout:
+                    self.total_rejected += 1
+                    raise CircuitOpen(self.host, self.reset_timeout - waited)
+                self.state = 'half_open'
+            if self.state == 'half_open':
+                if self.probing:
+                    self.total_rejected += 1
+                    raise CircuitOpen(self.host, 0.0)
+                self.probing = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state, self.failures, self.probing, self.opened_at = 'closed', 0, False, None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.total_failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state, self.opened_at = 'open', time.monotonic()
+            self.probing = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_in = None
+            if self.state == 'open':
+                retry_in = round(max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 1)
+            return {
+                'host': self.host,
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'total_failures': self.total_failures,
+                'total_rejected': self.total_rejected,
+                'next_probe_in_s': retry_in,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(url: str) -> CircuitBreaker:
+    key = host_key(url)
+    breaker = _breakers.get(key)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(key, CircuitBreaker(key))
+    return breaker
+
+
+class _NoBreaker:
+    """Stands in for a host's breaker when calls must always go out and must
+    not count against the host (load tests measure it as it is)"""
+    is_open = False
+
+    def before_call(self) -> None:
+        pass
+
+    def record_success(self) -> None:
+        pass
+
+    def record_failure(self) -> None:
+        pass
+
+
+NO_BREAKER = _NoBreaker()
+
+
+def is_failure(status: Optional[int]) -> bool:
+    """Outcomes that count against a host: transport errors and 5xx"""
+    return status is None or status >= 500
+
+
+def breakers() -> List[Dict[str, Any]]:
+    return [b.to_dict() for b in sorted(_breakers.values(), key=lambda b: b.host)]
+
+
+def reset(host: Optional[str] = None) -> int:
+    """Close one host's breaker (or all); returns how many were reset"""
+    with _breakers_lock:
+        targets = [b for key, b in _breakers.items() if host is None or key == host]
+    for breaker in targets:
+        breaker.record_success()
+    return len(targets)
@@ -0,0 +1,175 @@
+import copy
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+# Bytes of a response body kept in memory and returned inline
+MAX_CAPTURE_BYTES = 1024 * 1024
+# Bodies larger than the capture limit are written here, up to MAX_SPILL_BYTES
+SPILL_DIR = os.path.join(tempfile.gettempdir(), 'action-runner-responses')
+MAX_SPILL_BYTES = 512 * 1024 * 1024
+SPILL_TTL_S = 3600
+CHUNK_SIZE = 64 * 1024
+
+HANDLE_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+_last_sweep = 0.0
+
+
+def init_app(app) -> None:
+    global MAX_CAPTURE_BYTES, SPILL_DIR, MAX_SPILL_BYTES
+    MAX_CAPTURE_BYTES = app.config.setdefault('RESPONSE_CAPTURE_BYTES', MAX_CAPTURE_BYTES)
+    SPILL_DIR = app.config.setdefault('RESPONSE_SPILL_DIR', SPILL_DIR)
+    MAX_SPILL_BYTES = app.config.setdefault('RESPONSE_SPILL_MAX_BYTES', MAX_SPILL_BYTES)
+
+
+def spill_path(handle: str) -> Optional[str]:
+    """Path of a spilled body, or None for an unknown/invalid handle"""
+    if not HANDLE_PATTERN.match(handle or ''):
+        return None
+    path = os.path.join(SPILL_DIR, handle)
+    return path if os.path.exists(path) else None
+
+
+def _sweep_spills() -> None:
+    """Drop spilled bodies older than SPILL_TTL_S (at most once a minute)"""
+    global _last_sweep
+    now = time.time()
+    if now - _last_sweep < 60:
+        return
+    _last_sweep = now
+    try:
+        entries = list(os.scandir(SPILL_DIR))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if now - entry.stat().st_mtime > SPILL_TTL_S:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+class CapturedBody:
+    """A response body read in chunks with bounded memory.
+
+    The first ``limit`` bytes stay in memory; if the body is larger, the
+    whole body is written to a spill file (capped at MAX_SPILL_BYTES) that
+    can be downloaded by handle. With ``spill=False`` the rest is only
+    counted (load tests, which never return the body). JSON is only parsed
+    when ``json`` or ``value()`` is first used.
+    """
+
+    def __init__(self, content_type: str = '', encoding: Optional[str] = None,
+                 limit: Optional[int] = None, content_encoding: Optional[str] = None,
+                 spill: bool = True):
+        self.content_type = content_type or ''
+        self.content_encoding = content_encoding
+        self.wire_size: Optional[int] = None  # compressed bytes on the wire, when known
+        self.encoding = encoding or 'utf-8'
+        self.limit = MAX_CAPTURE_BYTES if limit is None else limit
+        self.spill = spill
+        self.size = 0
+        self.handle: Optional[str] = None
+        self.spill_truncated = False
+        self._head = bytearray()
+        self._spill = None
+        self._json = None
+        self._json_parsed = False
+
+    @property
+    def truncated(self) -> bool:
+        return self.size > len(self._head)
+
+    @property
+    def complete(self) -> bool:
+        """False once reading stopped early (spill limit reached)"""
+        return not self.spill_truncated
+
+    def feed(self, chunk: bytes) -> bool:
+        """Add a chunk; returns False when the caller should stop reading"""
+        self.size += len(chunk)
+        room = self.limit - len(self._head)
+        if room > 0:
+            self._head += chunk[:room]
+        if self.size <= self.limit or not self.spill:
+            return True
+        if self._spill is None:
+            os.makedirs(SPILL_DIR, exist_ok=True)
+            _sweep_spills()
+            self.handle = uuid.uuid4().hex
+            self._spill = open(os.path.join(SPILL_DIR, self.handle), 'wb')
+            self._spill.write(self._head)
+            chunk = chunk[room:] if room > 0 else chunk
+        if self.size > MAX_SPILL_BYTES:
+            self.spill_truncated = True
+            self._spill.write(chunk[:max(0, len(chunk) - (self.size - MAX_SPILL_BYTES))])
+            return False
+        self._spill.write(chunk)
+        return True
+
+    def copy(self) -> 'CapturedBody':
+        """The same captured bytes with a parse cache of its own, so callers
+        sharing a response can't see each other's changes to its JSON"""
+        other = copy.copy(self)
+        other._json, other._json_parsed = None, False
+        return other
+
+    def close(self) -> 'CapturedBody':
+        if self._spill is not None:
+            self._spill.close()
+        return self
+
+    @property
+    def head(self) -> bytes:
+        """The captured bytes (the whole body unless truncated)"""
+        return bytes(self._head)
+
+    def mark_truncated(self, size: int) -> 'CapturedBody':
+        """Report ``size`` as the body's real size: for a head replayed from a
+        recording that could not keep the whole body"""
+        self.size = max(self.size, size)
+        return self
+
+    @property
+    def text(self) -> str:
+        """Captured text (the in-memory head only for truncated bodies)"""
+        return bytes(self._head).decode(self.encoding, errors='replace')
+
+    @property
+    def json(self) -> Any:
+        """Parsed JSON, or None if the body is truncated or not JSON"""
+        if not self._json_parsed:
+            self._json_parsed = True
+            if not self.truncated:
+                try:
+                    self._json = json.loads(self.text)
+                except ValueError:
+                    self._json = None
+        return self._json
+
+    def value(self) -> Any:
+        """What callers see as the response data: parsed JSON when the whole
+        body is captured and parses, otherwise text with a truncation marker"""
+        if not self.truncated:
+            parsed = self.json
+            return parsed if parsed is not None else self.text
+        marker = f'\n...[truncated: showing {len(self._head)} of {self.size}{"+" if self.spill_truncated else ""} bytes'
+        if self.handle:
+            marker += f'; full body at /api/responses/{self.handle}'
+        return self.text + marker + ']'
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            'size': self.size,
+            'captured': len(self._head),
+            'truncated': self.truncated,
+            'complete': self.complete,
+            'content_type': self.content_type,
+            'content_encoding': self.content_encoding,
+            'wire_size': self.wire_size,
+            'download_url': f'/api/responses/{self.handle}' if self.handle else None,
+        }
@@ -0,0 +1,27 @@
+from typing import Any, Dict, Optional
+from .. import db
+from ..models import RequestRun
+from . import artifacts
+
+
+def record(request_id: int, environment_id: Optional[int], result: Dict[str, Any],
+           source: str = 'send') -> RequestRun:
+    """Add a RequestRun for a send result to the session (the caller commits)"""
+    run = RequestRun(
+        request_id=request_id,
+        environment_id=environment_id,
+        source=source,
+        ok=bool(result.get('ok')),
+        status=result.get('status'),
+        error=result.get('error'),
+        response_size=(result.get('body') or {}).get('size'),
+        timings=result.get('timings') or {},
+    )
+    if 'headers' in result:
+        run.artifact, run.artifact_size = artifacts.pack({
+            'headers': result['headers'],
+            'body': result.get('body'),
+            'data': result.get('data'),
+        })
+    db.session.add(run)
+    return run
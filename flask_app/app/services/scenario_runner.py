@@ -0,0 +1,130 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from itertools import groupby
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from flask import current_app
+from .. import tracing
+from ..models import RequestModel, Scenario, ScenarioStep
+from . import backends
+from .env_snapshots import EnvironmentSnapshot
+from .scopes import VariableScope
+
+MAX_PARALLEL_STEPS = 8
+
+
+def in_app_context(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap ``fn`` for a worker thread: it runs under its own app context of
+    the current app, so it can query and gets a database session of its own
+    (sessions are scoped to the app context and are not thread-safe)."""
+    app = current_app._get_current_object()
+
+    @wraps(fn)
+    def run(*args, **kwargs):
+        with app.app_context():
+            return fn(*args, **kwargs)
+    return run
+
+
+def _step_span(step: ScenarioStep):
+    return tracing.span('step', step_id=step.id, step_type=step.step_type, ref_id=step.ref_id, order=step.order)
+
+
+def _run_step(step: ScenarioStep, requests_by_id: Dict[int, RequestModel],
+              snapshot: Optional[EnvironmentSnapshot], scope: VariableScope) -> Optional[Dict[str, Any]]:
+    with _step_span(step):
+        if step.step_type == 'request':
+            req = requests_by_id.get(step.ref_id)
+            if req:
+                return {'step': step.id, 'result': backends.load('http').send_http_request(req, snapshot, scope)}
+        elif step.step_type == 'action':
+            return {'step': step.id, 'result': backends.load('selenium').run_selenium_action_demo()}
+        return None
+
+
+async def _run_step_async(engine, step: ScenarioStep, requests_by_id: Dict[int, RequestModel],
+                          snapshot: Optional[EnvironmentSnapshot], scope: VariableScope) -> Optional[Dict[str, Any]]:
+    if step.step_type == 'request':
+        req = requests_by_id.get(step.ref_id)
+        with _step_span(step):
+            return {'step': step.id, 'result': await engine.send(req, snapshot, scope)} if req else None
+    # Non-HTTP steps block, so they run off the event loop
+    return await asyncio.to_thread(in_app_context(_run_step), step, requests_by_id, snapshot, scope)
+
+
+def _run_groups(steps: List[ScenarioStep], requests_by_id: Dict[int, RequestModel],
+                snapshot: Optional[EnvironmentSnapshot], run_scope: VariableScope) -> Tuple[List, Dict]:
+    results: List[Dict[str, Any]] = []
+    conflicts: Dict[str, List[str]] = {}
+    for _, group in groupby(steps, key=lambda st: st.order):
+        group = sorted(group, key=lambda st: st.id)
+        if len(group) == 1:
+            step_scope = run_scope.child(f'step:{group[0].id}')
+            result = _run_step(group[0], requests_by_id, snapshot, step_scope)
+            step_scope.commit()
+            if result:
+                results.append(result)
+            continue
+
+        branches = run_scope.fork([f'step:{st.id}' for st in group])
+        # Each step runs in a copy of this context so a recording/replay tape follows it
+        contexts = [contextvars.copy_context() for _ in group]
+        run_step = in_app_context(_run_step)
+        with ThreadPoolExecutor(max_workers=min(len(group), MAX_PARALLEL_STEPS)) as pool:
+            group_results = list(pool.map(
+                lambda args: args[2].run(run_step, args[0], requests_by_id, snapshot, args[1]),
+                zip(group, branches, contexts)
+            ))
+        conflicts.update(run_scope.merge(branches))
+        results.extend(r for r in group_results if r)
+    return results, conflicts
+
+
+async def _run_groups_async(steps: List[ScenarioStep], requests_by_id: Dict[int, RequestModel],
+                            snapshot: Optional[EnvironmentSnapshot], run_scope: VariableScope) -> Tuple[List, Dict]:
+    """Same ordering and merge rules as ``_run_groups``; a parallel group is
+    gathered on the event loop instead of a thread pool, so its width is
+    bounded only by the engine's per-host limit."""
+    results: List[Dict[str, Any]] = []
+    conflicts: Dict[str, List[str]] = {}
+    async with backends.load('async_http').AsyncHttpEngine() as engine:
+        for _, group in groupby(steps, key=lambda st: st.order):
+            group = sorted(group, key=lambda st: st.id)
+            branches = run_scope.fork([f'step:{st.id}' for st in group])
+            group_results = await asyncio.gather(*(
+                _run_step_async(engine, step, requests_by_id, snapshot, branch)
+                for step, branch in zip(group, branches)
+            ))
+            conflicts.update(run_scope.merge(branches))
+            results.extend(r for r in group_results if r)
+    return results, conflicts
+
+
+def run_scenario(scenario: Scenario, snapshot: Optional[EnvironmentSnapshot], engine: str = 'threads') -> Dict[str, Any]:
+    """Run a scenario's steps in order, carrying script variables forward.
+
+    Each step writes into its own overlay, committed to the run scope when
+    the step finishes, so later steps see variables set by earlier post
+    scripts. Steps that share the same ``order`` form a parallel group: they
+    run concurrently on isolated overlays that are merged by step id.
+    ``engine='async'`` sends request steps with the asyncio engine.
+    """
+    steps = list(scenario.steps)
+    request_ids = [st.ref_id for st in steps if st.step_type == 'request']
+    requests_by_id = {r.id: r for r in RequestModel.query.filter(RequestModel.id.in_(request_ids))} if request_ids else {}
+    run_scope = VariableScope.for_run(snapshot.variables if snapshot else None)
+
+    if engine == 'async':
+        results, conflicts = asyncio.run(_run_groups_async(steps, requests_by_id, snapshot, run_scope))
+    else:
+        results, conflicts = _run_groups(steps, requests_by_id, snapshot, run_scope)
+
+    variables = run_scope.local
+    return {
+        'scenario_id': scenario.id,
+        'snapshot_id': snapshot.id if snapshot else None,
+        'results': results,
+        'variables': snapshot.mask(variables) if snapshot else variables,
+        'conflicts': conflicts,
+    }
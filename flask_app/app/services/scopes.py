@@ -0,0 +1,118 @@
+from typing import Any, Dict, Iterator, List, Mapping, MutableMapping, Optional, Sequence, Tuple
+
+_DELETED = object()
+
+
+class VariableScope(MutableMapping):
+    """Copy-on-write variable layer.
+
+    Lookups fall through to the parent chain (global -> environment ->
+    scenario run -> step); writes only ever touch this layer, so a step can
+    change variables without copying the dicts underneath it. ``commit``
+    publishes a layer's writes to its parent.
+    """
+
+    def __init__(self, layer: Optional[Mapping[str, Any]] = None,
+                 parent: Optional['VariableScope'] = None,
+                 name: str = '', read_only: bool = False):
+        self.parent = parent
+        self.name = name
+        self.read_only = read_only
+        # Read-only layers wrap the caller's mapping (e.g. a snapshot) without copying
+        self._local: Mapping[str, Any] = layer if read_only and layer is not None else dict(layer or {})
+
+    @classmethod
+    def for_run(cls, environment: Optional[Mapping[str, Any]] = None,
+                global_vars: Optional[Mapping[str, Any]] = None) -> 'VariableScope':
+        """global -> environment -> run layers for one scenario/suite run"""
+        scope = cls(global_vars or {}, name='global', read_only=True)
+        scope = cls(environment or {}, parent=scope, name='environment', read_only=True)
+        return scope.child('run')
+
+    def child(self, name: str = '') -> 'VariableScope':
+        return VariableScope(parent=self, name=name)
+
+    @property
+    def local(self) -> Dict[str, Any]:
+        """Values written in this layer (deletions excluded)"""
+        return {k: v for k, v in self._local.items() if v is not _DELETED}
+
+    def __getitem__(self, key: str) -> Any:
+        scope = self
+        while scope is not None:
+            if key in scope._local:
+                value = scope._local[key]
+                if value is _DELETED:
+                    break
+                return value
+            scope = scope.parent
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if self.read_only:
+            raise TypeError(f"Variable layer '{self.name}' is read-only")
+        self._local[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        # Tombstone hides inherited values without touching the parent
+        self[key] = _DELETED
+
+    def __iter__(self) -> Iterator[str]:
+        seen = set()
+        scope = self
+        while scope is not None:
+            for key, value in scope._local.items():
+                if key not in seen:
+                    seen.add(key)
+                    if value is not _DELETED:
+                        yield key
+            scope = scope.parent
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __contains__(self, key: object) -> bool:
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def flatten(self) -> Dict[str, Any]:
+        """Materialize the visible variables (only when a plain dict is required)"""
+        return {key: self[key] for key in self}
+
+    def commit(self) -> None:
+        """Publish this layer's writes (and deletions) to the parent and reset it"""
+        if self.parent is None:
+            return
+        for key, value in self._local.items():
+            if value is _DELETED:
+                self.parent.pop(key, None)
+            else:
+                self.parent[key] = value
+        self._local = {}
+
+    def fork(self, names: Sequence[str]) -> List['VariableScope']:
+        """Isolated overlays for parallel branches"""
+        return [self.child(name) for name in names]
+
+    def merge(self, branches: Sequence['VariableScope']) -> Dict[str, List[str]]:
+        """Fold parallel branches back into this scope in the given order.
+
+        The last branch to write a key wins, so the result only depends on
+        branch order, never on which thread finished first. Returns the keys
+        that branches set to different values, with the branch names involved.
+        """
+        writers: Dict[str, List[Tuple[str, Any]]] = {}
+        for branch in branches:
+            for key, value in branch._local.items():
+                writers.setdefault(key, []).append((branch.name, value))
+            branch.commit()
+        return {
+            key: [name for name, _ in values]
+            for key, values in writers.items()
+            if len({repr(v) for _, v in values}) > 1
+        }
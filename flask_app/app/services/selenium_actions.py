@@ -2,14 +2,18 @@ from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from webdriver_manager.chrome import ChromeDriverManager
+from .. import metrics, tracing
 
 
+@metrics.instrumented('selenium', 'run_action', ok=lambda result: result.get('ok'))
+@tracing.spanned('selenium.action')
 def run_selenium_action_demo():
     """Simple Selenium demo that opens example.com and captures title."""
     try:
         options = webdriver.ChromeOptions()
         options.add_experimental_option('excludeSwitches', ['enable-logging'])
-        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+        with metrics.BACKEND_SECONDS.labels('selenium', 'browser_start').time(), tracing.span('browser_start'):
+            driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
         driver.set_window_size(1200, 800)
         driver.get('https://example.com')
         title = driver.title
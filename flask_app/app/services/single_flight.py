@@ -0,0 +1,130 @@
+import asyncio
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Optional, Tuple
+from .options import flag, merge
+
+# Only bodiless, side-effect free requests are ever shared
+COALESCE_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+AUTH_HEADERS = frozenset({'authorization', 'proxy-authorization', 'cookie', 'x-api-key'})
+
+
+@dataclass(frozen=True)
+class CoalesceRule:
+    """Which concurrent sends may share one upstream call.
+
+    Opt-in via ``options.coalesce`` on an environment or request. Two sends
+    share a call when method, URL and the key headers match: all resolved
+    headers unless ``headers`` names a subset. Credentials (Authorization,
+    Cookie, ...) are part of the key unless ``include_auth`` is false, which
+    lets different users share a response - only for public data.
+    """
+    enabled: bool = False
+    headers: Optional[FrozenSet[str]] = None
+    include_auth: bool = True
+
+    @classmethod
+    def from_options(cls, *options) -> 'CoalesceRule':
+        """Merge ``coalesce`` settings, later option mappings winning"""
+        settings = merge('coalesce', _COERCE, options)
+        return cls(**settings)
+
+    def applies(self, method: str) -> bool:
+        return self.enabled and method.upper() in COALESCE_METHODS
+
+    def key(self, prepared) -> str:
+        """Digest identifying sends that may share a response"""
+        headers = []
+        for name, value in prepared.headers.items():
+            name = name.lower()
+            if name in AUTH_HEADERS:
+                if not self.include_auth:
+                    continue
+            elif self.headers is not None and name not in self.headers:
+                continue
+            headers.append((name, str(value)))
+        material = [prepared.method.upper(), prepared.url, sorted(headers), prepared.json, prepared.data]
+        return hashlib.sha256(json.dumps(material, default=str).encode('utf-8')).hexdigest()
+
+
+_COERCE = {
+    'enabled': flag,
+    'headers': lambda names: None if names is None else frozenset(str(n).lower() for n in names),
+    'include_auth': flag,
+}
+
+NO_COALESCING = CoalesceRule()
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """At most one call per key at a time across threads; callers arriving
+    while it runs wait for it and get the same result"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """(result, shared): ``shared`` is True for callers that waited"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        future = self._calls.get(key)
+        if future is not None:
+            # shield: a waiter being cancelled must not cancel the shared call
+            return await asyncio.shield(future), True
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # retrieved, even when nobody was waiting
+            raise
+        finally:
+            del self._calls[key]
+        future.set_result(result)
+        return result, False
+
+
+# Shared by every request thread in this process
+flights = SingleFlight()
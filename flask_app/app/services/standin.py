@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """Echo endpoint whose latency, status and size are set per request.
+
+    Query parameters: ``delay_ms`` (added latency), ``status`` (response
+    code) and ``size`` (bytes of padding in the JSON body). Defaults come
+    from the server instance.
+    """
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; with Nagle on, small responses
+    # wait ~40ms for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self):
+        query = parse_qs(urlparse(self.path).query)
+        delay_ms = float(query.get('delay_ms', [self.server.delay_ms])[0])
+        status = int(query.get('status', [self.server.status])[0])
+        size = int(query.get('size', [0])[0])
+
+        length = int(self.headers.get('Content-Length') or 0)
+        received = self.rfile.read(length) if length else b''
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+
+        body = json.dumps({
+            'method': self.command,
+            'path': self.path,
+            'received_bytes': len(received),
+            'padding': 'x' * size,
+        }).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = _respond
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    """Answers from a replay tape, matching method, path + query and body"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        received = self.rfile.read(length) if length else b''
+        tape = self.server.tape
+        exchange = tape.replay_wire(self.command, self.path, received, self.headers.get('Content-Type', ''))
+        if exchange is None:
+            status, headers = 404, {'Content-Type': 'application/json', 'X-Replay': 'miss'}
+            body = json.dumps({'error': f'No recorded response for {self.command} {self.path}'}).encode('utf-8')
+        elif exchange.truncated:
+            # Serving the recorded head as a complete body would mislead the client
+            status, headers = 502, {'Content-Type': 'application/json', 'X-Replay': 'truncated'}
+            body = json.dumps({'error': f'Recorded response for {self.command} {self.path} was truncated at '
+                                        f'{len(exchange.body)} of {exchange.size} bytes'}).encode('utf-8')
+        else:
+            if tape.simulate_latency and exchange.elapsed_ms:
+                time.sleep(exchange.elapsed_ms / 1000)
+            status, headers, body = exchange.status, exchange.headers, exchange.body
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = do_OPTIONS = _respond
+
+
+class _StandInHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops SYNs when many clients connect at once,
+    # which shows up as 1s connect retries
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # Clients that stop reading early (capped captures, stopped load tests) are expected
+        pass
+
+
+class StandInServer:
+    """Local HTTP server standing in for a system under test.
+
+    Usable as a context manager in scripts and benchmarks::
+
+        with StandInServer(delay_ms=5) as server:
+            send_to(server.url + '/users')
+    """
+
+    handler_class = _StandInHandler
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, delay_ms: float = 0, status: int = 200):
+        self.httpd = _StandInHTTPServer((host, port), self.handler_class)
+        self.httpd.delay_ms = delay_ms
+        self.httpd.status = status
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'StandInServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> 'StandInServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+class ReplayServer(StandInServer):
+    """Loopback server that answers from a recording (see services/recordings).
+
+    Point an environment's base URL at it to run anything that speaks HTTP
+    against recorded responses.
+    """
+    handler_class = _ReplayHandler
+
+    def __init__(self, tape, host: str = '127.0.0.1', port: int = 0):
+        super().__init__(host, port)
+        self.httpd.tape = tape
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional
+from flask_login import current_user
+from sqlalchemy.orm import joinedload
+from .. import tracing
+from ..models import DatabaseConnection, RequestModel, TestCase, TestSuite, TestSuiteCase
+from . import assertions, backends
+from .auth import AuthService
+from .env_snapshots import EnvironmentSnapshot
+from .scenario_runner import in_app_context
+
+
+def _api_request(case: TestCase) -> RequestModel:
+    """Build an unsaved RequestModel from an API test case's test_data"""
+    data = case.test_data or {}
+    url = data.get('url') or data.get('endpoint', '')
+    if url and not url.startswith(('http://', 'https://', '{{')):
+        # Relative endpoints resolve against the environment's base_url
+        url = '{{base_url}}' + url
+    payload = data.get('payload', data.get('body', ''))
+    return RequestModel(
+        name=case.name,
+        method=data.get('method', 'GET'),
+        url=url,
+        headers=data.get('headers', {}),
+        body=payload if isinstance(payload, str) else json.dumps(payload),
+        payload_type=data.get('payload_type', 'json'),
+        pre_script=data.get('pre_script', ''),
+        post_script=data.get('post_script', ''),
+        options={k: data[k] for k in ('connect_timeout', 'read_timeout') if k in data},
+    )
+
+
+def _database_config(connection: DatabaseConnection) -> Dict[str, Any]:
+    return {
+        'host': connection.host,
+        'port': connection.port,
+        'service_name': connection.database_name,
+        'username': connection.username,
+        'password': connection.password
+    }
+
+
+def _connection_for(connection_id: Any) -> Optional[DatabaseConnection]:
+    """The connection a database case points at, if it belongs to the running user"""
+    if connection_id is None or not current_user.is_authenticated:
+        return None
+    return DatabaseConnection.query.filter_by(id=connection_id, created_by_id=current_user.id).first()
+
+
+def _verdict(case: TestCase, result: Dict[str, Any], ok: bool) -> str:
+    """Check the case's assertions against its result (adding the per-assertion
+    report to it) and return the case status"""
+    try:
+        checks = assertions.for_case(case)
+    except assertions.AssertionSyntaxError as e:
+        result['assertion_error'] = str(e)
+        return 'error'
+    passed, report = assertions.evaluate(checks, result)
+    if report:
+        result['assertions'] = report
+    return 'passed' if ok and passed else 'failed'
+
+
+def _case_result(case: TestCase, status: str, started: float, result: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'case_id': case.id,
+        'name': case.name,
+        'status': status,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+        'result': result,
+    }
+
+
+@tracing.spanned('case')
+def run_test_case(case: TestCase, env: Optional[EnvironmentSnapshot]) -> Dict[str, Any]:
+    """Execute a single test case and report whether it passed"""
+    tracing.annotate(case_id=case.id, test_type=case.test_type)
+    data = case.test_data or {}
+    started = time.perf_counter()
+    try:
+        if case.test_type == 'api':
+            result = backends.load('http').send_http_request(_api_request(case), env)
+            ok = result.get('ok', False)
+        elif case.test_type == 'selenium':
+            result = backends.load('selenium').run_selenium_action_demo()
+            ok = result.get('ok', False)
+        elif case.test_type == 'database':
+            # Connections are private to their owner, like the /api/db-connections routes
+            connection = _connection_for(data.get('connection_id'))
+            if connection is None:
+                result = {'success': False, 'error': 'Database connection not found'}
+                return _case_result(case, 'error', started, result)
+            oracle_client = backends.load('oracle').OracleClient()
+            result = oracle_client.execute_query(_database_config(connection), data.get('query', ''), data.get('parameters'))
+            ok = result.get('success', False)
+        else:
+            result = {'success': False, 'error': f'Unsupported test type: {case.test_type}'}
+            ok = False
+        with tracing.span('assertions'):
+            status = _verdict(case, result, ok)
+    except backends.BackendUnavailable as e:
+        result, status = {'success': False, 'error': str(e)}, 'error'
+
+    return _case_result(case, status, started, result)
+
+
+async def _run_cases_async(cases: List[TestCase], env: Optional[EnvironmentSnapshot]) -> List[Dict[str, Any]]:
+    """API cases are sent concurrently on the asyncio engine; the others
+    (database queries, Selenium) block, so they run one after another in a
+    worker thread with its own app context while the API cases are in flight."""
+    async def run_api(engine, case: TestCase) -> Dict[str, Any]:
+        with tracing.span('case', case_id=case.id, test_type=case.test_type):
+            started = time.perf_counter()
+            result = await engine.send(_api_request(case), env)
+            with tracing.span('assertions'):
+                status = _verdict(case, result, result.get('ok', False))
+            return _case_result(case, status, started, result)
+
+    async with backends.load('async_http').AsyncHttpEngine() as engine:
+        api_runs = {i: asyncio.ensure_future(run_api(engine, case)) for i, case in enumerate(cases) if case.test_type == 'api'}
+        run_blocking = in_app_context(run_test_case)
+        results = [None if i in api_runs else await asyncio.to_thread(run_blocking, case, env)
+                   for i, case in enumerate(cases)]
+        api_results = dict(zip(api_runs, await asyncio.gather(*api_runs.values())))
+    return [api_results[i] if r is None else r for i, r in enumerate(results)]
+
+
+def run_test_suite(suite: TestSuite, env: Optional[EnvironmentSnapshot], engine: str = 'threads') -> Dict[str, Any]:
+    """Run a suite's cases in order, skipping the ones the user may not execute.
+
+    With ``engine='async'`` API cases run concurrently; results keep suite order.
+    """
+    suite_cases = TestSuiteCase.query.options(joinedload(TestSuiteCase.test_case)).filter_by(
+        test_suite_id=suite.id
+    ).order_by(TestSuiteCase.order).all()
+    permissions = AuthService.permissions_for('test_case', [sc.test_case_id for sc in suite_cases])
+
+    results = []
+    runnable = []
+    for suite_case in suite_cases:
+        case = suite_case.test_case
+        if 'execute' not in permissions.get(case.id, ()):
+            results.append({'case_id': case.id, 'name': case.name, 'status': 'skipped',
+                            'reason': 'No execute permission'})
+            continue
+        results.append(None)
+        runnable.append(case)
+
+    if engine == 'async':
+        case_results = iter(asyncio.run(_run_cases_async(runnable, env)))
+    else:
+        case_results = (run_test_case(case, env) for case in runnable)
+    results = [next(case_results) if r is None else r for r in results]
+
+    summary = {status: 0 for status in ('passed', 'failed', 'error', 'skipped')}
+    for r in results:
+        summary[r['status']] += 1
+    return {
+        'suite_id': suite.id,
+        'snapshot_id': env.id if env else None,
+        'summary': summary,
+        'results': results
+    }
@@ -0,0 +1,324 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+from urllib.parse import urlsplit
+from sqlalchemy import delete, func, select, text, update
+from .. import db, metrics, tracing
+from ..models import ThrottleBucket, ThrottleLease
+from .options import merge
+from .resilience import host_key
+
+# Per-host limits for every sender in the process: {"api.qa.local": {"rate": 20}, ...}
+# (keys are hostnames or scheme://host:port)
+HOST_LIMITS: Dict[str, 'Limits'] = {}
+# 'local': limits hold per process; 'database': shared by every worker using the database
+STORE = 'local'
+LEASE_TTL_S = 300.0  # a concurrency slot held longer than this is presumed abandoned
+POLL_INTERVAL_S = 0.01  # recheck period while every concurrency slot is taken
+# The database store is polled with a row lock per attempt, so its waiters back
+# off (with jitter) from DB_POLL_MIN_S up to DB_POLL_MAX_S between attempts
+DB_POLL_MIN_S = 0.05
+DB_POLL_MAX_S = 1.0
+
+Target = Tuple[str, 'Limits']
+
+logger = logging.getLogger(__name__)
+
+_QUEUED = metrics.QUEUED.labels('throttle')  # sends acquiring throttle slots
+
+
+def init_app(app) -> None:
+    global HOST_LIMITS, STORE, LEASE_TTL_S, DB_POLL_MAX_S, _store
+    hosts = app.config.setdefault('THROTTLE_HOSTS', {})
+    HOST_LIMITS = {host: Limits.from_options({'throttle': settings}) for host, settings in hosts.items()}
+    STORE = app.config.setdefault('THROTTLE_STORE', os.getenv('THROTTLE_STORE', STORE))
+    LEASE_TTL_S = app.config.setdefault('THROTTLE_LEASE_TTL_S', LEASE_TTL_S)
+    DB_POLL_MAX_S = app.config.setdefault('THROTTLE_DB_POLL_MAX_S', DB_POLL_MAX_S)
+    if STORE not in ('local', 'database'):
+        raise ValueError(f"THROTTLE_STORE must be 'local' or 'database', not {STORE!r}")
+    _store = None
+    if STORE == 'database':
+        # Bound to this app's engine now: load-test and other worker threads have no app context
+        with app.app_context():
+            _store = DatabaseStore(db.engine)
+
+
+@dataclass(frozen=True)
+class Limits:
+    """How hard one target may be hit: ``rate`` requests/second (token bucket
+    of ``burst`` tokens, default max(1, rate)) and at most ``max_concurrency``
+    requests in flight. Either may be left unset."""
+    rate: Optional[float] = None
+    burst: Optional[float] = None
+    max_concurrency: Optional[int] = None
+
+    @classmethod
+    def from_options(cls, *options: Optional[Mapping[str, Any]]) -> 'Limits':
+        """Merge ``throttle`` settings, later option mappings winning"""
+        return cls(**merge('throttle', _COERCE, options))
+
+    @property
+    def capacity(self) -> float:
+        return self.burst or max(1.0, self.rate or 1.0)
+
+    def __bool__(self) -> bool:
+        return bool(self.rate or self.max_concurrency)
+
+
+def _positive(value: Any) -> float:
+    """A JSON number above zero; strings and null are rejected"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ValueError('expected a positive number')
+    return float(value)
+
+
+def _slots(value: Any) -> int:
+    if _positive(value) != int(value):
+        raise ValueError('expected a whole number')
+    return int(value)
+
+
+_COERCE = {
+    'rate': _positive,
+    'burst': _positive,
+    'max_concurrency': _slots,
+}
+
+
+class LocalStore:
+    """Buckets and in-flight counts for this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # name -> (tokens, refilled_at)
+        self._in_flight: Dict[str, int] = {}
+
+    def try_acquire(self, name: str, limits: Limits) -> Tuple[Any, float]:
+        """(lease, 0.0) when a token and a slot were taken, else (None, seconds to wait)"""
+        with self._lock:
+            in_flight = self._in_flight.get(name, 0)
+            if limits.max_concurrency and in_flight >= limits.max_concurrency:
+                return None, POLL_INTERVAL_S
+            if limits.rate:
+                now = time.monotonic()
+                tokens, refilled_at = self._buckets.get(name, (limits.capacity, now))
+                tokens = min(limits.capacity, tokens + (now - refilled_at) * limits.rate)
+                if tokens < 1:
+                    self._buckets[name] = (tokens, now)
+                    return None, (1 - tokens) / limits.rate
+                self._buckets[name] = (tokens - 1, now)
+            self._in_flight[name] = in_flight + 1
+            return name, 0.0
+
+    def release(self, lease: Any) -> None:
+        with self._lock:
+            self._in_flight[lease] -= 1
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            names = sorted(set(self._buckets) | set(self._in_flight))
+            return [{
+                'name': name,
+                'in_flight': self._in_flight.get(name, 0),
+                'tokens': round(self._buckets[name][0], 2) if name in self._buckets else None,
+            } for name in names]
+
+
+_ENSURE_BUCKET = text(
+    "INSERT INTO throttle_bucket (name, tokens, refilled_at) VALUES (:name, :tokens, :now) "
+    "ON CONFLICT (name) DO NOTHING"
+)
+
+
+class DatabaseStore:
+    """Buckets and leases in the database, shared by every worker process.
+
+    Each attempt is one short transaction on its own connection (never the
+    caller's session) that row-locks the bucket.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def try_acquire(self, name: str, limits: Limits) -> Tuple[Any, float]:
+        now = time.time()
+        with self.engine.begin() as conn:
+            conn.execute(_ENSURE_BUCKET, {'name': name, 'tokens': limits.capacity, 'now': now})
+            bucket = conn.execute(
+                select(ThrottleBucket.tokens, ThrottleBucket.refilled_at)
+                .where(ThrottleBucket.name == name).with_for_update()
+            ).one()
+            if limits.max_concurrency:
+                conn.execute(delete(ThrottleLease).where(ThrottleLease.name == name, ThrottleLease.expires_at < now))
+                held = conn.execute(
+                    select(func.count()).select_from(ThrottleLease).where(ThrottleLease.name == name)
+                ).scalar()
+                if held >= limits.max_concurrency:
+                    return None, POLL_INTERVAL_S
+            if limits.rate:
+                tokens = min(limits.capacity, bucket.tokens + max(0.0, now - bucket.refilled_at) * limits.rate)
+                wait = 0.0 if tokens >= 1 else (1 - tokens) / limits.rate
+                conn.execute(update(ThrottleBucket).where(ThrottleBucket.name == name).values(
+                    tokens=tokens if wait else tokens - 1, refilled_at=now))
+                if wait:
+                    return None, wait
+            if not limits.max_concurrency:
+                return 0, 0.0
+            result = conn.execute(ThrottleLease.__table__.insert().values(name=name, expires_at=now + LEASE_TTL_S))
+            return result.inserted_primary_key[0], 0.0
+
+    def release(self, lease: Any) -> None:
+        if lease:
+            with self.engine.begin() as conn:
+                conn.execute(delete(ThrottleLease).where(ThrottleLease.id == lease))
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        with self.engine.connect() as conn:
+            held = dict(conn.execute(
+                select(ThrottleLease.name, func.count()).where(ThrottleLease.expires_at >= now)
+                .group_by(ThrottleLease.name)
+            ).all())
+            buckets = dict(conn.execute(select(ThrottleBucket.name, ThrottleBucket.tokens)).all())
+        return [{
+            'name': name,
+            'in_flight': held.get(name, 0),
+            'tokens': round(buckets[name], 2) if name in buckets else None,
+        } for name in sorted(set(held) | set(buckets))]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def store():
+    """The configured store; the database one is created by ``init_app``, or
+    here from the current app when that did not run"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                try:
+                    _store = DatabaseStore(db.engine) if STORE == 'database' else LocalStore()
+                except Exception as e:
+                    raise ThrottleUnavailable(f'Throttle store unavailable: {e}') from e
+    return _store
+
+
+def targets(url: str, snapshot=None) -> List[Target]:
+    """Limits that apply to a send: the environment's (per target host), then the host's own"""
+    host = host_key(url)
+    found = []
+    settings = snapshot.options.get('throttle') if snapshot else None
+    if settings:
+        limits = Limits.from_options({'throttle': settings})
+        if limits:
+            found.append((f'env:{snapshot.environment_id}:{host}', limits))
+    limits = HOST_LIMITS.get(host) or HOST_LIMITS.get(urlsplit(url).hostname or '')
+    if limits:
+        found.append((host, limits))
+    return found
+
+
+class ThrottleUnavailable(Exception):
+    """The throttle store failed (e.g. the database is down); says nothing about the target host"""
+
+
+def _try_acquire(backend, name: str, limits: Limits) -> Tuple[Any, float]:
+    try:
+        return backend.try_acquire(name, limits)
+    except Exception as e:
+        raise ThrottleUnavailable(f'Throttle store unavailable: {e}') from e
+
+
+def _release(backend, lease: Any) -> None:
+    try:
+        backend.release(lease)
+    except Exception:
+        # The send already happened; an unreleased lease expires after LEASE_TTL_S
+        logger.warning('Could not release throttle lease %r', lease, exc_info=True)
+
+
+def _poll_delay(backend, wait: float, attempt: int) -> float:
+    """How long to sleep before the next attempt. Local waits are exact;
+    database waiters back off so a queue of them doesn't keep the bucket row
+    locked, with jitter so they don't retry in lockstep."""
+    if not isinstance(backend, DatabaseStore):
+        return wait
+    return max(wait, min(DB_POLL_MAX_S, DB_POLL_MIN_S * 2 ** min(attempt, 10))) * random.uniform(1.0, 1.5)
+
+
+@contextmanager
+def slot(limited: List[Target], timer=None) -> Iterator[None]:
+    """Hold a token and a concurrency slot on every target for the block.
+
+    Waits (never fails) while a target is at its limit; the wait is
+    reported as ``queue_ms`` on ``timer``. Store errors raise
+    ThrottleUnavailable, never the error types of the block.
+    """
+    if not limited:
+        yield
+        return
+    backend, held = store(), []
+    started = time.perf_counter()
+    try:
+        with _QUEUED.track(), tracing.span('throttle.wait'):
+            for name, limits in limited:
+                attempt = 0
+                while True:
+                    lease, wait = _try_acquire(backend, name, limits)
+                    if not wait:
+                        break
+                    time.sleep(_poll_delay(backend, wait, attempt))
+                    attempt += 1
+                held.append(lease)
+        if timer is not None:
+            timer.add('queue_ms', time.perf_counter() - started)
+        yield
+    finally:
+        for lease in held:
+            _release(backend, lease)
+
+
+@asynccontextmanager
+async def async_slot(limited: List[Target], timer=None):
+    """``slot`` for the asyncio engine (database calls run in a worker thread)"""
+    if not limited:
+        yield
+        return
+    backend, held = store(), []
+    shared = isinstance(backend, DatabaseStore)
+    started = time.perf_counter()
+    try:
+        with _QUEUED.track(), tracing.span('throttle.wait'):
+            for name, limits in limited:
+                attempt = 0
+                while True:
+                    if shared:
+                        lease, wait = await asyncio.to_thread(_try_acquire, backend, name, limits)
+                    else:
+                        lease, wait = _try_acquire(backend, name, limits)
+                    if not wait:
+                        break
+                    await asyncio.sleep(_poll_delay(backend, wait, attempt))
+                    attempt += 1
+                held.append(lease)
+        if timer is not None:
+            timer.add('queue_ms', time.perf_counter() - started)
+        yield
+    finally:
+        for lease in held:
+            if shared:
+                await asyncio.to_thread(_release, backend, lease)
+            else:
+                _release(backend, lease)
+
+
+def stats() -> Dict[str, Any]:
+    return {'store': STORE, 'targets': store().stats()}
@@ -0,0 +1,169 @@
+import socket
+import threading
+import time
+import weakref
+from typing import Any, Dict, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NameResolutionError, NewConnectionError
+from .. import metrics
+
+_local = threading.local()
+_sessions: 'weakref.WeakSet[requests.Session]' = weakref.WeakSet()  # one per live thread
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+class RequestTimer:
+    """Phase timings for one send.
+
+    ``dns``, ``connect`` and ``tls`` stay at 0 when a pooled keep-alive
+    connection is reused. ``ttfb`` is the wait between the connection being
+    ready and the response headers arriving.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {'dns_ms': 0.0, 'connect_ms': 0.0, 'tls_ms': 0.0}
+        self.reused = True
+        self.remote_address: Optional[str] = None
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = round(self.phases.get(phase, 0.0) + _ms(seconds), 3)
+
+    def set_ttfb(self, seconds_to_headers: float) -> None:
+        """Record time to first byte given the time from send start to headers"""
+        setup = self.phases['dns_ms'] + self.phases['connect_ms'] + self.phases['tls_ms']
+        self.phases['ttfb_ms'] = round(max(0.0, _ms(seconds_to_headers) - setup), 3)
+
+    def copy(self) -> 'RequestTimer':
+        other = RequestTimer()
+        other.adopt(self)
+        other.started = self.started
+        return other
+
+    def adopt(self, other: 'RequestTimer') -> None:
+        """Take over another send's network phases (a coalesced caller)"""
+        self.phases = dict(other.phases)
+        self.reused = other.reused
+        self.remote_address = other.remote_address
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            **self.phases,
+            'total_ms': _ms(time.perf_counter() - self.started),
+            'reused_connection': self.reused,
+            'remote_address': self.remote_address,
+        }
+
+
+def begin() -> RequestTimer:
+    """Start timing a send on this thread; the timing connections report into it"""
+    timer = _local.timer = RequestTimer()
+    return timer
+
+
+def _current() -> Optional[RequestTimer]:
+    return getattr(_local, 'timer', None)
+
+
+class TimingHTTPConnection(HTTPConnection):
+    """Resolves and connects in separate, timed steps"""
+
+    def _new_conn(self) -> socket.socket:
+        timer = _current()
+        if timer is None:
+            return super()._new_conn()
+        timer.reused = False
+        started = time.perf_counter()
+        try:
+            infos = socket.getaddrinfo(self._dns_host, self.port, 0, socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        finally:
+            resolved = time.perf_counter()
+            timer.add('dns_ms', resolved - started)
+
+        # Connect to the resolved addresses in order, like create_connection does
+        dns_host, error = self._dns_host, None
+        try:
+            for address in dict.fromkeys(info[4][0] for info in infos):
+                self._dns_host = address
+                try:
+                    sock = super()._new_conn()
+                except NewConnectionError as e:
+                    error = e
+                    continue
+                timer.remote_address = address
+                return sock
+            raise error
+        finally:
+            self._dns_host = dns_host
+            timer.add('connect_ms', time.perf_counter() - resolved)
+
+
+class TimingHTTPSConnection(TimingHTTPConnection, HTTPSConnection):
+    """Adds the TLS handshake time (connect() minus the TCP setup)"""
+
+    def connect(self) -> None:
+        timer = _current()
+        if timer is None:
+            return super().connect()
+        before = timer.phases['dns_ms'] + timer.phases['connect_ms']
+        started = time.perf_counter()
+        super().connect()
+        setup = timer.phases['dns_ms'] + timer.phases['connect_ms'] - before
+        timer.phases['tls_ms'] = round(max(0.0, _ms(time.perf_counter() - started) - setup), 3)
+
+
+class TimingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimingHTTPConnection
+
+
+class TimingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimingHTTPSConnection
+
+
+class TimingAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimingHTTPConnectionPool,
+            'https': TimingHTTPSConnectionPool,
+        }
+
+
+def session() -> requests.Session:
+    """This thread's Session: keep-alive pooling plus phase timing"""
+    s = getattr(_local, 'session', None)
+    if s is None:
+        s = _local.session = requests.Session()
+        adapter = TimingAdapter()
+        s.mount('http://', adapter)
+        s.mount('https://', adapter)
+        _sessions.add(s)
+    return s
+
+
+def pool_stats() -> Dict[Any, float]:
+    """Keep-alive pooling across this process's thread sessions (metrics callback)"""
+    sessions = pools = idle = 0
+    for s in list(_sessions):
+        sessions += 1
+        owned = s.get_adapter('http://').poolmanager.pools
+        for key in owned.keys():  # a thread-safe copy; values() refuses to iterate
+            pool = owned.get(key)
+            if pool is None or pool.pool is None:
+                continue
+            pools += 1
+            # the queue is pre-filled with None placeholders up to maxsize
+            idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+    return {('sessions',): sessions, ('host_pools',): pools, ('idle_connections',): idle}
+
+
+metrics.register_callback('http_pool', 'requests sessions, per-host pools and idle keep-alive connections',
+                          ('state',), pool_stats)
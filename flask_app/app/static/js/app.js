@@ -22,14 +22,26 @@ document.addEventListener('DOMContentLoaded', () => {
   tabs.forEach(btn => btn.addEventListener('click', () => setActive(btn.dataset.tab)));
   setActive('requests');
 
+  // List endpoints return one keyset page at a time; follow X-Next-Cursor to the end
+  async function fetchAll(url) {
+    const items = [];
+    let next = url;
+    while (next) {
+      const res = await fetch(next);
+      items.push(...await res.json());
+      const cursor = res.headers.get('X-Next-Cursor');
+      next = cursor ? `${url}${url.includes('?') ? '&' : '?'}after=${cursor}` : null;
+    }
+    return items;
+  }
+
   async function loadPanel(tabName) {
     if (tabName === 'requests') {
       await loadRequests();
       setupRequestHandlers();
     }
     if (tabName === 'scenarios') {
-      const res = await fetch('/api/scenarios');
-      const data = await res.json();
+      const data = await fetchAll('/api/scenarios');
       const list = document.getElementById('scenarios-list');
       list.innerHTML = data.map(s => `
         <div class="border border-slate-700/80 rounded-lg p-3 mb-2">
@@ -59,8 +71,7 @@ document.addEventListener('DOMContentLoaded', () => {
       };
     }
     if (tabName === 'environments') {
-      const res = await fetch('/api/environments');
-      const data = await res.json();
+      const data = await fetchAll('/api/environments?fields=name,description,variables');
       const list = document.getElementById('envs-list');
       list.innerHTML = data.map(e => `
         <div class="border border-slate-700/80 rounded-lg p-3 mb-2">
@@ -74,8 +85,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
   async function loadRequests() {
     try {
-      const res = await fetch('/api/requests');
-      allRequests = await res.json();
+      allRequests = await fetchAll('/api/requests');
       renderRequestsList();
     } catch (error) {
       console.error('Failed to load requests:', error);
@@ -105,8 +115,11 @@ document.addEventListener('DOMContentLoaded', () => {
     });
   }
 
-  function selectRequest(requestId) {
-    currentRequest = allRequests.find(r => r.id === requestId);
+  async function selectRequest(requestId) {
+    if (!allRequests.some(r => r.id === requestId)) return;
+    // The list only carries summaries; load headers/body for the editor
+    const res = await fetch(`/api/requests/${requestId}`);
+    currentRequest = res.ok ? await res.json() : null;
     if (currentRequest) {
       populateEditor(currentRequest);
       document.getElementById('request-editor').style.display = 'block';
@@ -219,7 +232,7 @@ document.addEventListener('DOMContentLoaded', () => {
         });
         const result = await res.json();
         await loadRequests();
-        selectRequest(result.id);
+        await selectRequest(result.id);
       } catch (error) {
         alert('Failed to create request: ' + error.message);
       }
@@ -267,6 +280,53 @@ document.addEventListener('DOMContentLoaded', () => {
       }
     };
 
+    // Load test button: closed model, results streamed while running
+    document.getElementById('load-test-btn').onclick = async () => {
+      if (!currentRequest) return;
+
+      const concurrency = parseInt(prompt('Virtual users', '10'), 10);
+      const duration = parseFloat(prompt('Duration (seconds)', '10'));
+      if (!concurrency || !duration) return;
+
+      const btn = document.getElementById('load-test-btn');
+      btn.disabled = true;
+      btn.textContent = 'Running...';
+      try {
+        const res = await fetch('/api/load-tests', {
+          method: 'POST',
+          headers: {'Content-Type': 'application/json'},
+          body: JSON.stringify({
+            target_type: 'request',
+            target_id: currentRequest.id,
+            mode: 'closed',
+            concurrency: concurrency,
+            duration_s: duration
+          })
+        });
+        const run = await res.json();
+        if (!res.ok) throw new Error(run.error || res.statusText);
+
+        const source = new EventSource(`/api/load-tests/${run.id}/stream`);
+        const render = (event) => showLoadTestResults(JSON.parse(event.data));
+        source.addEventListener('progress', render);
+        source.addEventListener('done', (event) => {
+          render(event);
+          source.close();
+          btn.disabled = false;
+          btn.textContent = 'Load Test';
+        });
+        source.onerror = () => {
+          source.close();
+          btn.disabled = false;
+          btn.textContent = 'Load Test';
+        };
+      } catch (error) {
+        alert('Load test failed: ' + error.message);
+        btn.disabled = false;
+        btn.textContent = 'Load Test';
+      }
+    };
+
     // Save request button
     document.getElementById('save-request-btn').onclick = async () => {
       if (!currentRequest) return;
@@ -279,7 +339,7 @@ document.addEventListener('DOMContentLoaded', () => {
           body: JSON.stringify(requestData)
         });
         await loadRequests();
-        currentRequest = allRequests.find(r => r.id === currentRequest.id);
+        await selectRequest(currentRequest.id);
         alert('Request saved successfully!');
       } catch (error) {
         alert('Failed to save request: ' + error.message);
@@ -314,6 +374,13 @@ document.addEventListener('DOMContentLoaded', () => {
         ${response.status} Success
       </span>`;
       bodyPre.textContent = JSON.stringify(response.data, null, 2);
+      if (response.timings) {
+        const t = response.timings;
+        statusDiv.innerHTML += ` <span class="text-xs text-slate-400">DNS ${t.dns_ms} · connect ${t.connect_ms} · TLS ${t.tls_ms} · TTFB ${t.ttfb_ms} · download ${t.download_ms} · total ${t.total_ms} ms</span>`;
+      }
+      if (response.body && response.body.download_url) {
+        statusDiv.innerHTML += ` <a href="${response.body.download_url}" class="text-xs text-blue-400 underline">Download full body (${response.body.size} bytes)</a>`;
+      }
     } else {
       statusDiv.innerHTML = `<span class="inline-flex items-center px-2.5 py-0.5 rounded-full text-xs font-medium bg-red-100 text-red-800">
         Error: ${response.error}
@@ -323,4 +390,20 @@ document.addEventListener('DOMContentLoaded', () => {
     
     responseSection.style.display = 'block';
   }
+
+  function showLoadTestResults(results) {
+    const latency = results.latency || {};
+    document.getElementById('response-status').innerHTML = `<span class="inline-flex items-center px-2.5 py-0.5 rounded-full text-xs font-medium ${results.error_count ? 'bg-red-100 text-red-800' : 'bg-green-100 text-green-800'}">
+        Load test ${results.status}: ${results.completed} requests, ${results.throughput_rps} req/s, ${results.error_count} errors
+      </span>`;
+    document.getElementById('response-body').textContent = JSON.stringify({
+      p50_ms: latency.p50_ms,
+      p95_ms: latency.p95_ms,
+      p99_ms: latency.p99_ms,
+      max_ms: latency.max_ms,
+      errors: results.errors,
+      elapsed_s: results.elapsed_s
+    }, null, 2);
+    document.getElementById('response-section').style.display = 'block';
+  }
 });
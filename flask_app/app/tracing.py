@@ -0,0 +1,553 @@
+"""Execution tracing: spans with parent/child ids for runs.
+
+A route decorated with ``traced`` opens the root span; code underneath
+opens children with ``span(...)``, which costs one ContextVar lookup when
+no trace is active. The current span lives in a ContextVar, so it follows
+scenario worker threads (copied contexts) and asyncio tasks.
+
+Finished spans are buffered and written in batches by a background thread
+to TRACE_DIR: ``spans-<date>.jsonl`` (one span per line) or, with
+TRACE_EXPORTER=otlp, ``otlp-<date>.jsonl`` (one OTLP/JSON
+ExportTraceServiceRequest per line, as the OpenTelemetry collector's file
+exporter writes). Files older than TRACE_RETENTION_DAYS are deleted.
+The newest TRACE_KEEP traces also stay in memory for the viewer.
+
+Only TRACE_SAMPLE_RATE of runs are traced (1% by default): a traced run
+records a span per database statement, which is fine for a sample but not
+for every run. A logged-in caller can force a trace of one call with
+``?trace=1`` or an ``X-Trace: 1`` header.
+"""
+import asyncio
+import atexit
+import contextvars
+import json
+import os
+import random
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+EXPORTER = 'jsonl'  # 'jsonl' | 'otlp' | 'none'
+TRACE_DIR: Optional[str] = None
+SAMPLE_RATE = 0.01
+RETENTION_DAYS = 7
+BATCH_SIZE = 256
+FLUSH_S = 2.0
+KEEP = 200
+SERVICE_NAME = 'autoflow'
+MAX_ATTRIBUTE_CHARS = 300
+TRACE_ID = re.compile(r'[0-9a-f]{32}')
+TRACE_FILE = re.compile(r'(spans|otlp)-(\d{4}-\d{2}-\d{2})\.jsonl')
+
+_current: contextvars.ContextVar[Optional['Span']] = contextvars.ContextVar('trace_span', default=None)
+_lock = threading.Lock()
+_buffer: List[Dict[str, Any]] = []
+_recent: 'OrderedDict[str, List[Dict[str, Any]]]' = OrderedDict()
+_wake = threading.Event()
+_flusher: Optional[threading.Thread] = None
+_pruned_day: Optional[str] = None
+
+
+def init_app(app) -> None:
+    global EXPORTER, TRACE_DIR, SAMPLE_RATE, RETENTION_DAYS, BATCH_SIZE, FLUSH_S, KEEP
+    EXPORTER = app.config.setdefault('TRACE_EXPORTER', os.getenv('TRACE_EXPORTER', EXPORTER))
+    if EXPORTER not in ('jsonl', 'otlp', 'none'):
+        raise ValueError(f"TRACE_EXPORTER must be 'jsonl', 'otlp' or 'none', not {EXPORTER!r}")
+    TRACE_DIR = app.config.setdefault('TRACE_DIR', os.getenv('TRACE_DIR') or os.path.join(app.instance_path, 'traces'))
+    SAMPLE_RATE = float(app.config.setdefault('TRACE_SAMPLE_RATE', os.getenv('TRACE_SAMPLE_RATE', SAMPLE_RATE)))
+    RETENTION_DAYS = int(app.config.setdefault('TRACE_RETENTION_DAYS', os.getenv('TRACE_RETENTION_DAYS', RETENTION_DAYS)))
+    BATCH_SIZE = app.config.setdefault('TRACE_BATCH_SIZE', BATCH_SIZE)
+    FLUSH_S = app.config.setdefault('TRACE_FLUSH_S', FLUSH_S)
+    KEEP = app.config.setdefault('TRACE_KEEP', KEEP)
+
+
+def safe_url(url: str) -> str:
+    """URL for a span attribute: no credentials or query string (they may carry tokens)"""
+    parts = urlsplit(url)
+    host = parts.hostname or ''
+    return f"{parts.scheme}://{host}{':' + str(parts.port) if parts.port else ''}{parts.path}"
+
+
+def _attribute(value: Any) -> Any:
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    value = str(value)
+    return value if len(value) <= MAX_ATTRIBUTE_CHARS else value[:MAX_ATTRIBUTE_CHARS] + '...'
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'attributes', 'start_ns', 'status', 'error',
+                 'thread', '_started', '_token')
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = {k: _attribute(v) for k, v in attributes.items()}
+        self.start_ns = time.time_ns()
+        self.status = 'ok'
+        self.error: Optional[str] = None
+        self.thread = threading.current_thread().name
+        self._started = time.perf_counter_ns()  # monotonic, for the duration
+        self._token = None
+
+    def set(self, **attributes: Any) -> None:
+        for key, value in attributes.items():
+            self.attributes[key] = _attribute(value)
+
+    def fail(self, error: Any) -> None:
+        self.status = 'error'
+        self.error = _attribute(error)
+
+    def end(self) -> None:
+        end_ns = self.start_ns + (time.perf_counter_ns() - self._started)
+        _finished({
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_ns': self.start_ns,
+            'end_ns': end_ns,
+            'duration_ms': round((end_ns - self.start_ns) / 1e6, 3),
+            'status': self.status,
+            'error': self.error,
+            'thread': self.thread,
+            'attributes': self.attributes,
+        })
+
+
+class _NoSpan:
+    """Yielded outside a trace so callers need no None checks"""
+    trace_id = None
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def fail(self, error: Any) -> None:
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+def current() -> Optional[Span]:
+    return _current.get()
+
+
+def annotate(**attributes: Any) -> None:
+    """Set attributes on the current span, if any"""
+    span = _current.get()
+    if span is not None:
+        span.set(**attributes)
+
+
+def trace_id() -> Optional[str]:
+    """Id of the trace in progress in this context, if any"""
+    span = _current.get()
+    return span.trace_id if span else None
+
+
+def start_span(name: str, **attributes: Any) -> Optional[Span]:
+    """A child of the current span, made current (end it with ``end_span``);
+    None outside a trace"""
+    parent = _current.get()
+    if parent is None:
+        return None
+    span = Span(parent.trace_id, parent.span_id, name, attributes)
+    span._token = _current.set(span)
+    return span
+
+
+def end_span(span: Optional[Span]) -> None:
+    if span is None:
+        return
+    if span._token is not None:
+        try:
+            _current.reset(span._token)
+        except ValueError:
+            pass  # ended from another context (e.g. a cursor event); the parent is still current there
+        span._token = None
+    span.end()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Any]:
+    """Child span of the current one for the block; outside a trace it
+    yields NO_SPAN and records nothing"""
+    child = start_span(name, **attributes)
+    if child is None:
+        yield NO_SPAN
+        return
+    try:
+        yield child
+    except BaseException as e:
+        child.fail(e)
+        raise
+    finally:
+        end_span(child)
+
+
+@contextmanager
+def trace(name: str, force: bool = False, **attributes: Any) -> Iterator[Any]:
+    """Root span of a new trace (subject to TRACE_SAMPLE_RATE unless
+    ``force``); nested under an existing trace it is just a child span"""
+    if _current.get() is not None:
+        with span(name, **attributes) as child:
+            yield child
+        return
+    if not force and (SAMPLE_RATE <= 0 or (SAMPLE_RATE < 1 and random.random() >= SAMPLE_RATE)):
+        yield NO_SPAN
+        return
+    root = Span(secrets.token_hex(16), None, name, attributes)
+    with _lock:
+        _recent[root.trace_id] = []
+        while len(_recent) > KEEP:
+            _recent.popitem(last=False)
+    token = _current.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.fail(e)
+        raise
+    finally:
+        _current.reset(token)
+        root.end()
+
+
+def spanned(name: str):
+    """Decorator: run the function (or coroutine function) in a child span"""
+    def decorator(f):
+        if asyncio.iscoroutinefunction(f):
+            @wraps(f)
+            async def decorated_coroutine(*args, **kwargs):
+                with span(name):
+                    return await f(*args, **kwargs)
+            return decorated_coroutine
+
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            with span(name):
+                return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def forced() -> bool:
+    """Did this request ask to be traced (``?trace=1`` or ``X-Trace: 1``)?"""
+    return request.args.get('trace') == '1' or request.headers.get('X-Trace') == '1'
+
+
+def traced(name: str):
+    """Trace a view: the root span carries the view args and the caller's id,
+    and the response an X-Trace-Id header. Logged-in callers may bypass
+    sampling with ``forced``; anonymous ones can't (traces cost storage)."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            from flask_login import current_user
+
+            user_id = current_user.id if current_user.is_authenticated else None
+            force = user_id is not None and forced()
+            with trace(name, force, endpoint=request.endpoint, user_id=user_id, **kwargs) as root:
+                response = current_app.make_response(f(*args, **kwargs))
+                root.set(status=response.status_code)
+                if response.status_code >= 500:
+                    root.fail(f'HTTP {response.status_code}')
+                if root.trace_id:
+                    response.headers['X-Trace-Id'] = root.trace_id
+                return response
+        return decorated_function
+    return decorator
+
+
+# Database statements inside a trace become db.query spans
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault('trace_spans', []).append(
+            start_span('db.query', statement=' '.join(statement.split())))
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get('trace_spans')
+    if spans:
+        end_span(spans.pop())
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    spans = conn.info.get('trace_spans') if conn is not None else None
+    if spans:
+        failed = spans.pop()
+        failed.fail(exception_context.original_exception)
+        end_span(failed)
+
+
+# Buffering and export
+
+def _finished(record: Dict[str, Any]) -> None:
+    with _lock:
+        kept = _recent.get(record['trace_id'])
+        if kept is not None:
+            kept.append(record)
+        if EXPORTER == 'none':
+            return
+        _buffer.append(record)
+        full = len(_buffer) >= BATCH_SIZE
+    _ensure_flusher()
+    if full:
+        _wake.set()
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': '' if value is None else str(value)}
+
+
+def to_otlp(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """An OTLP/JSON ExportTraceServiceRequest for a batch of spans"""
+    spans = []
+    for r in records:
+        attributes = dict(r['attributes'], **{'thread.name': r['thread']})
+        spans.append({
+            'traceId': r['trace_id'],
+            'spanId': r['span_id'],
+            'parentSpanId': r['parent_id'] or '',
+            'name': r['name'],
+            'kind': 1,  # internal
+            'startTimeUnixNano': str(r['start_ns']),
+            'endTimeUnixNano': str(r['end_ns']),
+            'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in attributes.items()],
+            'status': {'code': 2, 'message': r['error'] or ''} if r['status'] == 'error' else {'code': 1},
+        })
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+        'scopeSpans': [{'scope': {'name': SERVICE_NAME}, 'spans': spans}],
+    }]}
+
+
+def _from_otlp_value(value: Dict[str, Any]) -> Any:
+    if 'intValue' in value:
+        return int(value['intValue'])  # OTLP/JSON carries 64-bit ints as strings
+    return next(iter(value.values()), None)
+
+
+def _from_otlp(batch: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    for resource in batch.get('resourceSpans', []):
+        for scope in resource.get('scopeSpans', []):
+            for s in scope.get('spans', []):
+                attributes = {a['key']: _from_otlp_value(a['value']) for a in s.get('attributes', [])}
+                start, end = int(s['startTimeUnixNano']), int(s['endTimeUnixNano'])
+                yield {
+                    'trace_id': s['traceId'],
+                    'span_id': s['spanId'],
+                    'parent_id': s.get('parentSpanId') or None,
+                    'name': s['name'],
+                    'start_ns': start,
+                    'end_ns': end,
+                    'duration_ms': round((end - start) / 1e6, 3),
+                    'status': 'error' if s.get('status', {}).get('code') == 2 else 'ok',
+                    'error': s.get('status', {}).get('message') or None,
+                    'thread': attributes.pop('thread.name', None),
+                    'attributes': attributes,
+                }
+
+
+def _file_prefix() -> str:
+    return 'otlp' if EXPORTER == 'otlp' else 'spans'
+
+
+def _retained_files() -> List[str]:
+    """Export file names within TRACE_RETENTION_DAYS, newest first"""
+    if not TRACE_DIR or not os.path.isdir(TRACE_DIR):
+        return []
+    oldest = (datetime.now(timezone.utc) - timedelta(days=RETENTION_DAYS)).strftime('%Y-%m-%d')
+    kept = []
+    for name in os.listdir(TRACE_DIR):
+        match = TRACE_FILE.fullmatch(name)
+        if match and match.group(2) >= oldest:
+            kept.append((match.group(2), name))
+    return [name for _, name in sorted(kept, reverse=True)]
+
+
+def prune() -> int:
+    """Delete export files older than TRACE_RETENTION_DAYS; returns how many"""
+    if not TRACE_DIR or not os.path.isdir(TRACE_DIR):
+        return 0
+    keep = set(_retained_files())
+    removed = 0
+    for name in os.listdir(TRACE_DIR):
+        if TRACE_FILE.fullmatch(name) and name not in keep:
+            try:
+                os.remove(os.path.join(TRACE_DIR, name))
+                removed += 1
+            except FileNotFoundError:
+                pass  # pruned by another worker
+    return removed
+
+
+def flush() -> int:
+    """Write buffered spans to the exporter's file; returns how many"""
+    global _pruned_day
+    with _lock:
+        batch, _buffer[:] = list(_buffer), []
+    if not batch or EXPORTER == 'none':
+        return 0
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    day = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    if _pruned_day != day:
+        prune()  # once a day per process
+        _pruned_day = day
+    path = os.path.join(TRACE_DIR, f'{_file_prefix()}-{day}.jsonl')
+    if EXPORTER == 'otlp':
+        text = json.dumps(to_otlp(batch), separators=(',', ':')) + '\n'
+    else:
+        text = ''.join(json.dumps(r, separators=(',', ':'), default=str) + '\n' for r in batch)
+    # One append per batch: lines from concurrent workers do not interleave
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(text)
+    return len(batch)
+
+
+def _flush_loop() -> None:
+    while True:
+        _wake.wait(FLUSH_S)
+        _wake.clear()
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def _ensure_flusher() -> None:
+    global _flusher
+    if _flusher is None:
+        with _lock:
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flush_loop, name='trace-flush', daemon=True)
+                _flusher.start()
+
+
+def _after_fork() -> None:
+    global _flusher, _lock
+    _lock = threading.Lock()
+    _buffer.clear()  # the parent writes its own
+    _flusher = None
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+@atexit.register
+def _flush_at_exit() -> None:
+    try:
+        flush()
+    except OSError:
+        pass
+
+
+# Viewer
+
+def _stored_spans(trace: str) -> List[Dict[str, Any]]:
+    """Spans of a trace from the export files kept (TRACE_RETENTION_DAYS),
+    newest file first"""
+    found: List[Dict[str, Any]] = []
+    for name in _retained_files():
+        with open(os.path.join(TRACE_DIR, name), encoding='utf-8') as f:
+            for line in f:
+                if trace not in line:
+                    continue  # cheap pre-check before parsing
+                try:
+                    parsed = json.loads(line)
+                except ValueError:
+                    continue
+                records = _from_otlp(parsed) if 'resourceSpans' in parsed else [parsed]
+                found.extend(r for r in records if r['trace_id'] == trace)
+        if found:
+            break
+    return found
+
+
+def get_trace(trace: str) -> Optional[Dict[str, Any]]:
+    """A trace as a span tree with time per span name, or None if unknown.
+
+    ``self_ms`` is a span's duration minus its children's, so summing it by
+    name shows where the time went even when spans nest.
+    """
+    if not TRACE_ID.fullmatch(trace):
+        return None
+    with _lock:
+        records = list(_recent.get(trace) or [])
+    if not records:
+        records = _stored_spans(trace)
+    if not records:
+        return None
+    # A span can be both in memory and in a file
+    records = list({r['span_id']: r for r in records}.values())
+    records.sort(key=lambda r: r['start_ns'])
+    nodes = {r['span_id']: dict(r, children=[]) for r in records}
+    roots = []
+    for node in nodes.values():
+        parent = nodes.get(node['parent_id'])
+        (parent['children'] if parent else roots).append(node)
+    by_name: Dict[str, Dict[str, float]] = defaultdict(lambda: {'count': 0, 'total_ms': 0.0, 'self_ms': 0.0})
+    for node in nodes.values():
+        node['self_ms'] = round(max(0.0, node['duration_ms'] - sum(c['duration_ms'] for c in node['children'])), 3)
+        totals = by_name[node['name']]
+        totals['count'] += 1
+        totals['total_ms'] = round(totals['total_ms'] + node['duration_ms'], 3)
+        totals['self_ms'] = round(totals['self_ms'] + node['self_ms'], 3)
+    started = records[0]['start_ns']
+    for node in nodes.values():
+        node['offset_ms'] = round((node['start_ns'] - started) / 1e6, 3)
+    root = next((n for n in roots if n['parent_id'] is None), roots[0])
+    return {
+        'trace_id': trace,
+        'name': root['name'],
+        'user_id': root['attributes'].get('user_id'),
+        'duration_ms': round((max(r['end_ns'] for r in records) - started) / 1e6, 3),
+        'span_count': len(records),
+        'complete': root['parent_id'] is None,
+        'by_name': dict(sorted(by_name.items(), key=lambda item: -item[1]['self_ms'])),
+        'spans': roots,
+    }
+
+
+def recent() -> List[Dict[str, Any]]:
+    """Finished traces kept in memory, newest first"""
+    with _lock:
+        kept = [(t, list(spans)) for t, spans in _recent.items()]
+    summaries = []
+    for trace, spans in reversed(kept):
+        root = next((s for s in spans if s['parent_id'] is None), None)
+        if root is None:
+            continue  # still running
+        summaries.append({
+            'trace_id': trace,
+            'name': root['name'],
+            'started_at': datetime.fromtimestamp(root['start_ns'] / 1e9, timezone.utc).isoformat(),
+            'duration_ms': root['duration_ms'],
+            'status': root['status'],
+            'span_count': len(spans),
+            'user_id': root['attributes'].get('user_id'),
+        })
+    return summaries
@@ -0,0 +1,13 @@
+"""Benchmarks for the execution hot paths.
+
+Run from flask_app/::
+
+    python -m benchmarks run                  # writes results/<commit>.json
+    python -m benchmarks run -k substitute --quick
+    python -m benchmarks compare results/<base>.json results/<head>.json
+
+Each bench_*.py module registers benchmarks with ``harness.benchmark``.
+Benchmarks that need tables (list endpoints, scenario runs) run only when
+BENCH_DATABASE_URL names a database they may fill and empty; the others
+need no database.
+"""
@@ -0,0 +1,78 @@
+import sys
+import click
+from . import harness
+
+
+@click.group()
+def cli():
+    """Run the benchmark suite and compare result files."""
+
+
+@cli.command('list')
+def list_command():
+    """List every benchmark and parameter combination."""
+    for bench in sorted(harness.discover().values(), key=lambda b: b.name):
+        for key, _ in bench.cases():
+            click.echo(key)
+
+
+def _progress(key, result):
+    if result['status'] == 'ok':
+        detail = f"{harness.format_seconds(result['median'])} (±{harness.format_seconds(result['stdev'])}, " \
+                 f"{result['repeat']}x{result['number']})"
+    else:
+        detail = f"{result['status']}: {result.get('reason') or result.get('error')}"
+    click.echo(f'{key:<70} {detail}')
+
+
+@cli.command('run')
+@click.option('-k', 'pattern', help='Only run benchmarks whose name contains this text.')
+@click.option('-o', '--output', type=click.Path(dir_okay=False), help='Result file [default: results/<commit>.json].')
+@click.option('--min-time', default=harness.MIN_TIME, show_default=True, help='Seconds each timed loop runs for.')
+@click.option('--repeat', default=harness.REPEAT, show_default=True, help='Timed loops per benchmark.')
+@click.option('--quick', is_flag=True, help='Short loops (0.05s x 3) for a smoke run; not for comparisons.')
+def run_command(pattern, output, min_time, repeat, quick):
+    """Run benchmarks and store the timings as JSON."""
+    if quick:
+        min_time, repeat = 0.05, 3
+    report = harness.run(pattern, min_time, repeat, progress=_progress)
+    path = output or harness.default_output(report['environment'])
+    harness.save(report, path)
+    results = report['benchmarks'].values()
+    failed = sum(r['status'] == 'failed' for r in results)
+    skipped = sum(r['status'] == 'skipped' for r in results)
+    click.echo(f'{len(report["benchmarks"])} benchmarks ({failed} failed, {skipped} skipped) '
+               f'in {report["duration_s"]}s -> {path}')
+    sys.exit(1 if failed else 0)
+
+
+@cli.command('compare')
+@click.argument('base', type=click.Path(exists=True, dir_okay=False))
+@click.argument('head', type=click.Path(exists=True, dir_okay=False))
+@click.option('--threshold', default=harness.THRESHOLD, show_default=True,
+              help='Median ratio that counts as slower (its inverse as faster).')
+@click.option('--all', 'show_all', is_flag=True, help='Also list unchanged benchmarks.')
+def compare_command(base, head, threshold, show_all):
+    """Compare two result files; exits 1 when a benchmark got slower."""
+    try:
+        old, new = harness.load(base), harness.load(head)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for line in harness.environment_differences(old, new):
+        click.echo(f'warning: runs differ in {line}', err=True)
+    rows = harness.compare(old, new, threshold)
+    click.echo(f"{'benchmark':<70} {'base':>9} {'head':>9} {'ratio':>7}  verdict")
+    for row in rows:
+        if row['verdict'] == 'same' and not show_all:
+            continue
+        ratio = f"{row['ratio']:.2f}" if row['ratio'] is not None else '-'
+        click.echo(f"{row['benchmark']:<70} {harness.format_seconds(row['base']):>9} "
+                   f"{harness.format_seconds(row['head']):>9} {ratio:>7}  {row['verdict']}")
+    counts = {v: sum(r['verdict'] == v for r in rows) for v in ('slower', 'faster', 'same')}
+    click.echo(f"{counts['slower']} slower, {counts['faster']} faster, {counts['same']} unchanged "
+               f"(threshold {threshold:.2f}x)")
+    sys.exit(1 if counts['slower'] else 0)
+
+
+if __name__ == '__main__':
+    cli(prog_name='python -m benchmarks')
@@ -0,0 +1,25 @@
+from .fixtures import load_backend
+from .harness import benchmark
+
+
+def stored_request(url: str, method: str = 'GET', body: str = ''):
+    """An unsaved RequestModel with the defaults the database would fill in"""
+    from app.models import RequestModel
+
+    return RequestModel(name='benchmark', method=method, url=url, headers={'Accept': 'application/json'},
+                        body=body, payload_type='json', pre_script='', post_script='', options={})
+
+
+@benchmark(method=['GET', 'POST'], size=[0, 10_000, 1_000_000])
+def send_http_request(method, size):
+    """A full send (prepare, pooled transfer, capture, result) against a local stand-in server"""
+    from app.services.standin import StandInServer
+
+    http = load_backend('http')
+    with StandInServer() as server:
+        body = '{"name": "{{user}}", "items": [1, 2, 3]}' if method == 'POST' else ''
+        req = stored_request(f'{server.url}/items?size={size}', method, body)
+        result = http.send_http_request(req, None)
+        if not result.get('ok'):
+            raise RuntimeError(f"Stand-in request failed: {result.get('error')}")
+        yield lambda: http.send_http_request(req, None)
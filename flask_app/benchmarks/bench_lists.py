@@ -0,0 +1,76 @@
+from datetime import datetime
+from .fixtures import bulk_insert, bench_user, delete_owned, login, require_database
+from .harness import benchmark
+
+PAYLOAD = '{"id": %d, "name": "item %d", "tags": ["a", "b", "c"], "notes": "%s"}'
+REQUEST_COLUMNS = ('name', 'method', 'url', 'headers', 'body', 'payload_type', 'pre_script', 'post_script',
+                   'options', 'created_by_id', 'created_at', 'updated_at')
+SNIPPET_COLUMNS = ('name', 'description', 'category', 'language', 'code', 'tags', 'is_public', 'created_by_id',
+                   'created_at', 'updated_at')
+TEST_CASE_COLUMNS = ('name', 'description', 'test_type', 'test_data', 'expected_result', 'is_public',
+                     'created_by_id', 'created_at', 'updated_at')
+
+
+def _requests(user_id, n, now):
+    for i in range(n):
+        yield (
+            f'Request {i}', 'POST' if i % 3 else 'GET', f'{{{{base_url}}}}/items/{i}',
+            {'Accept': 'application/json', 'Content-Type': 'application/json'},
+            PAYLOAD % (i, i, 'x' * (i % 512)), 'json',
+            '', 'pm.environment.set("last", pm.response.json.id);',
+            {}, user_id, now, now,
+        )
+
+
+def _snippets(user_id, n, now):
+    for i in range(n):
+        yield (
+            f'Snippet {i}', 'Benchmark snippet', 'api', 'javascript',
+            'pm.environment.set("k", %d);\n' % i * (1 + i % 20), ['bench', f't{i % 10}'],
+            i % 2 == 0, user_id, now, now,
+        )
+
+
+def _test_cases(user_id, n, now):
+    for i in range(n):
+        yield (
+            f'Case {i}', 'Benchmark case', 'api', {'request_id': i}, 'status == 200',
+            i % 2 == 0, user_id, now, now,
+        )
+
+
+ENDPOINTS = {
+    'requests': ('RequestModel', REQUEST_COLUMNS, _requests),
+    'snippets': ('Snippet', SNIPPET_COLUMNS, _snippets),
+    'test-cases': ('TestCase', TEST_CASE_COLUMNS, _test_cases),
+}
+
+
+@benchmark(endpoint=list(ENDPOINTS), rows=[10_000, 100_000], page=['default', 1000])
+def list_endpoint(endpoint, rows, page):
+    """GET /api/<endpoint> with the response cache cleared, as on the first
+    load after a write: the first keyset page at the default size, or at
+    the largest one"""
+    require_database()
+    from flask import current_app
+    from app import models
+    from app.cache import response_cache
+
+    model_name, columns, generate = ENDPOINTS[endpoint]
+    model = getattr(models, model_name)
+    user = bench_user()
+    bulk_insert(model, columns, generate(user.id, rows, datetime.utcnow()))
+    try:
+        client = current_app.test_client()
+        login(client)
+        url = f'/api/{endpoint}' + ('' if page == 'default' else f'?limit={page}')
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f'GET {url} returned {response.status_code}')
+
+        def fetch():
+            response_cache.clear()
+            client.get(url)
+        yield fetch
+    finally:
+        delete_owned(model)
@@ -0,0 +1,21 @@
+from .fixtures import load_backend
+from .harness import benchmark
+
+
+class FakeCursor:
+    """Just enough of a cx_Oracle cursor for OracleClient.shape_result"""
+
+    def __init__(self, columns: int, rows: int):
+        self.description = [(f'COLUMN_{c}', None, None, None, None, None, True) for c in range(columns)]
+        self._rows = [tuple(f'value-{r}-{c}' if c % 2 else r * c for c in range(columns)) for r in range(rows)]
+        self.rowcount = rows
+
+    def fetchall(self):
+        return list(self._rows)
+
+
+@benchmark(rows=[100, 10_000, 100_000], columns=[5, 50])
+def shape_select(rows, columns):
+    oracle = load_backend('oracle')
+    cursor = FakeCursor(columns, rows)
+    return lambda: oracle.OracleClient.shape_result(cursor, 'SELECT * FROM benchmark')
@@ -0,0 +1,73 @@
+from .fixtures import bench_user, load_backend, require_database
+from .harness import benchmark
+
+ENVIRONMENT_NAME = 'benchmark'
+
+_server = None
+
+
+def _environment():
+    """The benchmark environment, pointed at a stand-in server shared by every case"""
+    global _server
+    from app import db
+    from app.models import Environment, EnvironmentVariable
+    from app.services.standin import StandInServer
+
+    if _server is None:
+        _server = StandInServer().start()
+    env = Environment.query.filter_by(name=ENVIRONMENT_NAME).first()
+    if env is None:
+        env = Environment(name=ENVIRONMENT_NAME, description='Benchmark runs')
+        db.session.add(env)
+    variables = {'base_url': _server.url, 'user': 'bench'}
+    existing = {v.key: v for v in env.variables}
+    for key, value in variables.items():
+        if key in existing:
+            existing[key].value = value
+        else:
+            env.variables.append(EnvironmentVariable(key=key, value=value))
+    db.session.commit()
+    return env
+
+
+@benchmark(steps=[1, 10, 50], layout=['serial', 'parallel'], engine=['threads', 'async'])
+def run_scenario(steps, layout, engine):
+    """A scenario of request steps against a local stand-in server. Serial
+    steps each get their own order; parallel ones share a single order."""
+    require_database()
+    from app import db
+    from app.models import RequestModel, Scenario, ScenarioStep
+    from app.services import env_snapshots, scenario_runner
+
+    load_backend('http')
+    if engine == 'async':
+        load_backend('async_http')
+    user = bench_user()
+    env = _environment()
+    reqs = [
+        RequestModel(name=f'Step {i}', method='POST', url=f'{{{{base_url}}}}/items/{i}',
+                     headers={'Content-Type': 'application/json'}, body='{"user": "{{user}}", "step": %d}' % i,
+                     payload_type='json', pre_script='', post_script='', options={}, created_by_id=user.id)
+        for i in range(steps)
+    ]
+    scenario = Scenario(name=f'benchmark-{steps}-{layout}-{engine}', created_by_id=user.id)
+    db.session.add_all([scenario, *reqs])
+    db.session.flush()
+    scenario.steps = [
+        ScenarioStep(order=i if layout == 'serial' else 0, step_type='request', ref_id=r.id)
+        for i, r in enumerate(reqs)
+    ]
+    db.session.commit()
+    try:
+        snapshot = env_snapshots.get_snapshot(env.id)
+        result = scenario_runner.run_scenario(scenario, snapshot, engine)
+        failed = [r for r in result['results'] if not r['result'].get('ok')]
+        if len(result['results']) != steps or failed:
+            raise RuntimeError(f'Scenario run failed: {failed[:1] or result}')
+        yield lambda: scenario_runner.run_scenario(scenario, snapshot, engine)
+    finally:
+        db.session.rollback()
+        db.session.delete(scenario)
+        for r in reqs:
+            db.session.delete(r)
+        db.session.commit()
@@ -0,0 +1,25 @@
+from .fixtures import load_backend
+from .harness import Skip, benchmark
+
+SCRIPTS = {
+    'empty': '',
+    'set': 'pm.environment.set("token", pm.environment.get("user") + "-1");',
+    'loop': 'for (var i = 0; i < 1000; i++) { pm.environment.set("k" + (i % 10), i); }',
+}
+
+
+@benchmark(script=list(SCRIPTS), variables=[10, 1_000])
+def run_js(script, variables):
+    """Per-call cost of a pre-request script: runtime start, prelude and env round trip"""
+    from app.services.http_client import run_js
+
+    execjs = load_backend('javascript')
+    try:
+        execjs.get()
+    except Exception as e:  # no JavaScript runtime on PATH
+        raise Skip(f'No JavaScript runtime: {e}')
+    context = {
+        'env': {'user': 'bench', **{f'var_{i}': f'value-{i}' for i in range(variables)}},
+        'request': {'url': 'http://localhost/items', 'method': 'GET', 'headers': {}, 'body': ''},
+    }
+    return lambda: run_js(SCRIPTS[script], context)
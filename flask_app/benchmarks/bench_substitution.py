@@ -0,0 +1,26 @@
+from .harness import benchmark
+
+VARIABLES = {f'var_{i}': f'value-{i}' for i in range(50)}
+# Placeholder spacing: one per KB of body, or one every 32 bytes
+DENSITY = {'sparse': 1024, 'dense': 32}
+
+
+def make_body(size: int, spacing: int) -> str:
+    """About ``size`` characters of JSON-like text with a placeholder every
+    ``spacing`` characters; one in ten names a variable that is not set"""
+    parts, length, i = [], 0, 0
+    while length < size:
+        name = f'var_{i % 50}' if i % 10 else f'missing_{i}'
+        chunk = '{"field_%d": "{{ %s }}", "pad": "%s"}, ' % (i, name, 'x' * max(0, spacing - 40))
+        parts.append(chunk)
+        length += len(chunk)
+        i += 1
+    return ''.join(parts)[:size]
+
+
+@benchmark(size=[1_000, 100_000, 1_000_000], density=list(DENSITY))
+def substitute_vars(size, density):
+    from app.services.http_client import substitute_vars
+
+    body = make_body(size, DENSITY[density])
+    return lambda: substitute_vars(body, VARIABLES)
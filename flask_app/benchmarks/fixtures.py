@@ -0,0 +1,115 @@
+import os
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator, Optional, Sequence
+from .harness import Skip
+
+# Benchmarks that need tables insert and delete rows, so they only run
+# against a database named explicitly for them.
+DATABASE_URL = os.getenv('BENCH_DATABASE_URL')
+BENCH_USERNAME = 'benchmark'
+BENCH_PASSWORD = 'benchmark'
+
+_app = None
+_migrated = False
+
+
+def _create_app():
+    global _app
+    if _app is None:
+        # Without BENCH_DATABASE_URL nothing may reach the configured database
+        os.environ['DATABASE_URL'] = DATABASE_URL or 'sqlite://'
+        os.environ['AUTO_INIT_DB'] = '0'
+        os.environ.setdefault('TRACE_EXPORTER', 'none')
+        from app import create_app
+
+        _app = create_app()
+        _app.secret_key = _app.secret_key or 'benchmark'  # test-client logins need a session
+    return _app
+
+
+@contextmanager
+def app_context() -> Iterator[Any]:
+    with _create_app().app_context():
+        yield _app
+
+
+def database_dialect() -> Optional[str]:
+    if not DATABASE_URL:
+        return None
+    from app import db
+
+    return f'{db.engine.dialect.name} {".".join(map(str, db.engine.dialect.server_version_info or ()))}'.strip()
+
+
+def require_database() -> None:
+    """Skip unless BENCH_DATABASE_URL is set; migrate it on first use"""
+    global _migrated
+    if not DATABASE_URL:
+        raise Skip('BENCH_DATABASE_URL is not set')
+    if not _migrated:
+        from app import db, migrations
+
+        migrations.upgrade(db.engine)
+        _migrated = True
+
+
+def bench_user():
+    """The user owning every row a benchmark creates"""
+    from app import db
+    from app.models import User
+
+    user = User.query.filter_by(username=BENCH_USERNAME).first()
+    if user is None:
+        user = User(username=BENCH_USERNAME, email=f'{BENCH_USERNAME}@example.com', role='user')
+        user.set_password(BENCH_PASSWORD)
+        db.session.add(user)
+        db.session.commit()
+    return user
+
+
+def login(client) -> None:
+    bench_user()
+    response = client.post('/api/auth/login', json={'username': BENCH_USERNAME, 'password': BENCH_PASSWORD})
+    if response.status_code != 200:
+        raise RuntimeError(f'Benchmark login failed: {response.get_json()}')
+
+
+def bulk_insert(model, columns: Sequence[str], rows: Iterable[Sequence[Any]]) -> int:
+    """Write rows with the data generator's BulkWriter (COPY on PostgreSQL)
+    and return how many. Ids are numbered from the table's first free one,
+    and the collection version behind the list ETags is bumped."""
+    from app import db
+    from app.datagen import BulkWriter
+
+    table = model.__table__
+    writer = BulkWriter(db.session.connection())
+    first = writer.next_id(table)
+    count = writer.write(table, ('id', *columns), ((first + i, *row) for i, row in enumerate(rows)))
+    writer.finish()
+    db.session.commit()
+    return count
+
+
+def delete_owned(*models) -> None:
+    """Delete the benchmark user's rows from each model's table (children first)"""
+    from app import db
+    from app.cache import BUMP_SQL, TABLE_COLLECTIONS
+
+    user = bench_user()
+    for model in models:
+        table = model.__table__
+        db.session.execute(table.delete().where(table.c.created_by_id == user.id))
+        collection = TABLE_COLLECTIONS.get(table.name)
+        if collection:
+            db.session.execute(BUMP_SQL, {'name': collection})
+    db.session.commit()
+
+
+def load_backend(name: str):
+    """backends.load, skipping the benchmark when the backend is not installed"""
+    from app.services import backends
+
+    try:
+        return backends.load(name)
+    except backends.BackendUnavailable as e:
+        raise Skip(str(e))
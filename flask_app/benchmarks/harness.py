@@ -0,0 +1,266 @@
+import gc
+import importlib
+import inspect
+import itertools
+import json
+import os
+import pkgutil
+import platform
+import statistics
+import subprocess
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+FORMAT_VERSION = 1
+
+# Timing defaults: each repeat runs the benchmark enough times to last at
+# least MIN_TIME seconds; the per-call time of every repeat is kept.
+MIN_TIME = 0.2
+REPEAT = 5
+# Compare: a median this many times slower (or faster) counts as a change
+THRESHOLD = 1.10
+
+
+class Skip(Exception):
+    """Raised by a benchmark's setup when it cannot run here (missing backend, no database)"""
+
+
+@dataclass
+class Benchmark:
+    name: str
+    setup: Callable[..., Any]
+    params: Dict[str, Sequence[Any]] = field(default_factory=dict)
+
+    def cases(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """(result key, kwargs) for every combination of the parameters"""
+        names = list(self.params)
+        for values in itertools.product(*(self.params[n] for n in names)):
+            kwargs = dict(zip(names, values))
+            label = ','.join(f'{n}={v}' for n, v in kwargs.items())
+            yield (f'{self.name}[{label}]' if label else self.name), kwargs
+
+
+REGISTRY: Dict[str, Benchmark] = {}
+
+
+def benchmark(name: Optional[str] = None, **params: Sequence[Any]):
+    """Register a benchmark.
+
+    The decorated function does the (untimed) setup for one parameter
+    combination and returns the callable to time. A generator function
+    yields it instead, and its code after the yield is the teardown::
+
+        @benchmark(size=[1_000, 100_000])
+        def substitute(size):
+            body = make_body(size)
+            return lambda: substitute_vars(body, variables)
+
+    Names default to ``<module without bench_>.<function>``.
+    """
+    def decorator(setup):
+        module = setup.__module__.rsplit('.', 1)[-1]
+        if module.startswith('bench_'):
+            module = module[len('bench_'):]
+        bench = Benchmark(name or f'{module}.{setup.__name__}', setup, params)
+        REGISTRY[bench.name] = bench
+        return setup
+    return decorator
+
+
+def discover() -> Dict[str, Benchmark]:
+    """Import every bench_*.py module in this package"""
+    for info in pkgutil.iter_modules([BENCH_DIR]):
+        if info.name.startswith('bench_'):
+            importlib.import_module(f'{__package__}.{info.name}')
+    return REGISTRY
+
+
+def _time(fn: Callable[[], Any], number: int) -> float:
+    started = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return time.perf_counter() - started
+
+
+def measure(fn: Callable[[], Any], min_time: float = MIN_TIME, repeat: int = REPEAT) -> Dict[str, Any]:
+    """Time ``fn`` like timeit: calibrate the loop count (the first calls
+    double as warm-up), then run ``repeat`` timed loops with GC disabled."""
+    number = 1
+    while True:
+        if _time(fn, number) >= min_time or number >= 1_000_000:
+            break
+        number *= 10 if number < 1000 else 2
+
+    samples = []
+    gc_enabled = gc.isenabled()
+    try:
+        for _ in range(repeat):
+            gc.collect()
+            gc.disable()
+            samples.append(_time(fn, number) / number)
+            if gc_enabled:
+                gc.enable()
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return {
+        'number': number,
+        'repeat': repeat,
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'mean': statistics.fmean(samples),
+        'stdev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'samples': samples,
+    }
+
+
+def run_case(bench: Benchmark, kwargs: Dict[str, Any], min_time: float, repeat: int) -> Dict[str, Any]:
+    """Set up, time and tear down one parameter combination; never raises"""
+    teardown = None
+    try:
+        if inspect.isgeneratorfunction(bench.setup):
+            teardown = bench.setup(**kwargs)
+            fn = next(teardown)
+        else:
+            fn = bench.setup(**kwargs)
+        return {'status': 'ok', **measure(fn, min_time, repeat)}
+    except Skip as e:
+        return {'status': 'skipped', 'reason': str(e)}
+    except Exception as e:
+        return {'status': 'failed', 'error': f'{type(e).__name__}: {e}'}
+    finally:
+        if teardown is not None:
+            try:
+                next(teardown, None)
+            except Exception:
+                pass
+
+
+def _git(*args: str) -> Optional[str]:
+    try:
+        out = subprocess.run(['git', *args], cwd=BENCH_DIR, capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() if out.returncode == 0 else None
+
+
+def environment() -> Dict[str, Any]:
+    """Commit and machine details stored with every result file"""
+    from . import fixtures
+
+    return {
+        'commit': _git('rev-parse', 'HEAD'),
+        'branch': _git('rev-parse', '--abbrev-ref', 'HEAD'),
+        'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'database': fixtures.database_dialect(),
+    }
+
+
+def default_output(env: Dict[str, Any]) -> str:
+    """results/<short commit>[-dirty].json"""
+    name = (env.get('commit') or 'unknown')[:12] + ('-dirty' if env.get('dirty') else '')
+    return os.path.join(RESULTS_DIR, f'{name}.json')
+
+
+def run(pattern: Optional[str] = None, min_time: float = MIN_TIME, repeat: int = REPEAT,
+        progress: Callable[[str, Dict[str, Any]], None] = lambda key, result: None) -> Dict[str, Any]:
+    """Run every registered benchmark whose key contains ``pattern``"""
+    from . import fixtures
+
+    started = time.time()
+    results: Dict[str, Dict[str, Any]] = {}
+    with fixtures.app_context():
+        for bench in sorted(discover().values(), key=lambda b: b.name):
+            for key, kwargs in bench.cases():
+                if pattern and pattern not in key:
+                    continue
+                results[key] = run_case(bench, kwargs, min_time, repeat)
+                progress(key, results[key])
+        env = environment()
+    return {
+        'version': FORMAT_VERSION,
+        'started_at': datetime.fromtimestamp(started, timezone.utc).isoformat(timespec='seconds'),
+        'duration_s': round(time.time() - started, 1),
+        'min_time': min_time,
+        'filter': pattern,
+        'environment': env,
+        'benchmarks': results,
+    }
+
+
+def save(report: Dict[str, Any], path: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        report = json.load(f)
+    if report.get('version') != FORMAT_VERSION:
+        raise ValueError(f'{path}: unsupported result format {report.get("version")!r}')
+    return report
+
+
+def compare(base: Dict[str, Any], head: Dict[str, Any], threshold: float = THRESHOLD) -> List[Dict[str, Any]]:
+    """Per benchmark: both medians, head/base ratio and a verdict
+    (slower, faster, same, new, removed or not comparable)"""
+    rows = []
+    base_results, head_results = base['benchmarks'], head['benchmarks']
+    # A filtered (-k) run says nothing about the benchmarks it left out
+    filters = [f for f in (base.get('filter'), head.get('filter')) if f]
+    for key in sorted(set(base_results) | set(head_results)):
+        if not all(f in key for f in filters):
+            continue
+        old, new = base_results.get(key), head_results.get(key)
+        row = {'benchmark': key, 'base': None, 'head': None, 'ratio': None}
+        if old and old['status'] == 'ok':
+            row['base'] = old['median']
+        if new and new['status'] == 'ok':
+            row['head'] = new['median']
+        if old is None:
+            row['verdict'] = 'new'
+        elif new is None:
+            row['verdict'] = 'removed'
+        elif row['base'] is None or row['head'] is None:
+            row['verdict'] = 'not comparable'
+        else:
+            row['ratio'] = row['head'] / row['base'] if row['base'] else None
+            if row['ratio'] is None:
+                row['verdict'] = 'not comparable'
+            elif row['ratio'] >= threshold:
+                row['verdict'] = 'slower'
+            elif row['ratio'] <= 1 / threshold:
+                row['verdict'] = 'faster'
+            else:
+                row['verdict'] = 'same'
+        rows.append(row)
+    return rows
+
+
+def environment_differences(base: Dict[str, Any], head: Dict[str, Any]) -> List[str]:
+    """Machine details that differ between two runs (their timings are not comparable)"""
+    keys = ('python', 'implementation', 'machine', 'cpu_count', 'platform', 'database')
+    return [
+        f"{key}: {base['environment'].get(key)} -> {head['environment'].get(key)}"
+        for key in keys if base['environment'].get(key) != head['environment'].get(key)
+    ]
+
+
+def format_seconds(value: Optional[float]) -> str:
+    if value is None:
+        return '-'
+    for unit, scale in (('s', 1), ('ms', 1e3), ('us', 1e6)):
+        if value * scale >= 1:
+            return f'{value * scale:.3g}{unit}'
+    return f'{value * 1e9:.3g}ns'
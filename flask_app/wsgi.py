@@ -0,0 +1,8 @@
+import os
+
+# Workers boot without DDL or seeding; run `flask --app run db init` once per deploy
+os.environ.setdefault("AUTO_INIT_DB", "0")
+
+from app import create_app
+
+app = create_app()